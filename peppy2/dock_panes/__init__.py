@@ -1 +1,2 @@
 from file_browser import FileBrowserPane
+from lazy_pane import LazyDockPane
@@ -1,15 +1,103 @@
 # Standard library imports.
 import os.path
 
+# Major package imports.
+import wx
+
 # Enthought library imports.
-from pyface.api import PythonEditor
-from pyface.tasks.api import TraitsDockPane
-from traits.api import Event, File, Instance, List, Str
-from traitsui.api import View, Item, FileEditor
+from traits.api import Event, File, List, Str, Unicode, on_trait_change
+
+# Local imports.
+from lazy_pane import LazyDockPane
+from peppy2.utils.dir_listing import DirectoryLister, ListingCache, filter_entries
+
+import logging
+log = logging.getLogger(__name__)
+
 
+# Listings shared by all file browsers
+listing_cache = ListingCache()
 
-class FileBrowserPane(TraitsDockPane):
-    """ A simple file browser pane.
+
+class FileListCtrl(wx.ListCtrl):
+    """ Virtual list of the entries of a directory, so showing a directory
+    with many files only creates rows for the visible entries.
+    """
+    def __init__(self, parent):
+        wx.ListCtrl.__init__(self, parent, -1, style=wx.LC_REPORT|wx.LC_VIRTUAL|wx.LC_SINGLE_SEL)
+        self.InsertColumn(0, "Name", width=200)
+        self.InsertColumn(1, "Size", wx.LIST_FORMAT_RIGHT, width=80)
+        self.InsertColumn(2, "Type", width=120)
+        self.entries = []
+
+    def set_entries(self, entries):
+        self.entries = entries
+        self.SetItemCount(len(entries))
+        self.Refresh()
+
+    def OnGetItemText(self, item, col):
+        entry = self.entries[item]
+        if col == 0:
+            return entry.name + os.sep if entry.is_dir else entry.name
+        elif col == 1:
+            return "" if entry.is_dir else str(entry.size)
+        return entry.mime or ""
+
+
+class FileBrowserControl(wx.Panel):
+    """ Directory path, up button and list of files
+    """
+    def __init__(self, parent, pane):
+        wx.Panel.__init__(self, parent, -1)
+        self.pane = pane
+        self.path = wx.TextCtrl(self, -1, style=wx.TE_PROCESS_ENTER)
+        self.up = wx.Button(self, -1, "..", style=wx.BU_EXACTFIT)
+        self.list = FileListCtrl(self)
+        self.status = wx.StaticText(self, -1, "")
+        top = wx.BoxSizer(wx.HORIZONTAL)
+        top.Add(self.path, 1, wx.EXPAND)
+        top.Add(self.up, 0, wx.EXPAND)
+        sizer = wx.BoxSizer(wx.VERTICAL)
+        sizer.Add(top, 0, wx.EXPAND)
+        sizer.Add(self.list, 1, wx.EXPAND)
+        sizer.Add(self.status, 0, wx.EXPAND)
+        self.SetSizer(sizer)
+        self.path.Bind(wx.EVT_TEXT_ENTER, self.on_path_entered)
+        self.up.Bind(wx.EVT_BUTTON, self.on_up)
+        self.list.Bind(wx.EVT_LIST_ITEM_SELECTED, self.on_selected)
+        self.list.Bind(wx.EVT_LIST_ITEM_ACTIVATED, self.on_activated)
+
+    def show_directory(self, directory, entries, status=""):
+        self.path.ChangeValue(directory)
+        self.list.set_entries(entries)
+        self.status.SetLabel(status)
+
+    def on_path_entered(self, evt):
+        self.pane.show_path(self.path.GetValue())
+
+    def on_up(self, evt):
+        self.pane.show_path(os.path.dirname(self.pane.directory))
+
+    def on_selected(self, evt):
+        entry = self.list.entries[evt.GetIndex()]
+        self.pane.selected_file = entry.path
+
+    def on_activated(self, evt):
+        entry = self.list.entries[evt.GetIndex()]
+        if entry.is_dir:
+            self.pane.show_path(entry.path)
+        else:
+            self.pane.selected_file = entry.path
+            self.pane.activated = True
+
+
+class FileBrowserPane(LazyDockPane):
+    """ A file browser pane.
+
+    Directories are listed on a background thread and the entries are shown
+    as they arrive.  Listings are cached and reused until the directory is
+    modified, and subdirectories and MIME types of the files are read ahead
+    while the browser is idle.
     """
 
     #### TaskPane interface ###################################################
@@ -28,13 +116,93 @@ class FileBrowserPane(TraitsDockPane):
     # The currently selected file.
     selected_file = File(os.path.expanduser('~'))
 
-    # The view used to construct the dock pane's widget.
-    view = View(Item('selected_file',
-                     editor=FileEditor(dclick_name='activated',
-                                       filter_name='filters'),
-                     style='custom',
-                     show_label=False),
-                resizable=True)
+    # The directory being shown.
+    directory = Unicode
+
+    ###########################################################################
+    # 'LazyDockPane' interface.
+    ###########################################################################
+
+    def create_lazy_contents(self, parent):
+        control = FileBrowserControl(parent, self)
+        self._entries = []
+        self._request_id = None
+        recognize = None
+        try:
+            recognize = self.task.window.application.get_recognizer().recognize
+        except AttributeError:
+            pass
+        self._lister = DirectoryLister(self._on_listing, self._on_mimes, recognize, listing_cache)
+        wx.CallAfter(self.show_path, self.selected_file)
+        return control
+
+    def destroy(self):
+        if self.contents is not None:
+            self._lister.stop()
+        super(FileBrowserPane, self).destroy()
+
+    ###########################################################################
+    # 'FileBrowserPane' interface.
+    ###########################################################################
+
+    def show_path(self, path):
+        """ Show the directory, or the directory containing the file
+
+        Nothing here touches the file system; the lister thread finds out
+        whether the path is a directory and checks the cached listings.
+        """
+        if self.contents is None:
+            return
+        path = os.path.abspath(os.path.expanduser(path))
+        entries = listing_cache.peek(path)
+        if entries is not None:
+            # Show the cached listing without waiting for the lister thread,
+            # which replaces it if the directory has changed
+            self.directory = path
+            self._entries = filter_entries(entries, self.filters)
+            self.contents.show_directory(path, self._entries)
+        else:
+            self._entries = []
+            self.contents.show_directory(path, [], "Reading...")
+        self._request_id = self._lister.list_directory(path, self.filters)
+
+    #### Lister callbacks, called from the lister thread
+
+    def _on_listing(self, request_id, path, entries, done, error):
+        wx.CallAfter(self._add_entries, request_id, path, entries, done, error)
+
+    def _on_mimes(self, path):
+        wx.CallAfter(self._refresh_mimes, path)
+
+    #### GUI thread handlers
+
+    def _add_entries(self, request_id, path, entries, done, error):
+        if request_id != self._request_id or self.contents is None:
+            return
+        self.directory = path
+        if error is not None:
+            self._request_id = None
+            self.contents.show_directory(path, [], error)
+            return
+        if done:
+            # The complete listing is sorted, unlike the batches
+            self._entries = entries
+            self._request_id = None
+        else:
+            self._entries.extend(entries)
+        status = "" if done else "Reading... %d" % len(self._entries)
+        self.contents.show_directory(path, self._entries, status)
+
+    def _refresh_mimes(self, path):
+        if self.contents is not None and path == self.directory:
+            self.contents.list.Refresh()
+
+    #### Trait change handlers
+
+    @on_trait_change('filters')
+    def _filters_changed(self):
+        if self.contents is not None and self.directory:
+            self.show_path(self.directory)
 
 
 class PythonScriptBrowserPane(FileBrowserPane):
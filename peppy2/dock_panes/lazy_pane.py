@@ -0,0 +1,76 @@
+# Major package imports.
+import wx
+
+# Enthought library imports.
+from pyface.tasks.api import DockPane
+from traits.api import Any, on_trait_change
+
+import logging
+log = logging.getLogger(__name__)
+
+
+class LazyDockPane(DockPane):
+    """ A dock pane that doesn't build its contents until it's first shown.
+
+    The pane's control is an empty panel until the pane becomes visible, at
+    which point create_lazy_contents is called to build the real contents
+    inside it.  Panes that are hidden in the layout never pay for building
+    their contents.  Until then the contents trait is None, so anything
+    updating the pane must check it first.
+    """
+
+    #### LazyDockPane interface ###############################################
+
+    # The control returned by create_lazy_contents, or None if the pane
+    # hasn't been shown yet
+    contents = Any
+
+    ###########################################################################
+    # 'ITaskPane' interface.
+    ###########################################################################
+
+    def create_contents(self, parent):
+        panel = wx.Panel(parent, -1)
+        panel.SetSizer(wx.BoxSizer(wx.VERTICAL))
+        return panel
+
+    def destroy(self):
+        self.contents = None
+        super(LazyDockPane, self).destroy()
+
+    ###########################################################################
+    # 'LazyDockPane' interface.
+    ###########################################################################
+
+    def create_lazy_contents(self, parent):
+        """ Create and return the toolkit-specific contents of the pane.
+        """
+        raise NotImplementedError
+
+    def build_contents(self):
+        """ Build the contents if they don't exist yet and return them.
+        """
+        if self.contents is None and self.control is not None:
+            log.debug("building contents of %s" % self.id)
+            contents = self.create_lazy_contents(self.control)
+            sizer = self.control.GetSizer()
+            sizer.Add(contents, 1, wx.EXPAND)
+            sizer.Layout()
+            self.contents = contents
+            self.contents_created()
+        return self.contents
+
+    def contents_created(self):
+        """ Called after the contents are built so they can show the data of
+        the active editor.
+        """
+        editor = self.task.active_editor
+        if editor is not None and hasattr(editor, 'update_panes'):
+            editor.update_panes()
+
+    #### trait change handlers
+
+    @on_trait_change('visible')
+    def _build_when_visible(self):
+        if self.visible:
+            self.build_contents()
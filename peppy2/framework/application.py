@@ -33,15 +33,19 @@ from traits.etsconfig.api import ETSConfig
 _app = EnthoughtWxApp(redirect=False)
 
 # Enthought library imports.
+from envisage.api import PluginManager
 from envisage.ui.tasks.api import TasksApplication
 from envisage.ui.tasks.task_window_event import TaskWindowEvent, VetoableTaskWindowEvent
 from pyface.api import ImageResource
 from pyface.tasks.api import Task, TaskWindowLayout
-from traits.api import provides, Bool, Instance, List, Property, Str, Unicode, Event, Dict
+from traits.api import provides, Bool, Instance, List, Property, Str, Unicode, Event, Dict, TraitError
+from apptools.preferences.api import Preferences
 
 # Local imports.
 from peppy2.framework.preferences import FrameworkPreferences, \
     FrameworkPreferencesPane
+from peppy2.framework.document import DocumentRegistry
+from peppy2.utils.startup_trace import start_trace, stop_trace, get_trace, traced, mark
 
 
 def _task_window_wx_on_mousewheel(self, event):
@@ -49,6 +53,20 @@ def _task_window_wx_on_mousewheel(self, event):
         log.debug("calling mousewheel in task %s" % self.active_task)
         self.active_task._wx_on_mousewheel_from_window(event)
 
+class FrameworkPluginManager(PluginManager):
+    """ Plugin manager that records the time taken to start each plugin when
+    startup is being traced.
+    """
+    def start_plugin(self, plugin=None, plugin_id=None):
+        trace = get_trace()
+        if trace is None:
+            return super(FrameworkPluginManager, self).start_plugin(plugin, plugin_id)
+        start = trace.get_elapsed()
+        try:
+            return super(FrameworkPluginManager, self).start_plugin(plugin, plugin_id)
+        finally:
+            trace.add_plugin(plugin.id if plugin is not None else plugin_id, trace.get_elapsed() - start)
+
 class FrameworkApplication(TasksApplication):
     """ The sample framework Tasks application.
     """
@@ -78,6 +96,10 @@ class FrameworkApplication(TasksApplication):
     
     successfully_loaded_event = Event
     
+    # Fired with a tuple of a file's uri and a dict of information to keep
+    # with it in the recent files list, e.g. its MIME type or view position
+    file_metadata_event = Event
+    
     plugin_event = Event
     
     preferences_changed_event = Event
@@ -86,9 +108,24 @@ class FrameworkApplication(TasksApplication):
     
     command_line_args = List
     
+    # Files opened at startup from the command line or the restored session
+    startup_uris = List
+    
     log_dir = Str
     
+    cache_dir = Str
+    
     log_file_ext = Str
+    
+    # Exit as soon as startup is complete, used when benchmarking startup
+    exit_after_startup = Bool(False)
+    
+    # Files that are open in any window, shared by all the views of each file
+    document_registry = Instance(DocumentRegistry, ())
+    
+    # Validated preference helpers shared by everything that asks for them,
+    # keyed on the helper class
+    _preference_helpers = Dict
 
     ###########################################################################
     # Private interface.
@@ -129,13 +166,28 @@ class FrameworkApplication(TasksApplication):
     
     def _application_initialized_fired(self):
         log.debug("STARTING!!!")
+        uris = []
         for arg in self.command_line_args:
             if arg.startswith("-"):
                 log.debug("skipping flag %s" % arg)
+                continue
             log.debug("processing %s" % arg)
-            self.load_file(arg, None)
+            uris.append(arg)
+        if uris:
+            self.startup_uris = uris
+            self.load_files(uris)
+        elif self.preferences_helper.restore_session:
+            with traced("restore_session"):
+                self.restore_session()
         app = wx.GetApp()
         app.tasks_application = self
+        self.finish_startup_trace()
+    
+    def _preferences_changed_event_fired(self):
+        # The shared helpers follow changes to the preferences by themselves,
+        # but new values haven't been validated, so validate them again the
+        # next time each helper is requested
+        self._preference_helpers = {}
     
     def _window_created_fired(self, event):
         """The toolkit window doesn't exist yet.
@@ -145,6 +197,7 @@ class FrameworkApplication(TasksApplication):
         """The toolkit window does exist here.
         """
         log.debug("WINDOW OPENED!!! %s" % event.window.control)
+        mark("window_opened")
         
         # Check to see that there's at least one task.  If a bad application
         # memento (~/.config/Peppy2/tasks/wx/application_memento), the window
@@ -163,77 +216,254 @@ class FrameworkApplication(TasksApplication):
             event.window._wx_on_mousewheel = types.MethodType(_task_window_wx_on_mousewheel, event.window)
             event.window.control.Bind(wx.EVT_MOUSEWHEEL, event.window._wx_on_mousewheel)
 
+    #### 'IApplication' interface
+    
+    def start(self):
+        with traced("start"):
+            return super(FrameworkApplication, self).start()
+    
+    def _create_windows(self):
+        with traced("create_windows"):
+            super(FrameworkApplication, self)._create_windows()
+    
+    def _prepare_exit(self):
+        # The windows still exist here, whether exiting from the menu or by
+        # closing the last window
+        self.save_session()
+        super(FrameworkApplication, self)._prepare_exit()
+
     #### API
 
+    def get_recognizer(self):
+        return self.get_service("peppy2.file_type.i_file_recognizer.IFileRecognizerDriver")
+    
+    def get_cached_mime(self, uri):
+        """The recent files list remembers the MIME type of files that haven't
+        changed since they were last opened, so they don't have to be
+        recognized again.
+        """
+        recent_files = self.plugin_data.get('open_recent')
+        if recent_files is not None:
+            return recent_files.get_verified_mime(uri)
+        return None
+    
+    def find_task_factory(self, guess, task_id=""):
+        """Return the factory of the best task to edit the file, or None
+        """
+        for factory in self.task_factories:
+            log.debug("factory: %s" % factory.name)
+            if task_id:
+                if factory.id == task_id:
+                    return factory
+            elif hasattr(factory.factory, "can_edit"):
+                if factory.factory.can_edit(guess.metadata.mime):
+                    log.debug("  can edit: %s" % guess.metadata.mime)
+                    return factory
+        return None
+    
     def load_file(self, uri, active_task=None, task_id="", **kwargs):
-        service = self.get_service("peppy2.file_type.i_file_recognizer.IFileRecognizerDriver")
+        service = self.get_recognizer()
         log.debug("SERVICE!!! %s" % service)
         
-        from peppy2.utils.file_guess import FileGuess
-        # The FileGuess loads the first part of the file and tries to identify it.
-        try:
-            guess = FileGuess(uri)
-        except IOError, e:
-            active_task.window.error(str(e), "File Load Error")
-            return
-        
-        # Attempt to classify the guess using the file recognizer service
-        service.recognize(guess)
+        from peppy2.utils.batch_guess import guess_file
+        document = self.document_registry.find(uri)
+        if document is not None and document.guess is not None:
+            # The file is already open, so it doesn't need to be read or
+            # recognized again
+            guess = document.guess
+        else:
+            # The FileGuess loads the first part of the file and tries to identify it.
+            uri, guess, error = guess_file(uri, service.recognize, self.get_cached_mime)
+            if error is not None:
+                self.show_load_errors([error], active_task)
+                return
         
         # Short circuit: if the file can be edited by the active task, use that!
         if active_task is not None and active_task.can_edit(guess.metadata.mime):
             active_task.new(guess, **kwargs)
             return
         
-        possibilities = []
-        for factory in self.task_factories:
-            log.debug("factory: %s" % factory.name)
-            if task_id:
-                if factory.id == task_id:
-                    possibilities.append(factory)
-            elif hasattr(factory.factory, "can_edit"):
-                if factory.factory.can_edit(guess.metadata.mime):
-                    log.debug("  can edit: %s" % guess.metadata.mime)
-                    possibilities.append(factory)
-        log.debug(possibilities)
-        if not possibilities:
+        best = self.find_task_factory(guess, task_id)
+        if best is None:
             log.debug("no editor for %s" % uri)
             return
         
-        best = possibilities[0]
-        
         if active_task is not None:
             # Ask the active task if it's OK to load a different editor
             if not active_task.allow_different_task(guess, best.factory):
                 return
 
+        task = self.get_task_for_loading(best.id)
+        task.new(guess, **kwargs)
+    
+    def get_task_for_loading(self, task_id):
+        """Return the active task of that type in a window, or a new window
+        with only that task.  The other possible tasks aren't created until
+        the user switches to them.
+        """
         # Look for existing task in current windows
-        task = self.find_active_task_of_type(best.id)
+        task = self.find_active_task_of_type(task_id)
         if task:
-            task.new(guess, **kwargs)
-            return
-        
-        # Not found in existing windows, so open new window with task
-        tasks = [ factory.id for factory in possibilities ]
-        log.debug("no task window found: creating new layout for %s" % str(tasks))
-#        window = self.create_window(TaskWindowLayout(size = (800, 600)))
+            return task
+        log.debug("no task window found: creating new window for %s" % task_id)
         window = self.create_window()
         log.debug("  window=%s" % str(window))
-        first = None
-        for factory in possibilities:
-            task = self.create_task(factory.id)
-            window.add_task(task)
-            first = first or task
-        window.activate_task(first)
+        task = self.create_task_in_window(task_id, window)
         window.open()
         log.debug("All windows: %s" % self.windows)
-        task.new(guess, **kwargs)
-        metadata = guess.get_metadata()
-        log.debug(guess.metadata)
-        log.debug(guess.metadata.mime)
-        log.debug(metadata)
-        log.debug(metadata.mime)
-        log.debug(dir(metadata))
+        return task
+    
+    def load_files(self, uris, active_task=None, task_id=""):
+        """Load many files at once
+        
+        The files are read and recognized together on a job thread.  Then
+        they're grouped by the task that will edit them, so each new window
+        is created once, and the editors are added one at a time from idle
+        callbacks so the UI stays responsive while they load.
+        """
+        from peppy2.utils.batch_guess import GuessFilesJob
+        from peppy2.utils.jobs import get_global_job_manager
+        unique = []
+        known = {}
+        for uri in uris:
+            if uri in unique:
+                continue
+            unique.append(uri)
+            document = self.document_registry.find(uri)
+            if document is not None and document.guess is not None:
+                known[uri] = document.guess
+        callback = lambda job: self.load_guesses(job.results, active_task, task_id)
+        job = GuessFilesJob(unique, self.get_recognizer().recognize, callback, self.get_cached_mime, known)
+        manager = get_global_job_manager()
+        if manager is None or not manager.add_job(job):
+            job._start(None)
+            job.success_callback()
+    
+    def load_guesses(self, results, active_task=None, task_id=""):
+        """Open editors for the results of L{GuessFilesJob}
+        """
+        errors = []
+        groups = []
+        tasks = {}
+        for uri, guess, error in results:
+            if error is not None:
+                errors.append(error)
+                continue
+            if not task_id and active_task is not None and active_task.can_edit(guess.metadata.mime):
+                key = active_task
+            else:
+                factory = self.find_task_factory(guess, task_id)
+                if factory is None:
+                    log.debug("no editor for %s" % uri)
+                    continue
+                if active_task is not None and not active_task.allow_different_task(guess, factory.factory):
+                    continue
+                key = factory.id
+            if key not in tasks:
+                tasks[key] = []
+                groups.append(key)
+            tasks[key].append(guess)
+        if errors:
+            self.show_load_errors(errors, active_task)
+        queue = []
+        for key in groups:
+            task = key if isinstance(key, Task) else self.get_task_for_loading(key)
+            queue.extend([(task, guess) for guess in tasks[key]])
+        if queue:
+            self.load_queued(queue)
+    
+    def load_queued(self, queue):
+        task, guess = queue.pop(0)
+        if task.window is not None:
+            # The window may have been closed while the files were loading
+            task.new(guess)
+        if queue:
+            wx.CallAfter(self.load_queued, queue)
+    
+    def show_load_errors(self, errors, active_task=None):
+        window = active_task.window if active_task is not None else self.active_window
+        if window is None:
+            log.error("File Load Error: %s" % "; ".join(errors))
+        else:
+            window.error("\n".join(errors), "File Load Error")
+    
+    def load_remote_files(self, files, cwd):
+        """Load files sent by a later launch of the application
+        
+        Relative paths are relative to the working directory of that launch.
+        With no files, the active window is simply brought to the front.
+        """
+        window = self.active_window
+        if window is None and self.windows:
+            window = self.windows[0]
+        uris = []
+        for uri in files:
+            if "://" not in uri and not os.path.isabs(uri):
+                uri = os.path.join(cwd, uri)
+            log.debug("loading %s from another launch" % uri)
+            uris.append(uri)
+        if uris:
+            self.load_files(uris, window.active_task if window is not None else None)
+        elif window is None:
+            window = self.create_window()
+            window.open()
+        if window is not None and window.control is not None:
+            window.control.Raise()
+    
+    def get_session_file(self):
+        return os.path.join(ETSConfig.application_home, "session.json")
+    
+    def save_session(self):
+        """Save the windows, tasks and open files so they can be restored in
+        the next run
+        """
+        from peppy2.utils.session import save_session
+        windows = []
+        for window in self.windows:
+            tasks = [task.get_session() for task in window.tasks if hasattr(task, "get_session")]
+            active = window.active_task.id if window.active_task is not None else None
+            windows.append({'active_task': active, 'tasks': tasks})
+        save_session(self.get_session_file(), windows)
+    
+    def restore_session(self):
+        """Reopen the windows and files saved by the last run
+        
+        Each task loads only its active file right away; see
+        L{FrameworkTask.restore_session}.
+        """
+        from peppy2.utils.session import load_session
+        for i, window_session in enumerate(load_session(self.get_session_file())):
+            for task_session in window_session.get('tasks', []):
+                # Only the active file of each task is loaded right away
+                editors = task_session.get('editors', [])
+                active = task_session.get('active')
+                if isinstance(active, int) and 0 <= active < len(editors) and editors[active].get('path'):
+                    self.startup_uris.append(editors[active]['path'])
+            if i < len(self.windows):
+                window = self.windows[i]
+            else:
+                window = self.create_window()
+                window.open()
+            active = None
+            for task_session in window_session.get('tasks', []):
+                task_id = task_session.get('id')
+                if self._get_task_factory(task_id) is None:
+                    log.debug("skipping session for unknown task %s" % task_id)
+                    continue
+                task = self.find_task_in_window(task_id, window)
+                if task is None:
+                    task = self.create_task_in_window(task_id, window)
+                task.restore_session(task_session)
+                if task_id == window_session.get('active_task'):
+                    active = task
+            if active is not None:
+                window.activate_task(active)
+    
+    def find_task_in_window(self, task_id, window):
+        for task in window.tasks:
+            if task.id == task_id:
+                return task
+        return None
     
     def create_task_in_window(self, task_id, window):
         log.debug("creating %s task" % task_id)
@@ -317,20 +547,26 @@ class FrameworkApplication(TasksApplication):
         config directory location instead of ~/.enthought 
         """
 
-        from peppy2.third_party.appdirs import user_config_dir, user_log_dir
-        dirname = user_config_dir(self.name)
-        ETSConfig.application_home = dirname
+        with traced("application_home"):
+            from peppy2.third_party.appdirs import user_config_dir, user_log_dir, user_cache_dir
+            dirname = user_config_dir(self.name)
+            ETSConfig.application_home = dirname
 
-        # Make sure it exists!
-        if not os.path.exists(ETSConfig.application_home):
-            os.makedirs(ETSConfig.application_home)
+            # Make sure it exists!
+            if not os.path.exists(ETSConfig.application_home):
+                os.makedirs(ETSConfig.application_home)
 
-        dirname = user_log_dir(self.name)
-        if not os.path.exists(dirname):
-            os.makedirs(dirname)
-        self.log_dir = dirname
+            dirname = user_log_dir(self.name)
+            if not os.path.exists(dirname):
+                os.makedirs(dirname)
+            self.log_dir = dirname
+        
+            dirname = user_cache_dir(self.name)
+            if not os.path.exists(dirname):
+                os.makedirs(dirname)
+            self.cache_dir = dirname
         
-        self.log_file_ext = "-%s" % datetime.now().strftime("%Y%m%d-%H%M%S")
+            self.log_file_ext = "-%s" % datetime.now().strftime("%Y%m%d-%H%M%S")
         
         return
     
@@ -343,13 +579,24 @@ class FrameworkApplication(TasksApplication):
         """Get preferences for a particular PreferenceHelper object.
         
         Handle mistakes in preference files by using the default value for any
-        bad preference values.
+        bad preference values.  Each helper class is validated once and the
+        same helper instance is returned to all callers until the preferences
+        are changed, so this is cheap enough to call whenever a preference is
+        needed.
         """
+        helper = self._preference_helpers.get(helper_object)
+        if helper is None:
+            with traced("preferences:%s" % helper_object.__name__):
+                helper = self._get_preferences(helper_object, debug)
+            self._preference_helpers[helper_object] = helper
+        return helper
+    
+    def _get_preferences(self, helper_object, debug):
         try:
             helper = helper_object(preferences=self.preferences)
         except TraitError:
-            # Create an empty preference object and helper so we can try
-            # preferences one-by-one to see which are bad
+            # Create a helper with an empty preference object so we can
+            # validate the preferences one-by-one to see which are bad
             empty = Preferences()
             helper = helper_object(preferences=empty)
             if debug:
@@ -364,9 +611,9 @@ class FrameworkApplication(TasksApplication):
                         # isn't an error.
                         continue
                     try:
-                        empty.set(pref_name, self.preferences.get(pref_name))
-                    except:
-                        log.error("Invalid preference for %s: %s. Using default value %s" % (pref_name, self.preferences.get(pref_name), getattr(helper, t)))
+                        helper._get_value(t, text_value)
+                    except TraitError:
+                        log.error("Invalid preference for %s: %s. Using default value %s" % (pref_name, text_value, getattr(helper, t)))
                         self.preferences.remove(pref_name)
                         # Also remove from default scope
                         self.preferences.remove("default/%s" % pref_name)
@@ -376,6 +623,37 @@ class FrameworkApplication(TasksApplication):
             helper = helper_object(preferences=self.preferences)
         return helper
     
+    def finish_startup_trace(self):
+        """ Save the startup trace report to the log directory if startup is
+        being traced, and exit if only benchmarking startup.
+        """
+        trace = get_trace()
+        if trace is not None:
+            trace.mark("initialized")
+            stop_trace()
+            filename = self.get_log_file_name("startup_trace", "json")
+            self.save_log(trace.to_json(), "startup_trace", "json")
+            log.info("startup trace: %s" % filename)
+        if self.exit_after_startup:
+            wx.CallAfter(self.exit, True)
+    
+    def job_manager_event(self, message=None):
+        """Callback for the global job manager
+
+        Called from the job threads, so the finished jobs are processed later
+        in the GUI thread where their callbacks can safely update the UI.
+        """
+        wx.CallAfter(self.process_job_manager_event, message)
+    
+    def process_job_manager_event(self, message):
+        from peppy2.utils.jobs import get_global_job_manager, ProgressReport
+        manager = get_global_job_manager()
+        if manager is None:
+            return
+        if isinstance(message, ProgressReport):
+            manager.handle_job_id_callback(message)
+        manager.get_finished()
+    
     def get_log_file_name(self, log_file_name_base, ext=""):
         filename = log_file_name_base + self.log_file_ext
         if ext:
@@ -406,74 +684,74 @@ def run(plugins=[], use_eggs=True, egg_path=[], image_path=[], startup_task="",
     :param startup_task string: task factory identifier for task shown in initial window
     :param application_name string: change application name instead of default Peppy2
     """
-    # Enthought library imports.
-    from envisage.api import PluginManager
-    from envisage.core_plugin import CorePlugin
-    
-    # Local imports.
-    from peppy2.framework.plugin import PeppyTasksPlugin, PeppyMainPlugin
-    from peppy2.file_type.plugin import FileTypePlugin
-    from peppy2 import get_image_path
-    from peppy2.utils.jobs import get_global_job_manager
-    
-    # Include standard plugins
-    core_plugins = [ CorePlugin(), PeppyTasksPlugin(), PeppyMainPlugin(), FileTypePlugin() ]
-    if sys.platform == "darwin":
-        from peppy2.framework.osx_plugin import OSXMenuBarPlugin
-        core_plugins.append(OSXMenuBarPlugin())
-    
-    import peppy2.file_type.recognizers
-    core_plugins.extend(peppy2.file_type.recognizers.plugins)
-    
-    import peppy2.plugins
-    core_plugins.extend(peppy2.plugins.plugins)
-    
-    # Add the user's plugins
-    core_plugins.extend(plugins)
-    
     # Check basic command line args
     default_parser = argparse.ArgumentParser(description="Default Parser")
     default_parser.add_argument("--no-eggs", dest="use_eggs", action="store_false", default=True, help="Do not load plugins from python eggs")
+    default_parser.add_argument("--new-instance", dest="single_instance", action="store_false", default=True, help="Start a new instance even if the application is already running")
+    default_parser.add_argument("--rescan-plugins", action="store_true", default=False, help="Ignore the cached plugin manifest and search the eggs again")
+    default_parser.add_argument("--trace-startup", action="store_true", default=False, help="Record the time taken by each part of startup and save a report in the log directory")
+    default_parser.add_argument("--exit-after-startup", action="store_true", default=False, help="Exit as soon as startup is complete, for benchmarking")
     options, extra_args = default_parser.parse_known_args()
     print("after default_parser: extra_args: %s" % extra_args)
+    
+    # Tracing may already have been started before this module was imported
+    # to include the time taken to import wx
+    if options.trace_startup:
+        start_trace()
+    
+    with traced("imports"):
+        # Enthought library imports.
+        from envisage.core_plugin import CorePlugin
+        
+        # Local imports.
+        from peppy2.framework.plugin import PeppyTasksPlugin, PeppyMainPlugin
+        from peppy2.file_type.plugin import FileTypePlugin
+        from peppy2 import get_image_path
+        from peppy2.utils.jobs import create_global_job_manager, get_global_job_manager
+    
+    with traced("plugins"):
+        # Include standard plugins
+        core_plugins = [ CorePlugin(), PeppyTasksPlugin(), PeppyMainPlugin(), FileTypePlugin() ]
+        if sys.platform == "darwin":
+            from peppy2.framework.osx_plugin import OSXMenuBarPlugin
+            core_plugins.append(OSXMenuBarPlugin())
+        
+        import peppy2.file_type.recognizers
+        core_plugins.extend(peppy2.file_type.recognizers.plugins)
+        
+        import peppy2.plugins
+        core_plugins.extend(peppy2.plugins.plugins)
+        
+        # Add the user's plugins
+        core_plugins.extend(plugins)
 
     # The default is to use the specified plugins as well as any found
     # through setuptools and any local eggs (if an egg_path is specified).
     # Egg/setuptool plugin searching is turned off by the use_eggs parameter.
-    default = PluginManager(
-        plugins = core_plugins,
-    )
+    # The search results are cached in a manifest in the application home so
+    # later startups don't need to scan the eggs or import the plugins until
+    # they are used.
     if use_eggs and options.use_eggs:
-        from pkg_resources import Environment, working_set
-        from envisage.api import EggPluginManager
-        from envisage.composite_plugin_manager import CompositePluginManager
-        
-        # Find all additional eggs and add them to the working set
-        environment = Environment(egg_path)
-        distributions, errors = working_set.find_plugins(environment)
-        if len(errors) > 0:
-            raise SystemError('cannot add eggs %s' % errors)
-        logger = logging.getLogger()
-        logger.debug('added eggs %s' % distributions)
-        map(working_set.add, distributions)
-
-        # The plugin manager specifies which eggs to include and ignores all others
-        egg = EggPluginManager(
+        with traced("egg_plugins"):
+            from peppy2.framework.plugin_manifest import get_plugins
+            from peppy2.third_party.appdirs import user_config_dir
+            
+            name = application_name or FrameworkApplication.name
+            manifest = os.path.join(user_config_dir(name), "plugin_manifest.json")
+            
+            # Only plugins matching the include list are used; all others are
+            # ignored
             include = [
                 'peppy2.tasks',
             ]
-        )
-        
-        plugin_manager = CompositePluginManager(
-            plugin_managers=[default, egg]
-        )
-    else:
-        plugin_manager = default
+            core_plugins.extend(get_plugins(manifest, egg_path, include, options.rescan_plugins))
+    plugin_manager = FrameworkPluginManager(
+        plugins = core_plugins,
+    )
 
     # Add peppy2 icons after all image paths to allow user icon themes to take
     # precidence
     from pyface.resource_manager import resource_manager
-    import os
     image_paths = image_path[:]
     image_paths.append(get_image_path("icons"))
     resource_manager.extra_paths.extend(image_paths)
@@ -483,7 +761,12 @@ def run(plugins=[], use_eggs=True, egg_path=[], image_path=[], startup_task="",
         kwargs['startup_task'] = startup_task
     if application_name:
         kwargs['name'] = application_name
-    app = FrameworkApplication(plugin_manager=plugin_manager, command_line_args=extra_args, **kwargs)
+    with traced("application"):
+        app = FrameworkApplication(plugin_manager=plugin_manager, command_line_args=extra_args, exit_after_startup=options.exit_after_startup, **kwargs)
+    
+    # Background jobs report back to the application, which processes the
+    # results in the GUI thread
+    create_global_job_manager(app.job_manager_event)
     
     # Create a debugging log
     if debug_log:
@@ -493,8 +776,20 @@ def run(plugins=[], use_eggs=True, egg_path=[], image_path=[], startup_task="",
         logger.addHandler(handler)
         logger.setLevel(logging.DEBUG)
     
+    # Later launches hand their files to this instance instead of starting
+    # their own.  The server thread passes the files to the GUI thread.
+    server = None
+    if options.single_instance:
+        from peppy2.utils.single_instance import InstanceServer, get_socket_path
+        server = InstanceServer(get_socket_path(app.name), lambda files, cwd: wx.CallAfter(app.load_remote_files, files, cwd))
+        if not server.start():
+            server = None
+    
     app.run()
     
+    if server is not None:
+        server.shutdown()
+    
     job_manager = get_global_job_manager()
     if job_manager is not None:
         job_manager.shutdown()
@@ -0,0 +1,99 @@
+import os
+
+import logging
+log = logging.getLogger(__name__)
+
+
+class Document(object):
+    """A file that is shared among all the views that are displaying it
+
+    Editors attach to the document when they load the file and store the
+    data objects (e.g. the byte store) in it, so a second view of the same
+    file uses the existing data instead of loading another copy.  Views of
+    the file in any task share the same document.
+    """
+    def __init__(self, path, guess=None):
+        self.path = path
+        self.guess = guess
+        self.views = []
+        
+        # Data of the hex editors
+        self.byte_store = None
+        self.hash_index = None
+        
+        # Scintilla document pointer shared by the text editors
+        self.text_document = None
+        
+        # wx.Image or image source shared by the image editors
+        self.image = None
+
+    def __str__(self):
+        return "%s: %d views" % (self.path, len(self.views))
+
+
+class DocumentRegistry(object):
+    """Application-wide map of canonical file paths to open documents
+    """
+    def __init__(self):
+        self.documents = {}
+
+    @classmethod
+    def get_canonical_path(cls, path):
+        return os.path.normcase(os.path.realpath(os.path.abspath(path)))
+
+    def find(self, path):
+        """Return the open document for the file, or None if no view is
+        displaying it.
+        """
+        return self.documents.get(self.get_canonical_path(path))
+
+    def attach(self, path, view, guess=None):
+        """Add the view to the document for the file, creating the document
+        if this is the first view of the file.
+        """
+        key = self.get_canonical_path(path)
+        document = self.documents.get(key)
+        if document is None:
+            document = Document(path, guess)
+            self.documents[key] = document
+        elif document.guess is None:
+            document.guess = guess
+        if view not in document.views:
+            document.views.append(view)
+        log.debug("attached %s to %s" % (view, document))
+        return document
+
+    def rename(self, old_path, new_path):
+        """Track the document of the old file under the new path after it has
+        been saved with a new name.
+
+        @returns: the document, or None if the old file isn't open.
+        """
+        old_key = self.get_canonical_path(old_path)
+        document = self.documents.pop(old_key, None)
+        if document is None:
+            return None
+        new_key = self.get_canonical_path(new_path)
+        other = self.documents.get(new_key)
+        if other is not None and other is not document:
+            log.warning("%s replaces the open document %s" % (document, other))
+        self.documents[new_key] = document
+        document.path = new_path
+        log.debug("renamed %s to %s" % (old_path, new_path))
+        return document
+
+    def detach(self, document, view):
+        """Remove the view from the document
+
+        @returns: True if that was the last view, in which case the document
+        is no longer tracked by the registry and its data should be released.
+        """
+        if view in document.views:
+            document.views.remove(view)
+        log.debug("detached %s from %s" % (view, document))
+        if document.views:
+            return False
+        key = self.get_canonical_path(document.path)
+        if self.documents.get(key) is document:
+            del self.documents[key]
+        return True
@@ -1,7 +1,7 @@
 from os.path import basename
 
 # Enthought library imports.
-from traits.api import Bool, Unicode, Property
+from traits.api import Any, Bool, Unicode, Property
 from pyface.tasks.api import Editor
 
 class FrameworkEditor(Editor):
@@ -27,6 +27,17 @@ class FrameworkEditor(Editor):
     can_redo = Bool(False)
     
     redo_label = Unicode("Redo")
+    
+    # True if the data has been released to save memory.  The editor will
+    # reload the data from the file when it is restored.
+    hibernated = Bool(False)
+    
+    # View position saved during hibernation
+    view_position = Any
+    
+    # Shared document from the application's document registry, if the
+    # editor's data is shared with the other views of the file
+    document = Any
 
     #### property getters
 
@@ -70,6 +81,92 @@ class FrameworkEditor(Editor):
         """
         raise NotImplementedError
 
+    def get_memory_size(self):
+        """ Returns the approximate number of bytes used to hold the data.
+        """
+        return 0
+
+    def get_memory_owner(self):
+        """ Returns the object holding the data, which is the same for all
+        the views sharing the data of a file.
+        """
+        return self.document if self.document is not None else self
+
+    def get_data_views(self):
+        """ Returns the editors sharing the data of this editor, including
+        itself.  The data is only freed when all of them have released it.
+        """
+        return list(self.document.views) if self.document is not None else [self]
+
+    def get_view_position(self):
+        """ Returns a dict describing the scroll and cursor position
+        """
+        return {}
+
+    def set_view_position(self, data):
+        """ Restores a position previously returned by get_view_position
+        """
+        pass
+
+    def release_data(self):
+        """ Frees the data of the editor, keeping the control.
+        """
+        raise NotImplementedError
+
+    def reload_data(self):
+        """ Reloads the data freed by release_data from the file.
+        """
+        raise NotImplementedError
+
+    def can_hibernate(self):
+        """ Can the data be released and later recreated from the file?
+        
+        Modified editors and editors without a file can't be hibernated.
+        """
+        return bool(self.path) and not self.dirty and not self.hibernated and self.get_memory_size() > 0
+
+    def hibernate(self):
+        """ Release the data of the editor while keeping its view position
+        """
+        self.view_position = self.get_view_position()
+        self.release_data()
+        self.hibernated = True
+        
+        # Only unmodified data is released, and the empty control must never
+        # be mistaken for changes that need saving
+        self.dirty = False
+
+    def open_hibernated(self, path, view_position=None):
+        """ Set up the editor to load the file when it's first restored, e.g.
+        for the inactive tabs of a restored session.
+        
+        Returns False if the editor can't reload its data, in which case it
+        must be loaded normally.
+        """
+        if self.__class__.reload_data.im_func is FrameworkEditor.reload_data.im_func:
+            return False
+        self.path = path
+        self.view_position = view_position
+        self.hibernated = True
+        return True
+
+    def get_current_view_position(self):
+        """ Returns the view position, including that of a hibernated editor
+        """
+        if self.hibernated:
+            return self.view_position
+        return self.get_view_position()
+
+    def restore(self):
+        """ Reload the data of a hibernated editor
+        """
+        if self.hibernated:
+            self.hibernated = False
+            self.reload_data()
+            if self.view_position:
+                self.set_view_position(self.view_position)
+            self.view_position = None
+
     #### convenience functions
     
     @property
@@ -79,3 +176,12 @@ class FrameworkEditor(Editor):
     @property
     def window(self):
         return self.editor_area.task.window
+    
+    def get_pane_contents(self, pane_id):
+        """ Returns the contents of a dock pane of the editor's task, or None if
+        the pane is a LazyDockPane that hasn't been shown yet.
+        """
+        pane = self.window.get_dock_pane(pane_id, self.task)
+        if pane is None:
+            return None
+        return getattr(pane, 'contents', pane.control)
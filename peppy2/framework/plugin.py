@@ -25,11 +25,12 @@ class FrameworkPlugin(Plugin):
 
     def task_factories_from_tasks(self, tasks):
         # Create task factories for each task such that each factory will have
-        # the same id as the task
+        # the same id as the task.  The id and name are read from the class
+        # trait defaults so tasks aren't instantiated until they're used.
         factories = []
         for cls in tasks:
-            task = cls()
-            factory = TaskFactory(id=task.id, name=task.name, factory=cls)
+            traits = cls.__class_traits__
+            factory = TaskFactory(id=traits['id'].default, name=traits['name'].default, factory=cls)
             factories.append(factory)
         
         return factories
@@ -0,0 +1,279 @@
+"""Cached discovery of plugins installed as eggs
+
+Finding the plugins in eggs means scanning the egg path with pkg_resources and
+importing every plugin module, which is slow and has to be repeated on every
+startup.  Instead, the result of the scan is saved in a manifest keyed on the
+modification times of the egg path and the versions of the installed
+distributions.  While the key matches, the plugins are created from the
+manifest as ManifestPlugin stand-ins that only import the real plugin when
+one of the extension points it contributes to is first used.
+"""
+import os
+import re
+import json
+import hashlib
+
+import pkg_resources
+
+from envisage.api import Plugin
+from envisage.egg_utils import get_entry_points_in_egg_order
+from traits.api import Any, Bool, List, Str
+
+import logging
+log = logging.getLogger(__name__)
+
+
+# Version of the manifest file format
+manifest_version = 1
+
+# Entry point group used by envisage plugins
+entry_point_group = "envisage.plugins"
+
+
+def get_path_state(egg_path):
+    """Return a list of [filename, mtime] for each directory in the egg path
+    and each of the entries in those directories.
+    """
+    state = []
+    for path in egg_path:
+        path = os.path.abspath(path)
+        try:
+            state.append([path, os.path.getmtime(path)])
+            if os.path.isdir(path):
+                for name in sorted(os.listdir(path)):
+                    filename = os.path.join(path, name)
+                    state.append([filename, os.path.getmtime(filename)])
+        except OSError:
+            state.append([path, None])
+    return state
+
+
+def get_manifest_key(egg_path, include, working_set=None):
+    """Return a key that changes whenever a rescan could find different
+    plugins.
+
+    @param egg_path: list of directories searched for eggs
+    @param include: list of regular expressions matching the plugin ids
+    @param working_set: pkg_resources WorkingSet of the installed distributions
+    """
+    if working_set is None:
+        working_set = pkg_resources.working_set
+    distributions = sorted("%s==%s %s" % (d.project_name, d.version, d.location) for d in working_set)
+    items = [manifest_version, list(include), get_path_state(egg_path), distributions]
+    return hashlib.md5(json.dumps(items)).hexdigest()
+
+
+def is_included(name, include):
+    """Match the plugin id the way EggPluginManager does: an empty include
+    list matches everything.
+    """
+    if not include:
+        return True
+    for pattern in include:
+        if re.match(pattern, name) is not None:
+            return True
+    return False
+
+
+def get_trait_default(klass, name):
+    """Return the default value of a trait of a HasTraits class, including
+    defaults overridden by class attributes in subclasses
+    """
+    return klass.__class_traits__[name].default
+
+
+def get_plugin_info(ep, klass):
+    """Return the manifest entry describing the plugin class of the entry
+    point
+    """
+    contributions = set()
+    for trait in klass.class_traits().values():
+        if trait.contributes_to is not None:
+            contributions.add(trait.contributes_to)
+    for cls in klass.__mro__:
+        for value in cls.__dict__.values():
+            extension_point = getattr(value, '__extension_point__', None)
+            if isinstance(extension_point, basestring):
+                contributions.add(extension_point)
+    # Plugins that declare their own extension points, offer services
+    # through traits or do anything at start or stop time can't wait until
+    # their contributions are needed.
+    eager = bool(klass.class_traits(__extension_point__=True)) or \
+        bool(klass.class_traits(service=True)) or \
+        klass.start.im_func is not Plugin.start.im_func or \
+        klass.stop.im_func is not Plugin.stop.im_func
+    return {
+        'name': ep.name,
+        'entry_point': str(ep),
+        'distribution': ep.dist.project_name if ep.dist is not None else "",
+        'id': get_trait_default(klass, 'id') or ep.name,
+        'plugin_name': get_trait_default(klass, 'name') or ep.name,
+        'contributes_to': sorted(contributions),
+        'eager': eager,
+        }
+
+
+def scan_plugins(egg_path, include, working_set=None):
+    """Find the plugins in the eggs on the egg path and the installed
+    distributions, adding the eggs to the working set.
+
+    Returns the manifest as a dict.  The plugin modules are imported to find
+    their contributions.
+    """
+    if working_set is None:
+        working_set = pkg_resources.working_set
+    key = get_manifest_key(egg_path, include, working_set)
+    environment = pkg_resources.Environment(egg_path)
+    distributions, errors = working_set.find_plugins(environment)
+    if len(errors) > 0:
+        raise SystemError('cannot add eggs %s' % errors)
+    log.debug('added eggs %s' % distributions)
+    map(working_set.add, distributions)
+
+    plugins = []
+    for ep in get_entry_points_in_egg_order(working_set, entry_point_group):
+        if is_included(ep.name, include):
+            klass = ep.load()
+            plugins.append(get_plugin_info(ep, klass))
+    return {
+        'version': manifest_version,
+        'key': key,
+        'locations': [d.location for d in distributions],
+        'plugins': plugins,
+        }
+
+
+def load_manifest(filename, key):
+    """Return the manifest saved in the file, or None if it is missing,
+    unreadable or was made for a different key.
+    """
+    try:
+        with open(filename, "rb") as fh:
+            manifest = json.load(fh)
+    except (IOError, OSError, ValueError), e:
+        log.debug("Can't load plugin manifest %s: %s" % (filename, e))
+        return None
+    if not isinstance(manifest, dict) or manifest.get('version') != manifest_version or manifest.get('key') != key:
+        return None
+    return manifest
+
+
+def save_manifest(filename, manifest):
+    """Save the manifest, replacing any previous one atomically so another
+    process starting at the same time never sees a partial file.
+    """
+    dirname = os.path.dirname(filename)
+    try:
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+        temp = filename + ".tmp%d" % os.getpid()
+        with open(temp, "wb") as fh:
+            json.dump(manifest, fh, indent=1)
+        if os.path.exists(filename) and os.name == "nt":
+            os.remove(filename)
+        os.rename(temp, filename)
+    except (IOError, OSError), e:
+        log.error("Failed saving plugin manifest %s: %s" % (filename, e))
+
+
+def load_entry_point(text):
+    """Import the object referenced by the entry point text without
+    checking the requirements of its distribution
+    """
+    return pkg_resources.EntryPoint.parse(text).resolve()
+
+
+class ManifestPlugin(Plugin):
+    """Stand-in for a plugin described by the manifest
+
+    The real plugin is created the first time the extension registry asks
+    for its contributions to one of the extension points listed in the
+    manifest, or at startup for plugins marked as eager.
+    """
+    # Entry point text of the real plugin class
+    entry_point = Str
+
+    # Ids of the extension points that the real plugin contributes to
+    contributions = List(Str)
+
+    # Whether the real plugin must be created and started with the
+    # application
+    eager = Bool(False)
+
+    # The real plugin, once it has been created
+    plugin = Any
+
+    def get_plugin(self):
+        if self.plugin is None:
+            log.debug("loading plugin %s from %s" % (self.id, self.entry_point))
+            klass = load_entry_point(self.entry_point)
+            self.plugin = klass(application=self.application)
+        return self.plugin
+
+    def get_extension_points(self):
+        if self.eager:
+            return self.get_plugin().get_extension_points()
+        return []
+
+    def get_extensions(self, extension_point_id):
+        if self.eager or extension_point_id in self.contributions:
+            return self.get_plugin().get_extensions(extension_point_id)
+        return []
+
+    def connect_extension_point_traits(self):
+        if self.eager:
+            self.get_plugin().connect_extension_point_traits()
+
+    def disconnect_extension_point_traits(self):
+        if self.plugin is not None:
+            self.plugin.disconnect_extension_point_traits()
+
+    def register_services(self):
+        if self.eager:
+            self.get_plugin().register_services()
+
+    def unregister_services(self):
+        if self.plugin is not None:
+            self.plugin.unregister_services()
+
+    def start(self):
+        if self.eager:
+            self.get_plugin().start()
+
+    def stop(self):
+        if self.plugin is not None:
+            self.plugin.stop()
+
+
+def create_plugins(manifest, working_set=None):
+    """Return ManifestPlugin instances for the plugins in the manifest,
+    adding the eggs that the scan found to the working set.
+    """
+    if working_set is None:
+        working_set = pkg_resources.working_set
+    for location in manifest['locations']:
+        if location not in working_set.entries:
+            working_set.add_entry(location)
+    plugins = []
+    for info in manifest['plugins']:
+        plugin = ManifestPlugin(id=info['id'], name=info['plugin_name'], entry_point=info['entry_point'], contributions=info['contributes_to'], eager=info['eager'])
+        plugins.append(plugin)
+    return plugins
+
+
+def get_plugins(filename, egg_path, include, rescan=False):
+    """Return the plugins found in eggs, using the manifest saved in filename
+    if it's still valid and otherwise scanning and saving a new manifest.
+
+    @param filename: path of the manifest file
+    @param egg_path: list of directories searched for eggs
+    @param include: list of regular expressions matching the plugin ids
+    @param rescan: if True, ignore any saved manifest
+    """
+    key = get_manifest_key(egg_path, include)
+    manifest = None if rescan else load_manifest(filename, key)
+    if manifest is None:
+        log.debug("scanning for plugins in %s" % egg_path)
+        manifest = scan_plugins(egg_path, include)
+        save_manifest(filename, manifest)
+    return create_plugins(manifest)
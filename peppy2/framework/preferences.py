@@ -1,7 +1,7 @@
 # Enthought library imports.
 from envisage.ui.tasks.api import PreferencesPane, TaskFactory
 from apptools.preferences.api import PreferencesHelper
-from traits.api import on_trait_change, Bool, Dict, Enum, List, Str, Unicode, Instance
+from traits.api import on_trait_change, Bool, Dict, Enum, Int, List, Str, Unicode, Instance
 from traitsui.api import EnumEditor, HGroup, VGroup, Item, Label, \
     View
 from envisage.api import IApplication
@@ -46,6 +46,14 @@ class FrameworkPreferences(PreferencesHelper):
     # Whether to always apply the default application-level layout.
     # See TasksApplication for more information.
     always_use_default_layout = Bool
+    
+    # Approximate memory in megabytes used by the files in each window before
+    # unmodified files in inactive tabs are released.  Zero means no limit.
+    hibernate_memory_budget = Int(0)
+    
+    # Whether to reopen the windows and files of the last run when no files
+    # are given on the command line
+    restore_session = Bool(True)
 
 
 class FrameworkPreferencesPane(PreferencesPane):
@@ -70,7 +78,14 @@ class FrameworkPreferencesPane(PreferencesPane):
                            editor=EnumEditor(name='handler.task_map')),
                       enabled_when = 'always_use_default_layout',
                       show_labels = False),
+               HGroup(Item('restore_session'),
+                      Label('Reopen the files from the last session'),
+                      show_labels = False),
                label='Application startup'),
+        VGroup(HGroup(Item('hibernate_memory_budget'),
+                      Label('Memory limit in MB for open files (0 = no limit)'),
+                      show_labels = False),
+               label='Memory'),
         resizable=True)
 
     ###########################################################################
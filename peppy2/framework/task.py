@@ -8,13 +8,15 @@ from pyface.tasks.api import Task, TaskWindow, TaskLayout, TaskWindowLayout, Pan
     IEditorAreaPane, EditorAreaPane, Editor, DockPane, HSplitter, VSplitter
 from pyface.tasks.action.api import DockPaneToggleGroup, SMenuBar, \
     SMenu, SToolBar, TaskAction, TaskToggleGroup
-from traits.api import provides, on_trait_change, Property, Instance, Bool, Str, Unicode, Int
+from traits.api import provides, on_trait_change, Property, Instance, Bool, List, Str, Unicode, Int
 from apptools.preferences.api import PreferencesHelper
 
 from peppy2.dock_panes import FileBrowserPane
 from peppy2.framework.i_about import IAbout
+from peppy2.framework.editor import FrameworkEditor
 from peppy2.framework.actions import *
 from peppy2.framework.status_bar_manager import FrameworkStatusBarManager
+from peppy2.utils.session import get_existing_editors
 
 import logging
 log = logging.getLogger(__name__)
@@ -48,6 +50,12 @@ class FrameworkTask(Task):
     
     start_new_editor_in_new_window = Bool(False)
     
+    # Editors in order of activation, least recently activated first
+    editor_activation_order = List
+    
+    # True while the editors of a saved session are being added
+    restoring_session = Bool(False)
+    
     #### 'IAbout' interface ###################################################
     
     about_title = Unicode('Peppy2')
@@ -145,7 +153,9 @@ class FrameworkTask(Task):
         if hasattr(source, 'get_metadata') or source is None:
             editor.load(source, **kwargs)
             if source is not None:
-                self.window.application.successfully_loaded_event = source.metadata.uri
+                metadata = source.metadata
+                self.window.application.successfully_loaded_event = metadata.uri
+                self.window.application.file_metadata_event = (metadata.uri, {'mime': metadata.mime, 'task_id': self.id})
         else:
             editor.view_of(source, **kwargs)
         self.activated()
@@ -179,8 +189,7 @@ class FrameworkTask(Task):
         else:
             task_id = self.window.application.startup_task
         if task_id is None:
-            task = task_cls()
-            task_id = task.id
+            task_id = task_cls.__class_traits__['id'].default
         log.debug("  task id: %s" % task_id)
         log.debug("  returned factory: %s" % self.window.application._get_task_factory(task_id))
         for factory in self.window.application.task_factories:
@@ -200,6 +209,9 @@ class FrameworkTask(Task):
             necessary. Returns whether the file was saved.
         """
         editor = self.active_editor
+        if getattr(editor, 'hibernated', False):
+            # Never write the empty control of a hibernated editor
+            return False
         try:
             editor.save()
         except IOError:
@@ -213,6 +225,98 @@ class FrameworkTask(Task):
                 return False
         return True
 
+    def save_view_position(self, editor):
+        """ Send the view position of the editor to anything tracking the
+        file, e.g. the recent files list.
+        """
+        if not isinstance(editor, FrameworkEditor) or not editor.path:
+            return
+        position = editor.get_current_view_position()
+        if position:
+            self.window.application.file_metadata_event = (editor.path, {'view_position': position})
+
+    def get_session(self):
+        """ Describe the open files so they can be reopened in a later run
+        """
+        editors = []
+        active = None
+        for editor in self.editor_area.editors:
+            if not isinstance(editor, FrameworkEditor) or not editor.path:
+                continue
+            if editor is self.active_editor:
+                active = len(editors)
+            editors.append({'path': editor.path, 'view': editor.get_current_view_position() or {}})
+        return {'id': self.id, 'active': active, 'editors': editors}
+
+    def restore_session(self, session):
+        """ Reopen the files described by get_session
+        
+        Only the active file is loaded.  The others are added as hibernated
+        editors, which load their files when they're activated.
+        """
+        editors, active_index = get_existing_editors(session)
+        if not editors:
+            return
+        # Replace the empty editor of a new window
+        for editor in list(self.editor_area.editors):
+            if isinstance(editor, FrameworkEditor) and not editor.path and not editor.dirty:
+                self.editor_area.remove_editor(editor)
+        active = None
+        self.restoring_session = True
+        try:
+            for i, item in enumerate(editors):
+                editor = self.get_editor()
+                if editor.open_hibernated(item['path'], item.get('view')):
+                    self.editor_area.add_editor(editor)
+                    if active is None or i == active_index:
+                        active = editor
+                else:
+                    # Editors that can't load lazily are loaded now
+                    self.window.application.load_file(item['path'], self, self.id)
+        finally:
+            self.restoring_session = False
+        if active is not None:
+            self.editor_area.activate_editor(active)
+            self._active_editor_changed_for_hibernation(active)
+
+    def hibernate_inactive_editors(self):
+        """Release the data of the least recently activated editors until the
+        memory used by the editors is within the memory budget.
+        
+        Only unmodified editors that can reload their data from a file are
+        hibernated, and the active editor is never hibernated.
+        """
+        budget = self.window.application.preferences_helper.hibernate_memory_budget * 1024 * 1024
+        if budget <= 0:
+            return
+        editors = [e for e in self.editor_area.editors if isinstance(e, FrameworkEditor)]
+        
+        # Editors that have never been activated are the least recently used
+        order = [e for e in editors if e not in self.editor_activation_order]
+        order.extend([e for e in self.editor_activation_order if e in editors])
+        self.editor_activation_order = order
+        
+        # Views of the same file share their data, so count it once
+        sizes = {}
+        for editor in editors:
+            sizes[editor.get_memory_owner()] = editor.get_memory_size()
+        total = sum(sizes.values())
+        for editor in order:
+            if total <= budget:
+                break
+            if editor is self.active_editor or not editor.can_hibernate():
+                continue
+            views = editor.get_data_views()
+            if [v for v in views if v is self.active_editor or v not in editors]:
+                # Another view keeps the data in memory
+                continue
+            owner = editor.get_memory_owner()
+            log.debug("hibernating %s, %d bytes" % (editor, sizes[owner]))
+            editor.hibernate()
+            if len(views) == 1:
+                # Only the last view actually frees the data
+                total -= sizes.pop(owner)
+
     def allow_different_task(self, guess, other_task):
         """Hook to allow tasks to abort loading different task window.
         
@@ -388,9 +492,10 @@ class FrameworkTask(Task):
         """ Prompts the user to save if necessary. Returns whether the dialog
             was cancelled.
         """
+        # Hibernated editors have no data, so there's nothing to save
         dirty_editors = dict([(editor.name, editor)
                               for editor in self.editor_area.editors
-                              if editor.dirty])
+                              if editor.dirty and not getattr(editor, 'hibernated', False)])
         if not dirty_editors.keys():
             return True
         message = 'You have unsaved files. Would you like to save them?'
@@ -405,12 +510,36 @@ class FrameworkTask(Task):
 
     #### Trait change handlers ################################################
 
+    @on_trait_change('editor_area:active_editor')
+    def _active_editor_changed_for_hibernation(self, editor):
+        """ Restore a hibernated editor when it becomes active and enforce the
+        memory budget on the others.
+        """
+        if editor is None or self.restoring_session or not isinstance(editor, FrameworkEditor):
+            return
+        editor.restore()
+        editors = self.editor_area.editors
+        order = [e for e in self.editor_activation_order if e is not editor and e in editors]
+        order.append(editor)
+        self.editor_activation_order = order
+        self.hibernate_inactive_editors()
+
+    @on_trait_change('editor_area:editors_items')
+    def _editors_removed(self, event):
+        """ Remember the view position of closed editors
+        """
+        for editor in event.removed:
+            self.save_view_position(editor)
+
     @on_trait_change('window:closing')
     def _prompt_on_close(self, event):
         """ Prompt the user to save when exiting.
         """
         close = self._prompt_for_save()
         event.veto = not close
+        if close:
+            for editor in self.editor_area.editors:
+                self.save_view_position(editor)
 
     #### Trait property getter/setters ########################################
 
@@ -424,3 +553,10 @@ class FrameworkTask(Task):
     @classmethod
     def can_edit(cls, mime):
         raise NotImplementedError
+
+    @classmethod
+    def prewarm_file(cls, path, cache_dir):
+        """ Precompute anything that makes opening the file faster, e.g. cached
+        indexes.  Called on a job thread, so it must not use the GUI.
+        """
+        pass
@@ -50,6 +50,8 @@
 #           cog.outl("plugins.append(%s())" % name)
 # ]]]*/
 plugins = []
+from autosave import AutosavePlugin
+plugins.append(AutosavePlugin())
 from exception_handler import ExceptionHandlerPlugin
 plugins.append(ExceptionHandlerPlugin())
 from file_progress import FileProgressPlugin
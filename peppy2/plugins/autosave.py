@@ -0,0 +1,105 @@
+# Standard library imports.
+import os
+import wx
+
+# Enthought library imports.
+from traits.api import on_trait_change, Bool, List, Range
+from apptools.preferences.api import PreferencesHelper
+from envisage.ui.tasks.api import PreferencesPane
+from traitsui.api import HGroup, VGroup, Item, Label, View
+
+# Local imports.
+from peppy2.framework.plugin import FrameworkPlugin
+from peppy2.utils.autosave import AutosaveService
+
+import logging
+log = logging.getLogger(__name__)
+
+
+class AutosavePreferences(PreferencesHelper):
+    """ The preferences helper for the autosave plugin.
+    """
+
+    #### 'PreferencesHelper' interface ########################################
+
+    # The path to the preference node that contains the preferences.
+    preferences_path = 'autosave'
+
+    #### Preferences ##########################################################
+
+    # Journal changes to modified files
+    enabled = Bool(True)
+
+    # Number of seconds between snapshots
+    interval = Range(low=5, high=600, value=30)
+
+
+class AutosavePreferencesPane(PreferencesPane):
+    """ The preferences pane for the autosave plugin.
+    """
+
+    #### 'PreferencesPane' interface ##########################################
+
+    # The factory to use for creating the preferences model object.
+    model_factory = AutosavePreferences
+
+    view = View(
+        VGroup(HGroup(Item('enabled'),
+                      Label('Periodically save changes for crash recovery'),
+                      show_labels = False),
+               HGroup(Item('interval'),
+                      Label('Seconds between autosaves'),
+                      show_labels = False),
+               label='Autosave'),
+        resizable=True)
+
+
+class AutosavePlugin(FrameworkPlugin):
+    """Journal the changes to modified files so they can be recovered after
+    a crash.
+
+    Editors find the L{AutosaveService} through the plugin data using this
+    plugin's id.
+    """
+
+    #### 'IPlugin' interface ##################################################
+
+    # The plugin's unique identifier.
+    id = 'autosave'
+
+    # The plugin's name (suitable for displaying to the user).
+    name = 'Autosave'
+
+    # Extension point IDs.
+    PREFERENCES_PANES = 'envisage.ui.tasks.preferences_panes'
+
+    #### Contributions to extension points made by this plugin ################
+
+    preferences_panes = List(contributes_to=PREFERENCES_PANES)
+
+    def _preferences_panes_default(self):
+        return [ AutosavePreferencesPane ]
+
+    def start(self):
+        self.helper = self.get_helper(AutosavePreferences)
+
+        # self.home is the config directory created especially for this plugin!
+        self.service = AutosaveService(os.path.join(self.home, "journals"))
+        self.set_plugin_data(self.service)
+        self.timer = wx.PyTimer(self.on_timer)
+        self.helper.on_trait_change(self.restart_timer, 'enabled,interval')
+        self.restart_timer()
+
+    def stop(self):
+        self.timer.Stop()
+
+    def restart_timer(self):
+        self.timer.Stop()
+        if self.helper.enabled:
+            self.timer.Start(self.helper.interval * 1000)
+
+    def on_timer(self):
+        try:
+            self.service.snapshot()
+        except Exception, e:
+            log.error("Autosave failed: %s" % e)
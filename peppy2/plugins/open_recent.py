@@ -1,5 +1,10 @@
 # Standard library imports.
 import os
+import time
+import errno
+from itertools import islice
+
+import wx
 
 # Enthought library imports.
 from traits.api import HasTraits, on_trait_change, Any, Instance, List, Bool, Int, Range, Str, Unicode, Event
@@ -10,7 +15,12 @@ from pyface.action.api import Action, ActionItem, Group, Separator
 from pyface.tasks.action.api import SMenu, TaskAction, EditorAction, SchemaAddition
 from traitsui.api import EnumEditor, HGroup, VGroup, Item, Label, View
 
+from peppy2.framework.document import DocumentRegistry
 from peppy2.framework.plugin import FrameworkPlugin
+from peppy2.utils.file_guess import FileGuess
+from peppy2.utils.fileutil import atomic_write, readahead
+from peppy2.utils.jobs import ThreadJob, get_global_job_manager
+from peppy2.utils.mru import MRUList
 
 import logging
 log = logging.getLogger(__name__)
@@ -34,6 +44,12 @@ class OpenRecentPreferences(PreferencesHelper):
     # Maximum number of files to retain in the list
     list_length = Range(low=4, high=list_max, value=10)
     
+    # Check and preload the most recent files after the first window opens
+    prewarm = Bool(False)
+    
+    # Number of recent files to preload
+    prewarm_count = Range(low=1, high=20, value=5)
+    
     def max_list_length(self):
         # No easy way to get the maximum value of a Range object
         t = self.trait('list_length')
@@ -59,32 +75,82 @@ class OpenRecentPreferencesPane(PreferencesPane):
                HGroup(Item('add_at_top'),
                       Label('Add new file to top of list'),
                       show_labels = False),
+               HGroup(Item('prewarm'),
+                      Label('Preload recent files at startup'),
+                      show_labels = False),
+               HGroup(Item('prewarm_count', enabled_when='prewarm'),
+                      Label('Number of recent files to preload'),
+                      show_labels = False),
                label='Open Recent'),
         resizable=True)
 
-# FIXME: RecentFiles doesn't work as a traits object! Weird.
-#
-#class RecentFiles(HasTraits):
-#    """Open a file from the list of recently opened files.
-#    
-#    Maintains a list of the most recently opened files so that the next time
-#    you start the application you can see what you were editing last time.
-#    This list is automatically maintained, so every time you open a new file,
-#    it is added to the list.  This list is limited in size by the classpref
-#    'list_length' in L{RecentFilesPlugin}.
-#    """
-#    
-#    # Preferences aren't duplicated here; instead, reference the helper so they
-#    # can be lookup up every time they are needed.
-#    helper = Instance(OpenRecentPreferences)
-#    
-#    # location to serialize the list to persist across application runs
-#    serialize_uri = Unicode
-#    
-#    storage_flag = Bool
-#    
-#    updated = Event
-        
+class SaveRecentFilesJob(ThreadJob):
+    def __init__(self, path, lines):
+        ThreadJob.__init__(self)
+        self.path = path
+        self.lines = lines
+
+    def _start(self, dispatcher):
+        try:
+            atomic_write(self.path, ["%s%s" % (line.encode('utf8'), os.linesep) for line in self.lines])
+        except (IOError, OSError), e:
+            log.error("Failed saving recent files list %s: %s" % (self.path, e))
+
+
+class PrewarmJob(ThreadJob):
+    """Get the most recent files ready to open quickly
+
+    Each file is checked against the size and modification time saved when it
+    was last opened.  The start of each file is read into the OS cache, and
+    for unchanged files the task that last opened it can precompute anything
+    it will need.
+
+    The job runs in its own queue and pauses between files, so it doesn't
+    hold up the jobs of the files that are actually being opened.
+
+    @param entries: list of (uri, metadata) of the files
+    @param prewarmers: dict mapping task id to a function taking the path of
+    the file and the cache directory
+    @param skip: canonical paths of files that are already being opened
+    """
+    queue_name = "prewarm"
+
+    # Seconds to wait before each file
+    pause = 0.1
+
+    def __init__(self, entries, prewarmers, cache_dir, callback, skip=None):
+        ThreadJob.__init__(self)
+        self.entries = entries
+        self.prewarmers = prewarmers
+        self.cache_dir = cache_dir
+        self.callback = callback
+        self.skip = skip if skip is not None else set()
+        self.results = {}
+
+    def _start(self, dispatcher):
+        for uri, metadata in self.entries:
+            if "://" in uri or DocumentRegistry.get_canonical_path(uri) in self.skip:
+                continue
+            time.sleep(self.pause)
+            try:
+                st = os.stat(uri)
+                readahead(uri, FileGuess.head_size)
+            except (IOError, OSError), e:
+                log.debug("Not prewarming %s: %s" % (uri, e))
+                continue
+            unchanged = metadata.get('size') == st.st_size and metadata.get('mtime') == st.st_mtime
+            self.results[uri] = {'size': st.st_size, 'mtime': st.st_mtime, 'unchanged': unchanged}
+            prewarm = self.prewarmers.get(metadata.get('task_id'))
+            if unchanged and prewarm is not None:
+                try:
+                    prewarm(uri, self.cache_dir)
+                except Exception, e:
+                    log.error("Failed prewarming %s: %s" % (uri, e))
+
+    def success_callback(self):
+        self.callback(self)
+
+
 class RecentFiles(object):
     """Open a file from the list of recently opened files.
     
@@ -93,19 +159,16 @@ class RecentFiles(object):
     This list is automatically maintained, so every time you open a new file,
     it is added to the list.  This list is limited in size by the classpref
     'list_length' in L{RecentFilesPlugin}.
+    
+    Changes only mark the list as dirty; the plugin saves it a short time
+    later so that opening many files at once results in a single write.
     """
     
     def __init__(self, helper, serialize_uri):
         self.helper = helper
         self.serialize_uri = serialize_uri
-        self._storage_flag_default()
-        
-    #### Trait initializers ###################################################
-
-    def _storage_flag_default(self):
-        self.storage_flag = True
-        self.storage = []
-        log.debug("STORAGE_FLAG!!! %s" % self.storage_flag)
+        self.storage = MRUList(helper.max_list_length())
+        self.dirty = False
         self.unserialize()
     
     def is_acceptable_uri(self, uri):
@@ -114,51 +177,96 @@ class RecentFiles(object):
         return True
     
     def iter_items(self):
-        for item in self.storage[0:self.helper.list_length]:
-            yield item
+        for uri in islice(self.storage, self.helper.list_length):
+            yield uri
+    
+    def get_metadata(self, uri):
+        """Return the metadata saved with the uri, or None if it isn't in the
+        list
+        """
+        return self.storage.get(uri)
+    
+    def get_verified_mime(self, uri):
+        """Return the MIME type saved when the file was last opened if the
+        file hasn't changed since, so it doesn't have to be recognized again.
+        Returns None if the file must be recognized.
+        """
+        if "://" in uri:
+            return None
+        uri = os.path.abspath(uri)
+        metadata = self.storage.get(unicode(uri))
+        if not metadata or not metadata.get('mime'):
+            return None
+        try:
+            st = os.stat(uri)
+        except OSError:
+            return None
+        if metadata.get('size') != st.st_size or metadata.get('mtime') != st.st_mtime:
+            return None
+        return metadata['mime']
+    
+    def get_prewarm_entries(self, count):
+        return [(uri, dict(metadata)) for uri, metadata in self.storage.iter_items(count)]
+    
+    def set_prewarm_results(self, results):
+        """Forget the MIME types of files that changed since they were last
+        opened
+        """
+        for uri, result in results.iteritems():
+            if not result['unchanged']:
+                self.update_metadata(uri, mime="")
+    
+    def save(self, background=True):
+        """Save the list if it has changed, writing the file in a job unless
+        background is False
+        """
+        if not self.dirty:
+            return
+        self.dirty = False
+        job = SaveRecentFilesJob(self.serialize_uri, self.storage.to_lines())
+        manager = get_global_job_manager() if background else None
+        if manager is None or not manager.add_job(job):
+            job._start(None)
     
     def serialize(self):
         """Serialize the current items to the file"""
-        log.debug("SERIALIZING: %s" % str(self.storage))
-        # trim list to maximum possible length
-        self.storage[self.helper.max_list_length():] = []
-        with open(self.serialize_uri,'w') as fh:
-            try:
-                for item in self.iter_items():
-                    fh.write("%s%s" % (item.encode('utf8'),os.linesep))
-            except:
-                pass
+        self.dirty = True
+        self.save(False)
             
     def unserialize(self):
         """Unserialize items from the file into a list"""
         log.debug("UNSERIALIZING: %s" % str(self.serialize_uri))
-        self.storage = []
         try:
             with open(self.serialize_uri,'r') as fh:
-                for line in fh:
-                    trimmed = line.decode('utf8').rstrip()
-                    if trimmed.strip():
-                        self.storage.append(trimmed)
-        except:
-            pass
+                self.storage.from_lines([line.decode('utf8') for line in fh])
+        except IOError, e:
+            if e.errno != errno.ENOENT:
+                log.error("Failed loading recent files list %s: %s" % (self.serialize_uri, e))
+        except UnicodeDecodeError, e:
+            log.error("Failed loading recent files list %s: %s" % (self.serialize_uri, e))
     
-    def append_uri(self, uri, extra=None):
+    def append_uri(self, uri, **metadata):
+        """Move the uri to the top of the list, adding it if necessary, and
+        merge the metadata into any previously saved
+        """
         if self.is_acceptable_uri(uri):
+            if "://" not in uri:
+                uri = os.path.abspath(uri)
+                try:
+                    st = os.stat(uri)
+                    metadata['size'] = st.st_size
+                    metadata['mtime'] = st.st_mtime
+                except OSError:
+                    pass
+            self.storage.add(unicode(uri), **metadata)
+            self.dirty = True
+    
+    def update_metadata(self, uri, **metadata):
+        """Merge the metadata into the entry for the uri without moving it"""
+        if "://" not in uri:
             uri = os.path.abspath(uri)
-            item = unicode(uri)
-            if extra:
-                item = (item, extra)
-            # if we're adding an item that's already in the list, move it
-            # to the top of the list by recreating the list
-            try:
-                index = self.storage.index(item)
-                self.storage.pop(index)
-            except ValueError:
-                pass
-            # New items are added at the top of this list
-            self.storage[0:0]=[item]
-            self.serialize()
-        log.debug("STORAGE: %s" % str(self.storage))
+        if self.storage.update(unicode(uri), **metadata):
+            self.dirty = True
 
 
 class OpenRecentAction(Action):
@@ -250,6 +358,9 @@ class OpenRecentPlugin(FrameworkPlugin):
     TASK_EXTENSIONS   = 'envisage.ui.tasks.task_extensions'
     OSX_MINIMAL_MENU = 'peppy2.osx_minimal_menu'
 
+    # Milliseconds to wait after a change before saving the list
+    save_delay = 2000
+
     #### Contributions to extension points made by this plugin ################
 
     preferences_panes = List(contributes_to=PREFERENCES_PANES)
@@ -287,6 +398,52 @@ class OpenRecentPlugin(FrameworkPlugin):
         recent_files = RecentFiles(helper=helper,
                                    serialize_uri=os.path.join(self.home, "files.dat"))
         self.set_plugin_data(recent_files)
+        self.save_timer = None
+
+    def stop(self):
+        if self.save_timer is not None:
+            self.save_timer.Stop()
+            self.save_timer = None
+        # The job manager may already be gone, so save in this thread
+        self.get_plugin_data().save(False)
+
+    def schedule_save(self):
+        """Save the list after a delay, so a burst of changes is written once
+        """
+        if self.save_timer is None:
+            self.save_timer = wx.CallLater(self.save_delay, self.save_recent_files)
+
+    def save_recent_files(self):
+        self.save_timer = None
+        self.get_plugin_data().save()
+
+    @on_trait_change('application:application_initialized')
+    def schedule_prewarm(self):
+        # The application queues the loading of the startup files in its own
+        # handler; wait until those jobs are queued
+        wx.CallAfter(self.start_prewarm)
+
+    def start_prewarm(self):
+        helper = self.get_plugin_data().helper
+        manager = get_global_job_manager()
+        if not helper.prewarm or manager is None:
+            # Not worth slowing down the GUI thread for
+            return
+        prewarmers = {}
+        for factory in self.application.task_factories:
+            prewarm = getattr(factory.factory, "prewarm_file", None)
+            if prewarm is not None:
+                prewarmers[factory.id] = prewarm
+        entries = self.get_plugin_data().get_prewarm_entries(helper.prewarm_count)
+        skip = set(DocumentRegistry.get_canonical_path(uri) for uri in self.application.startup_uris if "://" not in uri)
+        skip.update(self.application.document_registry.documents)
+        job = PrewarmJob(entries, prewarmers, self.application.cache_dir, self.prewarm_finished, skip)
+        manager.add_job(job)
+
+    def prewarm_finished(self, job):
+        log.debug("prewarmed %s" % job.results)
+        self.get_plugin_data().set_prewarm_results(job.results)
+        self.schedule_save()
 
     @on_trait_change('application:successfully_loaded_event')
     def update_recent_file(self, uri):
@@ -295,6 +452,13 @@ class OpenRecentPlugin(FrameworkPlugin):
         try:
             recent_files.append_uri(uri)
         except Exception, e:
-            log.warning("FAILED ADDING %s to recent files list: %s" % (uri, e.message))
+            log.warning("FAILED ADDING %s to recent files list: %s" % (uri, e))
             return
+        self.schedule_save()
         self.fire_plugin_event()
+
+    @on_trait_change('application:file_metadata_event')
+    def update_recent_file_metadata(self, event):
+        uri, metadata = event
+        self.get_plugin_data().update_metadata(uri, **metadata)
+        self.schedule_save()
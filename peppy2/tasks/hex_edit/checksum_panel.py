@@ -0,0 +1,171 @@
+import wx
+
+from peppy2.utils.blockhash import BlockHashIndex, BlockHashJob, RangeDigestJob, digest_algorithms
+from peppy2.utils.jobs import get_global_job_manager
+from peppy2.utils.wx.update_scheduler import get_update_scheduler
+
+import logging
+log = logging.getLogger(__name__)
+
+
+class ChecksumPanel(wx.Panel):
+    """CRC32 and digests of the whole file or the selection in the active
+    hex editor.
+
+    The block hash index is shared by all views of the file and is updated on
+    a job thread; after an edit only the modified blocks are recomputed.  The
+    digests of a selection can't use the index, so they're computed by a
+    separate job.
+    """
+    scopes = ["Whole file", "Selection"]
+
+    def __init__(self, parent, task):
+        self.task = task
+        self.store = None
+        self.job = None
+        self.rerun = False
+        self.selection_crc = 0
+
+        wx.Panel.__init__(self, parent)
+
+        # Mac/Win needs this, otherwise background color is black
+        attr = self.GetDefaultAttributes()
+        self.SetBackgroundColour(attr.colBg)
+
+        self.scope = wx.Choice(self, -1, choices=self.scopes)
+        self.scope.SetSelection(0)
+        self.button = wx.Button(self, -1, "Calculate")
+        self.results = wx.ListCtrl(self, -1, style=wx.LC_REPORT|wx.LC_SINGLE_SEL)
+        self.results.InsertColumn(0, "Algorithm")
+        self.results.InsertColumn(1, "Value")
+        self.results.SetColumnWidth(1, 400)
+        for i, name in enumerate(["crc32"] + digest_algorithms):
+            self.results.InsertStringItem(i, name)
+        self.status = wx.StaticText(self, -1, "")
+
+        row = wx.BoxSizer(wx.HORIZONTAL)
+        row.Add(self.scope, 1, wx.EXPAND)
+        row.Add(self.button, 0, wx.LEFT, 4)
+        self.sizer = wx.BoxSizer(wx.VERTICAL)
+        self.sizer.Add(row, 0, wx.EXPAND|wx.ALL, 2)
+        self.sizer.Add(self.status, 0, wx.EXPAND|wx.ALL, 2)
+        self.sizer.Add(self.results, 1, wx.EXPAND)
+        self.SetSizer(self.sizer)
+        self.sizer.Layout()
+        self.Fit()
+
+        self.button.Bind(wx.EVT_BUTTON, self.on_calculate)
+        self.scope.Bind(wx.EVT_CHOICE, self.on_calculate)
+
+    def set_task(self, task):
+        self.task = task
+
+    def get_index(self, editor):
+        """Return the block hash index of the editor's data, creating it if
+        necessary.
+        """
+        document = editor.document
+        if document is None:
+            # Untitled buffer; not shared, so keep the index on the editor
+            index = getattr(editor, "hash_index", None)
+        else:
+            index = document.hash_index
+        if index is None or index.store is not editor.bytestore:
+            if index is not None and index in index.store.dirty_trackers:
+                # Stop tracking the edits of the replaced store
+                index.store.remove_dirty_tracker(index)
+            index = BlockHashIndex(editor.bytestore)
+            if document is None:
+                editor.hash_index = index
+            else:
+                document.hash_index = index
+        return index
+
+    def watch(self, store):
+        """Recalculate after changes to the store"""
+        scheduler = get_update_scheduler()
+        if self.store is not None:
+            scheduler.remove_listener(self.store, self.on_bytes_changed)
+        self.store = store
+        if store is not None:
+            scheduler.add_listener(store, self.on_bytes_changed)
+
+    def on_bytes_changed(self, ranges, length_changed):
+        if self.IsShownOnScreen():
+            self.calculate()
+
+    def on_calculate(self, evt):
+        self.calculate()
+
+    def calculate(self):
+        editor = self.task.active_editor
+        if editor is None or not hasattr(editor, "bytestore"):
+            return
+        if self.job is not None:
+            # Only one update at a time; repeat when the current one finishes
+            self.rerun = True
+            return
+        index = self.get_index(editor)
+        self.watch(editor.bytestore)
+        whole_file = self.scope.GetSelection() == 0
+        algorithms = digest_algorithms if whole_file else []
+        if index.is_current(algorithms):
+            self.show_results(editor, index)
+            return
+        self.start_job(BlockHashJob(index, algorithms, self.on_job_finished))
+
+    def start_job(self, job):
+        self.status.SetLabel("Calculating...")
+        self.job = job
+        manager = get_global_job_manager()
+        if manager is None:
+            self.job._start(None)
+            self.job.success_callback()
+        else:
+            manager.add_job(self.job)
+
+    def finish_job(self):
+        """Clear the finished job, returning False if it has to be repeated
+        because of changes made while it was running
+        """
+        self.job = None
+        if self.rerun:
+            self.rerun = False
+            self.calculate()
+            return False
+        return True
+
+    def on_job_finished(self, job):
+        if not self.finish_job():
+            return
+        editor = self.task.active_editor
+        if editor is not None and getattr(editor, "bytestore", None) is job.index.store:
+            self.show_results(editor, job.index)
+
+    def show_results(self, editor, index):
+        if self.scope.GetSelection() == 0:
+            digests = dict((name, index.hexdigest(name)) for name in digest_algorithms)
+            self.set_results(index.crc32(), digests, 0, index.size)
+            return
+        selection = editor.control.GetSelectedByteRange()
+        if selection is None:
+            self.status.SetLabel("No selection")
+            return
+        start, end = selection
+        # The CRC is combined from the index, but the digests have to hash
+        # the whole selection
+        self.selection_crc = index.crc32(start, end)
+        self.start_job(RangeDigestJob(editor.bytestore.data, start, end, digest_algorithms, self.on_digests_finished))
+
+    def on_digests_finished(self, job):
+        if not self.finish_job():
+            return
+        editor = self.task.active_editor
+        if editor is not None and getattr(editor, "bytestore", None) is self.store:
+            self.set_results(self.selection_crc, job.digests, job.start, job.end)
+
+    def set_results(self, crc, digests, start, end):
+        self.results.SetStringItem(0, 1, "%08x" % crc)
+        for i, name in enumerate(digest_algorithms):
+            self.results.SetStringItem(i + 1, 1, digests[name])
+        self.status.SetLabel("%d bytes from offset %d" % (end - start, start))
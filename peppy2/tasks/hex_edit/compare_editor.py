@@ -0,0 +1,2 @@
+from peppy2.framework.toolkit import toolkit_object
+toolkit_object(__name__, 'HexCompareEditor')
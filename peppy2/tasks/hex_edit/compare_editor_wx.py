@@ -0,0 +1,220 @@
+# Standard library imports.
+from os.path import basename
+
+# Major package imports.
+import wx
+
+# Enthought library imports.
+from traits.api import Any, List, Unicode
+
+# Local imports.
+from peppy2.framework.editor import FrameworkEditor
+from grid_control import HexEditControl
+from peppy2.utils.wx.stcbinary import BinarySTC
+from peppy2.utils.bindiff import DiffJob
+from peppy2.utils.jobs import get_global_job_manager
+
+import logging
+log = logging.getLogger(__name__)
+
+
+class HexCompareEditor(FrameworkEditor):
+    """Side-by-side read-only view of two files with the differences
+    highlighted.
+
+    The two grids scroll together, using the diff to keep corresponding bytes
+    aligned when data has been inserted or deleted.
+
+    Files that are open in other views are compared using their shared byte
+    stores, including any unsaved changes, rather than loading another copy.
+    """
+
+    #### 'HexCompareEditor' interface ####
+
+    other_path = Unicode
+
+    # DiffResult, or None while the comparison is running
+    result = Any
+
+    # Shared documents of the compared files that this editor is a view of
+    documents = List
+
+    def _get_name(self):
+        return "%s <-> %s" % (basename(self.path), basename(self.other_path))
+
+    def create(self, parent):
+        self.control = self._create_control(parent)
+
+    def compare(self, editor, other_path):
+        """Compare the data of the editor with another file on a job thread
+        """
+        self.path = editor.path
+        self.other_path = other_path
+        self.result = None
+        stores = [self.get_store(editor.path, getattr(editor, "bytestore", None)),
+                  self.get_store(other_path)]
+        for grid, stc in zip(self.grids, stores):
+            grid.stc = stc
+            grid.table.setHighlightRanges([])
+            grid.Update(stc)
+        self.status.SetLabel("Comparing...")
+        job = DiffJob(self.grids[0].stc.data, self.grids[1].stc.data, self.set_result, self.set_error)
+        manager = get_global_job_manager()
+        if manager is None:
+            try:
+                job._start(None)
+            except Exception, e:
+                job.exception = str(e)
+            if job.success():
+                job.success_callback()
+            else:
+                job.failure_callback()
+        else:
+            manager.add_job(job)
+
+    def get_store(self, path, store=None):
+        """Return the byte store to compare: the given store, or the store of
+        the open document of the file, or else the file loaded from disk.
+
+        Shared stores are kept open by attaching this editor as another view
+        of their document.
+        """
+        registry = self.window.application.document_registry
+        document = registry.find(path) if path else None
+        if document is not None and store is None:
+            store = document.byte_store
+        if document is not None and store is not None and store is document.byte_store:
+            registry.attach(path, self)
+            self.documents.append(document)
+        if store is None:
+            store = BinarySTC()
+            store.LoadFile(path)
+        return store
+
+    def detach_documents(self):
+        registry = self.window.application.document_registry
+        for document in self.documents:
+            if registry.detach(document, self):
+                # The editors of the file have been closed, so this was the
+                # last view keeping the data
+                service = self.window.application.plugin_data.get('autosave')
+                if service is not None:
+                    service.unregister(document.byte_store)
+        self.documents = []
+
+    def update_views(self):
+        """Redisplay after a shared store has been saved and remapped"""
+        for grid in self.grids:
+            grid.Update(grid.stc)
+
+    def set_result(self, result):
+        if not self.grids:
+            # Editor was closed before the comparison finished
+            return
+        self.result = result
+        for side, grid in enumerate(self.grids):
+            grid.table.setHighlightRanges(result.get_ranges(side))
+            grid.ForceRefresh()
+        if len(result) == 0:
+            self.status.SetLabel("Files are identical")
+        else:
+            self.status.SetLabel("%d differences" % len(result))
+
+    def set_error(self, job):
+        if not self.grids:
+            return
+        message = job.error or job.exception or "unknown error"
+        # Only the last line of a traceback is useful in the status label
+        self.status.SetLabel("Comparison failed: %s" % message.strip().splitlines()[-1])
+
+    def get_cursor_offset(self, grid):
+        return grid.table.getLoc(grid.GetGridCursorRow(), grid.GetGridCursorCol())
+
+    def goto_difference(self, index):
+        if index is None:
+            return
+        op = self.result.differences[index]
+        self.status.SetLabel("Difference %d of %d" % (index + 1, len(self.result)))
+        for side, grid in enumerate(self.grids):
+            start = op[1 + 2 * side]
+            if grid.stc.GetLength() > 0:
+                grid.GotoPos(min(start, grid.stc.GetLength() - 1))
+
+    def next_difference(self):
+        if self.result is not None:
+            self.goto_difference(self.result.next_difference(0, self.get_cursor_offset(self.grids[0])))
+
+    def prev_difference(self):
+        if self.result is not None:
+            self.goto_difference(self.result.prev_difference(0, self.get_cursor_offset(self.grids[0])))
+
+    def get_top_offset(self, grid):
+        ppu = grid.GetScrollPixelsPerUnit()[1]
+        row = grid.YToRow(grid.GetViewStart()[1] * ppu)
+        return max(row, 0) * grid.table.nbytes
+
+    def scroll_to_offset(self, grid, offset):
+        ppu = grid.GetScrollPixelsPerUnit()[1]
+        if ppu > 0:
+            row = offset / grid.table.nbytes
+            grid.Scroll(-1, grid.CellToRect(row, 0).y / ppu)
+
+    def sync_scroll(self, source):
+        """Scroll the other grid to the bytes that correspond to the top of
+        the source grid.
+        """
+        if self.result is None or source not in self.grids:
+            return
+        side = self.grids.index(source)
+        offset = self.result.map_offset(side, self.get_top_offset(source))
+        self.scroll_to_offset(self.grids[1 - side], offset)
+
+    def destroy(self):
+        for grid in self.grids:
+            grid.stc = None
+        self.grids = []
+        self.detach_documents()
+        super(HexCompareEditor, self).destroy()
+
+    ###########################################################################
+    # Private interface.
+    ###########################################################################
+
+    def _create_control(self, parent):
+        panel = wx.Panel(parent)
+
+        buttons = wx.BoxSizer(wx.HORIZONTAL)
+        prev = wx.Button(panel, -1, "Previous Difference")
+        prev.Bind(wx.EVT_BUTTON, lambda evt: self.prev_difference())
+        buttons.Add(prev, 0, wx.ALL, 2)
+        next = wx.Button(panel, -1, "Next Difference")
+        next.Bind(wx.EVT_BUTTON, lambda evt: self.next_difference())
+        buttons.Add(next, 0, wx.ALL, 2)
+        self.status = wx.StaticText(panel, -1, "")
+        buttons.Add(self.status, 1, wx.ALIGN_CENTER_VERTICAL|wx.ALL, 4)
+
+        splitter = wx.SplitterWindow(panel, -1, style=wx.SP_LIVE_UPDATE)
+        self.grids = []
+        for i in range(2):
+            grid = HexEditControl(splitter, self, BinarySTC())
+            grid.EnableEditing(False)
+            grid.Bind(wx.EVT_SCROLLWIN, self._on_scroll)
+            grid.GetGridWindow().Bind(wx.EVT_MOUSEWHEEL, self._on_scroll)
+            self.grids.append(grid)
+        splitter.SplitVertically(self.grids[0], self.grids[1])
+        splitter.SetSashGravity(0.5)
+
+        sizer = wx.BoxSizer(wx.VERTICAL)
+        sizer.Add(buttons, 0, wx.EXPAND)
+        sizer.Add(splitter, 1, wx.EXPAND)
+        panel.SetSizer(sizer)
+        return panel
+
+    #### wx event handlers ####################################################
+
+    def _on_scroll(self, evt):
+        obj = evt.GetEventObject()
+        source = obj if obj in self.grids else obj.GetParent()
+        evt.Skip()
+        # The scroll position isn't updated until after the event is processed
+        wx.CallAfter(self.sync_scroll, source)
@@ -2,11 +2,11 @@
 # Licenced under the GPLv2; see http://peppy.flipturn.org for more info
 import os
 import struct
+import bisect
 
 import wx
 import wx.stc
 import wx.grid as Grid
-import wx.lib.newevent
 
 import logging
 log = logging.getLogger(__name__)
@@ -118,6 +118,9 @@ class HugeTable(Grid.PyGridTableBase):
         self._show_hex = True
         self._show_record_numbers = False
         self._col_labels = None
+        self.highlight_ranges = []
+        self.highlight_starts = []
+        self.highlight_attr = None
 
     def setFormat(self, format):
         if format:
@@ -187,13 +190,39 @@ class HugeTable(Grid.PyGridTableBase):
     def setSTC(self, stc):
         self.stc=stc
         log.debug("stc = %s" % self.stc        )
-        self._rows=((self.stc.GetLength()-1)/self.nbytes)+1
+        self._rows=self.GetNumberRowsForLength(self.stc.GetLength())
         log.debug(" rows=%d cols=%d" % (self._rows,self._cols))
 
-##    def GetAttr(self, row, col, kind):
-##        attr = [self.even, self.odd][row % 2]
-##        attr.IncRef()
-##        return attr
+    def setHighlightRanges(self, ranges, color=None):
+        """Highlight the cells containing any byte in the sorted list of
+        (start, end) byte ranges.
+        """
+        if color is None:
+            color = wx.Colour(255, 192, 192)
+        self.highlight_ranges = ranges
+        self.highlight_starts = [r[0] for r in ranges]
+        self.highlight_attr = Grid.GridCellAttr()
+        self.highlight_attr.SetBackgroundColour(color)
+
+    def isHighlighted(self, start, end):
+        index = bisect.bisect_right(self.highlight_starts, end - 1) - 1
+        return index >= 0 and self.highlight_ranges[index][1] > start
+
+    def GetAttr(self, row, col, kind):
+        if not self.highlight_ranges:
+            return None
+        start = row * self.nbytes
+        if col < self._hexcols:
+            start += col
+            end = start + 1
+        else:
+            col = self.getTextCol(col)
+            start += self.offsets[col]
+            end = start + self.sizes[col]
+        if self.isHighlighted(start, end):
+            self.highlight_attr.IncRef()
+            return self.highlight_attr
+        return None
 
     def getTextCol(self,col):
         return col-self._hexcols
@@ -343,6 +372,34 @@ class HugeTable(Grid.PyGridTableBase):
             del self._cache[row]
             self._cache_fifo.remove(row)
     
+    def invalidateCacheRows(self, first, last):
+        """Remove the cached data for all rows from first to last, inclusive
+        
+        The cache is small, so this is proportional to the size of the cache
+        rather than the number of rows in the range.
+        """
+        rows = [row for row in self._cache if first <= row <= last]
+        for row in rows:
+            self.invalidateCacheRow(row)
+    
+    def GetNumberRowsForLength(self, length):
+        return ((length - 1) / self.nbytes) + 1
+    
+    def UpdateRowCount(self, grid):
+        """Tell the grid about rows that have been added or removed because
+        the length of the data has changed.
+        """
+        oldrows = self._rows
+        self._rows = self.GetNumberRowsForLength(self.stc.GetLength())
+        if self._rows < oldrows:
+            msg = Grid.GridTableMessage(self, Grid.GRIDTABLE_NOTIFY_ROWS_DELETED, self._rows, oldrows - self._rows)
+            grid.ProcessTableMessage(msg)
+        elif self._rows > oldrows:
+            msg = Grid.GridTableMessage(self, Grid.GRIDTABLE_NOTIFY_ROWS_APPENDED, self._rows - oldrows)
+            grid.ProcessTableMessage(msg)
+        if self._rows != oldrows:
+            grid.AdjustScrollbars()
+    
     def getRowData(self, row):
         if len(self._cache_fifo) > self._cache_max:
             amt = self._cache_max / 8
@@ -791,28 +848,6 @@ class HexCellEditor(Grid.PyGridCellEditor,HexDigitMixin):
 
 
 
-# This creates a new Event class and a EVT binder function
-(WaitUpdateEvent, EVT_WAIT_UPDATE) = wx.lib.newevent.NewEvent()
-
-from threading import Thread
-class WaitThread(Thread):
-    def __init__(self, notify_window, delay=0.2):
-        Thread.__init__(self)
-        self._notify_window = notify_window
-        self._wait=1
-        self._delay=delay
-
-    def waitMore(self):
-        self._wait=2
-
-    def run(self):
-        while self._wait>0:
-            time.sleep(self._delay)
-            self._wait-=1
-        wx.PostEvent(self._notify_window,WaitUpdateEvent())
-
-
-
 class HexEditControl(Grid.Grid):
     """
     View for editing in hexidecimal notation.
@@ -852,29 +887,12 @@ class HexEditControl(Grid.Grid):
         self.Bind(Grid.EVT_GRID_CELL_RIGHT_CLICK, self.OnRightDown)
         self.Bind(Grid.EVT_GRID_SELECT_CELL, self.OnSelectCell)
         self.Bind(wx.EVT_KEY_DOWN, self.OnKeyDown)
-        self.Bind(EVT_WAIT_UPDATE,self.OnUnderlyingUpdate)
         self.Show(True)
 
     def createPostHook(self):
         self.buffer.startChangeDetection()
         self.Update(self.stc)
 
-    def createListenersPostHook(self):
-        # Thread stuff for the underlying change callback
-        self.waiting=None
-
-        # Multiple binds to the same handler, ie multiple HexEditModes
-        # trying to do self.stc.Bind(wx.stc.EVT_STC_MODIFIED,
-        # self.underlyingSTCChanged) don't work.  Need to use the
-        # event manager for multiple bindings.
-        if hasattr(self.stc, 'addModifyCallback'):
-            self.stc.addModifyCallback(self.underlyingSTCChanged)
-
-    def removeListenersPostHook(self):
-        if hasattr(self.stc, 'removeModifyCallback'):
-            log.debug("unregistering %s" % self.underlyingSTCChanged)
-            self.stc.removeModifyCallback(self.underlyingSTCChanged)
-        
     def Update(self, stc=None, format=None, col_labels=None):
         log.debug("Need to update grid")
         if stc is None:
@@ -885,20 +903,6 @@ class HexEditControl(Grid.Grid):
         except struct.error:
             self.editor.task.status_bar.message = "Bad record format: %s" % format
 
-    def OnUnderlyingUpdate(self, evt, loc=None):
-        """Data has changed in some other view, so we need to update
-        the grid and reset the grid's cursor to the updated position
-        if the location is given.
-        """
-        log.debug("OnUnderlyingUpdate: slow way of updating the grid -- updating the whole thing.")
-        log.debug(evt)
-
-        self.table.invalidateCache()
-        self.table.ResetView(self,self.table.stc) # FIXME: this is slow.  Put it in a thread or something.
-
-        if loc is not None:
-            self.GotoPos(loc)
-
     def OnRightDown(self, evt):
         log.debug(self.GetSelectedRows())
 
@@ -906,6 +910,22 @@ class HexEditControl(Grid.Grid):
         evt.Skip()
         wx.CallAfter(self.doUpdateUICallback)
 
+    def GetSelectedByteRange(self):
+        """Return the (start, end) byte range of the selected block of cells,
+        or None if there is no selection.
+        """
+        top_left = self.GetSelectionBlockTopLeft()
+        bottom_right = self.GetSelectionBlockBottomRight()
+        if not top_left or not bottom_right:
+            return None
+        table = self.table
+        start = table.getLoc(*top_left[0])
+        row, col = bottom_right[-1]
+        end = table.getLoc(row, col) + 1
+        if col >= table._hexcols:
+            end += table.sizes[table.getTextCol(col)] - 1
+        return start, min(end, self.stc.GetLength())
+
     def OnSelectCell(self, evt):
         evt.Skip()
         wx.CallAfter(self.doUpdateUICallback)
@@ -998,47 +1018,58 @@ class HexEditControl(Grid.Grid):
 
         return st
 
-    def underlyingSTCChanged(self,evt):
-        # Short-circuit this callback when we are editing this grid.
-        # The event is fired regardless of how the data is changed, so
-        # without some sort of check, the grid ends up getting
-        # modified twice.  If the current mode is in the active frame
-        # and it is the active major mode, we know that we are editing
-        # this grid by hand.
-        if self.frame.isTopWindow() and self.frame.getActiveMajorMode()==self:
-            log.debug("TopWindow!  Skipping underlyingSTCChanged!")
-            return
+    def underlyingSTCChanged(self, ranges, length_changed):
+        """Update the grid after changes to the bytes
         
-        # As the comment in the createWindow method noted, we have to
-        # screen for the events we're interested in because we're not
-        # allowed to change the events that self.stc sees.
-        etype=evt.GetModificationType()
-        if etype&wx.stc.STC_MOD_INSERTTEXT or etype&wx.stc.STC_MOD_DELETETEXT:
-            log.debug("""UnderlyingSTCChanged
-            Mod type:     %s
-            At position:  %d
-            Lines added:  %d
-            Text Length:  %d
-            Text:         %s\n""" % ( self.transModType(evt.GetModificationType()),
-                                      evt.GetPosition(),
-                                      evt.GetLinesAdded(),
-                                      evt.GetLength(),
-                                      repr(evt.GetText()) ))
-
-            #self.win.underlyingUpdate(self.stc,evt.GetPosition())
-            if self.waiting:
-                if self.waiting.isAlive():
-                    log.debug("found active wait thread")
-                    self.waiting.waitMore()
-                else:
-                    self.waiting.join()
-                    self.waiting=None
-                    log.debug("wait thread destroyed")
-                    # start a new thread below
-
-            # don't use an else here so that a new thread will be
-            # started if we just destroyed the old thread.
-            if not self.waiting:
-                log.debug("starting wait thread")
-                self.waiting=WaitThread(self)
-                self.waiting.start()
+        Only the cached rows that are affected by the change are invalidated,
+        and only the visible part of them is repainted.  Rows are added or
+        removed from the grid only if the length of the data has changed.
+        
+        @param ranges: list of (start, end) byte ranges that have changed,
+        as merged by the update scheduler
+        
+        @param length_changed: True if bytes have been inserted or deleted
+        """
+        table = self.table
+        rows = []
+        for start, end in ranges:
+            first_row = start // table.nbytes
+            last_row = (max(end, start + 1) - 1) // table.nbytes
+            table.invalidateCacheRows(first_row, last_row)
+            rows.append((first_row, last_row))
+        log.debug("underlyingSTCChanged: ranges=%s rows=%s length_changed=%s" % (ranges, rows, length_changed))
+        if length_changed:
+            # Rows past the new end of the data may still be in the cache
+            table.invalidateCacheRows(table.GetNumberRowsForLength(self.stc.GetLength()) - 1, table._rows)
+            table.UpdateRowCount(self)
+        for first_row, last_row in rows:
+            self.RefreshRows(first_row, last_row)
+    
+    def GetVisibleRows(self):
+        """Return the first and last rows that are at least partially visible
+        """
+        x, y = self.CalcUnscrolledPosition(0, 0)
+        w, h = self.GetGridWindow().GetClientSize()
+        first = self.YToRow(y)
+        last = self.YToRow(y + h)
+        if first < 0:
+            first = 0
+        if last < 0:
+            last = self.GetNumberRows() - 1
+        return first, last
+    
+    def RefreshRows(self, first_row, last_row):
+        """Repaint the visible part of the range of rows
+        """
+        first, last = self.GetVisibleRows()
+        first = max(first, first_row)
+        last = min(last, last_row)
+        if first > last:
+            return
+        top = self.CellToRect(first, 0)
+        bottom = self.CellToRect(last, 0)
+        x, y = self.CalcScrolledPosition(0, top.y)
+        w, h = self.GetGridWindow().GetClientSize()
+        rect = wx.Rect(0, y, w, bottom.y + bottom.height - top.y)
+        self.GetGridWindow().RefreshRect(rect, False)
+        self.GetGridRowLabelWindow().Refresh()
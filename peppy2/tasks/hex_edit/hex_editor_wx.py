@@ -1,4 +1,5 @@
 # Standard library imports.
+import os
 import sys
 from os.path import basename
 
@@ -8,8 +9,9 @@ import wx.stc
 import numpy as np
 
 # Enthought library imports.
-from traits.api import Bool, Event, Instance, File, Unicode, Property, provides
+from traits.api import Any, Bool, Event, Instance, File, Unicode, Property, provides
 from pyface.key_pressed_event import KeyPressedEvent
+from pyface.api import YES
 
 # Local imports.
 from peppy2.framework.editor import FrameworkEditor
@@ -17,6 +19,9 @@ from i_hex_editor import IHexEditor
 from grid_control import HexEditControl
 from peppy2.utils.wx.stcbase import PeppySTC
 from peppy2.utils.wx.stcbinary import BinarySTC
+from peppy2.utils.wx.update_scheduler import get_update_scheduler
+from peppy2.utils.file_guess import FileGuess
+from peppy2.utils.bitpyramid import get_cache_file
 
 @provides(IHexEditor)
 class HexEditor(FrameworkEditor):
@@ -33,6 +38,10 @@ class HexEditor(FrameworkEditor):
     changed = Event
 
     key_pressed = Event(KeyPressedEvent)
+    
+    #### 'HexEditor' interface ####
+    
+    bytestore = Any
 
     ###########################################################################
     # 'PythonEditor' interface.
@@ -46,21 +55,104 @@ class HexEditor(FrameworkEditor):
         """
         if guess is None:
             path = self.path
-            text = ''
+            self.bytestore.SetBinary('')
         else:
             metadata = guess.get_metadata()
             path = metadata.uri
-            text = guess.get_utf8()
+            self.attach_document(path, guess)
 
-        self.bytestore.SetBinary(text)
-        self.control.Update(self.bytestore)
         self.path = path
-        self.dirty = False
+        self.dirty = self.bytestore.GetModify()
+        self.update_views()
+    
+    def view_of(self, editor, **kwargs):
+        """ Create a new view of the data in the supplied editor
+        """
+        self.attach_document(editor.path, editor.document.guess)
+        self.path = editor.path
+        self.dirty = self.bytestore.GetModify()
+        self.update_views()
+    
+    def attach_document(self, path, guess):
+        """Use the byte store of the shared document for the file, loading the
+        file only if this is the first view of it.
+        """
+        registry = self.window.application.document_registry
+        self.document = registry.attach(path, self, guess)
+        if self.document.byte_store is None:
+            store = BinarySTC()
+            store.LoadFile(path)
+            self.document.byte_store = store
+            self.set_bytestore(store)
+            self.start_autosave(path)
+        else:
+            self.set_bytestore(self.document.byte_store)
+    
+    def set_bytestore(self, store):
+        scheduler = get_update_scheduler()
+        if self.bytestore is not None:
+            scheduler.remove_listener(self.bytestore, self.on_bytes_changed)
+        self.bytestore = store
+        self.control.stc = store
+        scheduler.add_listener(store, self.on_bytes_changed)
+    
+    def on_bytes_changed(self, ranges, length_changed):
+        """Called at most once per frame with the merged byte ranges of all
+        the changes since the last call, no matter which view made the changes.
+        """
+        self.control.underlyingSTCChanged(ranges, length_changed)
+        
+        # The dock panes only show the data of the active editor, and only
+        # the panes that have been shown need updating
+        if self is self.task.active_editor:
+            disassembly = self.get_pane_contents('hex_edit.mos6502_disasmbly_pane')
+            if disassembly is not None and ranges and ranges[0][0] < FileGuess.head_size:
+                disassembly.update(self.bytestore.data[:FileGuess.head_size])
+            byte_graphics = self.get_pane_contents('hex_edit.byte_graphics')
+            if byte_graphics is not None:
+                if length_changed:
+                    # Insertions and deletions create a new data array
+                    if self.bytestore.GetLength() > 0:
+                        byte_graphics.set_data(self.bytestore.data)
+                else:
+                    byte_graphics.update_ranges(ranges)
+            overview = self.get_pane_contents('hex_edit.overview')
+            if overview is not None:
+                overview.update_ranges(ranges, length_changed)
+        self.dirty = self.bytestore.GetModify()
+        self.changed = True
+    
+    def update_views(self):
+        self.control.Update(self.bytestore)
+        self.update_panes()
+    
+    def update_panes(self):
+        """Show the data in the dock panes that have been built; the others
+        get the data of the active editor when they are first shown.
+        """
+        disassembly = self.get_pane_contents('hex_edit.mos6502_disasmbly_pane')
+        if disassembly is not None:
+            # The disassembly is generated as text, so limit it to the start
+            # of the file rather than creating millions of lines for large
+            # files
+            disassembly.update(self.bytestore.data[:FileGuess.head_size])
         
-        self.disassembly.update(self.bytestore.data)
+        byte_graphics = self.get_pane_contents('hex_edit.byte_graphics')
+        if byte_graphics is not None and self.bytestore.GetLength() > 0:
+            byte_graphics.set_data(self.bytestore.data, self.get_byte_graphics_cache_file(byte_graphics.bytes_per_row))
         
-        if len(text) > 0:
-            self.byte_graphics.set_data(self.bytestore.data)
+        overview = self.get_pane_contents('hex_edit.overview')
+        if overview is not None:
+            overview.set_store(self.bytestore)
+
+    def get_byte_graphics_cache_file(self, bytes_per_row):
+        """Cache file for the byte graphics pyramid, which is only usable if
+        the data hasn't been modified since it was loaded.
+        """
+        if self.dirty or not self.path:
+            return None
+        cache_dir = os.path.join(self.window.application.cache_dir, "bitview")
+        return get_cache_file(cache_dir, self.path, bytes_per_row)
 
     def save(self, path=None):
         """ Saves the contents of the editor.
@@ -68,11 +160,84 @@ class HexEditor(FrameworkEditor):
         if path is None:
             path = self.path
 
-        f = file(path, 'w')
-        f.write(self.control.GetTextUTF8())
-        f.close()
-
-        self.dirty = False
+        self.bytestore.SaveFile(path)
+        service = self.get_autosave_service()
+        if service is not None:
+            service.saved(self.bytestore, path)
+        if self.document is not None and path != self.document.path:
+            registry = self.window.application.document_registry
+            registry.rename(self.document.path, path)
+        
+        # Saving may have remapped the file, so all views of the document must
+        # use the new data array
+        views = self.document.views if self.document is not None else [self]
+        for view in views:
+            view.update_views()
+            if isinstance(view, HexEditor):
+                # Other views, like comparisons, aren't editing the file
+                view.dirty = False
+                view.path = path
+    
+    def destroy(self):
+        get_update_scheduler().remove_listener(self.bytestore, self.on_bytes_changed)
+        self.detach_document()
+        super(HexEditor, self).destroy()
+    
+    def detach_document(self):
+        if self.document is not None:
+            registry = self.window.application.document_registry
+            if registry.detach(self.document, self):
+                # Last view of the file, so the data can be released
+                service = self.get_autosave_service()
+                if service is not None:
+                    service.unregister(self.bytestore)
+            self.document = None
+    
+    def get_memory_size(self):
+        return self.bytestore.GetLength()
+    
+    def get_view_position(self):
+        grid = self.control
+        return {'top': grid.GetViewStart()[1],
+                'pos': grid.table.getLoc(grid.GetGridCursorRow(), grid.GetGridCursorCol()),
+                }
+    
+    def set_view_position(self, data):
+        grid = self.control
+        if 'pos' in data and self.bytestore.GetLength() > 0:
+            grid.GotoPos(min(data['pos'], self.bytestore.GetLength() - 1))
+        if 'top' in data:
+            grid.Scroll(-1, data['top'])
+    
+    def release_data(self):
+        self.detach_document()
+        self.set_bytestore(BinarySTC())
+        
+        # Only the grid belongs to this editor; the dock panes are showing
+        # the active editor
+        self.control.Update(self.bytestore)
+    
+    def reload_data(self):
+        self.attach_document(self.path, None)
+        self.update_views()
+    
+    def get_autosave_service(self):
+        return self.window.application.plugin_data.get('autosave')
+    
+    def start_autosave(self, path):
+        """Journal changes to the file, offering to recover any changes left
+        over from a previous crash.
+        """
+        service = self.get_autosave_service()
+        if service is None:
+            return
+        service.register(self.bytestore, path)
+        if service.is_recoverable(path):
+            message = "Unsaved changes to %s were found from a previous session.  Recover them?" % path
+            if self.window.confirm(message=message, title="Recover Unsaved Changes") == YES:
+                service.recover(self.bytestore, path)
+                return
+        service.discard(path)
     
     def undo(self):
         self.bytestore.Undo()
@@ -93,17 +258,14 @@ class HexEditor(FrameworkEditor):
         """ Creates the toolkit-specific control for the widget. """
 
         # Base-class constructor.
-        self.bytestore = stc = BinarySTC()
+        stc = BinarySTC()
         self.control = HexEditControl(parent, self, stc)
+        self.set_bytestore(stc)
 
         ##########################################
         # Events.
         ##########################################
 
-        # Get related controls
-        self.disassembly = self.window.get_dock_pane('hex_edit.mos6502_disasmbly_pane').control
-        self.byte_graphics = self.window.get_dock_pane('hex_edit.byte_graphics').control
-
         # Load the editor's contents.
         self.load()
 
@@ -0,0 +1,125 @@
+import wx
+
+import numpy as np
+
+from peppy2.utils.entropy import OverviewJob
+from peppy2.utils.jobs import get_global_job_manager
+
+import logging
+log = logging.getLogger(__name__)
+
+
+class OverviewStrip(wx.Panel):
+    """Vertical strip showing the entropy and byte classes of the whole file
+
+    Each row of pixels represents an equal share of the file.  The hue shows
+    the dominant class of bytes (zeros, ASCII text, bytes above 127, or other
+    control bytes) and the brightness shows the entropy.  Regions that look
+    random, as compressed or encrypted data do, are highlighted.  Clicking on
+    the strip moves the cursor of the active editor to that part of the file.
+    """
+    zero_color = np.array([0, 0, 160], dtype=np.float64)
+    ascii_color = np.array([0, 170, 0], dtype=np.float64)
+    high_color = np.array([200, 90, 0], dtype=np.float64)
+    other_color = np.array([140, 140, 140], dtype=np.float64)
+    random_color = np.array([255, 0, 255], dtype=np.float64)
+
+    # Entropy in bits per byte above which data is considered random
+    random_threshold = 7.5
+
+    def __init__(self, parent, task):
+        self.task = task
+        self.store = None
+        self.pyramid = None
+        self.job = None
+
+        wx.Panel.__init__(self, parent, -1, style=wx.FULL_REPAINT_ON_RESIZE)
+        self.SetMinSize((40, -1))
+        self.Bind(wx.EVT_PAINT, self.OnPaint)
+        self.Bind(wx.EVT_LEFT_DOWN, self.OnLeftDown)
+
+    def set_task(self, task):
+        self.task = task
+
+    def set_store(self, store):
+        """Show the overview of the byte store, starting a job to compute the
+        statistics if needed.
+        """
+        if store is not self.store or self.pyramid is None or self.pyramid.size != store.GetLength():
+            self.store = store
+            self.pyramid = None
+            self.start_job()
+        self.Refresh()
+
+    def start_job(self):
+        if self.store is None or self.store.GetLength() == 0:
+            return
+        self.job = OverviewJob(self.store.data, self.on_job_finished)
+        manager = get_global_job_manager()
+        if manager is None:
+            self.job._start(None)
+            self.job.success_callback()
+        else:
+            manager.add_job(self.job)
+
+    def on_job_finished(self, job):
+        if job is not self.job:
+            # Superseded by a later job
+            return
+        self.job = None
+        self.pyramid = job.pyramid
+        if self.pyramid.size != self.store.GetLength():
+            # Bytes were inserted or deleted while the job was running
+            self.start_job()
+        self.Refresh()
+
+    def update_ranges(self, ranges, length_changed):
+        """Update the statistics for changed bytes of the current store"""
+        if length_changed:
+            self.pyramid = None
+            self.start_job()
+        elif self.pyramid is not None:
+            for start, end in ranges:
+                self.pyramid.update(self.store.data, start, end)
+        self.Refresh()
+
+    def get_colors(self, height):
+        """Return an (height, 3) array of the color of each row of pixels
+        """
+        level = self.pyramid.get_level_for(height)
+        index = (np.arange(height) * len(level)) // height
+        e = level.entropy[index]
+        zero = level.zero[index]
+        ascii = level.ascii[index]
+        high = level.high[index]
+        other = np.clip(1.0 - zero - ascii - high, 0.0, 1.0)
+        dominant = np.argmax(np.vstack((zero, ascii, high, other)), axis=0)
+        palette = np.vstack((self.zero_color, self.ascii_color, self.high_color, self.other_color))
+        colors = palette[dominant] * (0.3 + 0.7 * e / 8.0)[:, np.newaxis]
+        colors[e > self.random_threshold] = self.random_color
+        return colors.astype(np.uint8)
+
+    def OnPaint(self, evt):
+        dc = wx.PaintDC(self)
+        w, h = self.GetClientSizeTuple()
+        dc.SetBackground(wx.Brush(self.GetBackgroundColour()))
+        dc.Clear()
+        if self.pyramid is None or w <= 0 or h <= 0:
+            if self.job is not None:
+                dc.DrawText("...", 2, 2)
+            return
+        rgb = np.empty((h, w, 3), dtype=np.uint8)
+        rgb[:] = self.get_colors(h)[:, np.newaxis, :]
+        bmp = wx.BitmapFromBuffer(w, h, rgb.tostring())
+        dc.DrawBitmap(bmp, 0, 0)
+
+    def OnLeftDown(self, evt):
+        editor = self.task.active_editor
+        if self.pyramid is None or editor is None or getattr(editor, "bytestore", None) is not self.store:
+            return
+        w, h = self.GetClientSizeTuple()
+        size = self.store.GetLength()
+        if h > 0 and size > 0:
+            offset = min(evt.GetY() * size / h, size - 1)
+            editor.control.GotoPos(offset)
+            editor.control.SetFocus()
@@ -2,25 +2,25 @@
 
 """
 # Enthought library imports.
-from pyface.tasks.api import DockPane, TraitsDockPane
 from traits.api import on_trait_change
 
-# Local imports.
-from mos6502 import MOS6502Disassembly
-from peppy2.utils.wx.bitviewscroller import BitviewScroller
+# Local imports.  The modules of the pane contents are imported when the
+# panes are first shown.
+from peppy2.dock_panes import LazyDockPane
 
 import logging
 log = logging.getLogger(__name__)
 
 
 
-class MOS6502DisassemblyPane(DockPane):
+class MOS6502DisassemblyPane(LazyDockPane):
     #### TaskPane interface ###################################################
 
     id = 'hex_edit.mos6502_disasmbly_pane'
     name = '6502 Disassembly'
     
-    def create_contents(self, parent):
+    def create_lazy_contents(self, parent):
+        from mos6502 import MOS6502Disassembly
         control = MOS6502Disassembly(parent, self.task)
         return control
     
@@ -28,16 +28,87 @@ class MOS6502DisassemblyPane(DockPane):
     
     def _task_changed(self):
         log.debug("TASK CHANGED IN MERGEPOINTSPANE!!!! %s" % self.task)
-        if self.control:
-            self.control.set_task(self.task)
+        if self.contents:
+            self.contents.set_task(self.task)
 
 
-class ByteGraphicsPane(DockPane):
+class ByteGraphicsPane(LazyDockPane):
     #### TaskPane interface ###################################################
 
     id = 'hex_edit.byte_graphics'
     name = 'Byte Graphics'
     
-    def create_contents(self, parent):
+    def create_lazy_contents(self, parent):
+        from peppy2.utils.wx.bitviewscroller import BitviewScroller
         control = BitviewScroller(parent)
         return control
+
+
+
+class OverviewPane(LazyDockPane):
+    #### TaskPane interface ###################################################
+
+    id = 'hex_edit.overview'
+    name = 'Overview'
+    
+    #### DockPane interface ###################################################
+    
+    # Where the pane is docked when it's first shown, because it isn't in
+    # the task's default layout
+    dock_area = 'right'
+    
+    def create_lazy_contents(self, parent):
+        from overview_panel import OverviewStrip
+        control = OverviewStrip(parent, self.task)
+        return control
+    
+    #### trait change handlers
+    
+    def _task_changed(self):
+        if self.contents:
+            self.contents.set_task(self.task)
+
+
+class SearchPane(LazyDockPane):
+    #### TaskPane interface ###################################################
+
+    id = 'hex_edit.search'
+    name = 'Search'
+    
+    #### DockPane interface ###################################################
+    
+    dock_area = 'bottom'
+    
+    def create_lazy_contents(self, parent):
+        from search_panel import SearchPanel
+        control = SearchPanel(parent, self.task)
+        return control
+    
+    #### trait change handlers
+    
+    def _task_changed(self):
+        if self.contents:
+            self.contents.set_task(self.task)
+
+
+
+class ChecksumPane(LazyDockPane):
+    #### TaskPane interface ###################################################
+
+    id = 'hex_edit.checksum'
+    name = 'Checksums'
+    
+    #### DockPane interface ###################################################
+    
+    dock_area = 'right'
+    
+    def create_lazy_contents(self, parent):
+        from checksum_panel import ChecksumPanel
+        control = ChecksumPanel(parent, self.task)
+        return control
+    
+    #### trait change handlers
+    
+    def _task_changed(self):
+        if self.contents:
+            self.contents.set_task(self.task)
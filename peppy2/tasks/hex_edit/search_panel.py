@@ -0,0 +1,151 @@
+import bisect
+
+import wx
+
+from peppy2.utils.binsearch import get_pattern, search_modes, SearchJob, SearchError
+from peppy2.utils.jobs import get_global_job_manager
+
+import logging
+log = logging.getLogger(__name__)
+
+
+class SearchResultsList(wx.ListCtrl):
+    """Virtual list of match offsets, so millions of hits can be displayed
+    """
+    preview_length = 16
+
+    def __init__(self, parent):
+        wx.ListCtrl.__init__(self, parent, -1, style=wx.LC_REPORT|wx.LC_VIRTUAL|wx.LC_SINGLE_SEL)
+        self.InsertColumn(0, "Offset")
+        self.InsertColumn(1, "Bytes")
+        self.SetColumnWidth(0, 100)
+        self.SetColumnWidth(1, 300)
+        self.clear(None)
+
+    def clear(self, data):
+        self.data = data
+        self.hit_arrays = []
+        # Index of the first hit of each array
+        self.hit_starts = []
+        self.num_hits = 0
+        self.SetItemCount(0)
+
+    def add_hits(self, hits):
+        if hits.size > 0:
+            self.hit_arrays.append(hits)
+            self.hit_starts.append(self.num_hits)
+            self.num_hits += hits.size
+            self.SetItemCount(self.num_hits)
+
+    def get_offset(self, index):
+        i = bisect.bisect_right(self.hit_starts, index) - 1
+        return int(self.hit_arrays[i][index - self.hit_starts[i]])
+
+    def OnGetItemText(self, item, col):
+        offset = self.get_offset(item)
+        if col == 0:
+            return "%08x" % offset
+        preview = self.data[offset:offset + self.preview_length]
+        return " ".join("%02x" % b for b in preview)
+
+
+class SearchPanel(wx.Panel):
+    """Find all occurrences of a pattern in the active hex editor
+
+    The search runs as a job on a background thread and the hits are added to
+    the list as each chunk of the data is searched.
+    """
+    def __init__(self, parent, task):
+        self.task = task
+        self.job = None
+        self.job_count = 0
+
+        wx.Panel.__init__(self, parent)
+
+        # Mac/Win needs this, otherwise background color is black
+        attr = self.GetDefaultAttributes()
+        self.SetBackgroundColour(attr.colBg)
+
+        self.text = wx.TextCtrl(self, -1, style=wx.TE_PROCESS_ENTER)
+        self.mode = wx.Choice(self, -1, choices=search_modes)
+        self.mode.SetSelection(0)
+        self.ignore_case = wx.CheckBox(self, -1, "Ignore case")
+        self.button = wx.Button(self, -1, "Find All")
+        self.status = wx.StaticText(self, -1, "")
+        self.results = SearchResultsList(self)
+
+        row = wx.BoxSizer(wx.HORIZONTAL)
+        row.Add(self.text, 1, wx.EXPAND)
+        row.Add(self.mode, 0, wx.LEFT, 4)
+        row.Add(self.button, 0, wx.LEFT, 4)
+        self.sizer = wx.BoxSizer(wx.VERTICAL)
+        self.sizer.Add(row, 0, wx.EXPAND|wx.ALL, 2)
+        self.sizer.Add(self.ignore_case, 0, wx.ALL, 2)
+        self.sizer.Add(self.status, 0, wx.EXPAND|wx.ALL, 2)
+        self.sizer.Add(self.results, 1, wx.EXPAND)
+        self.SetSizer(self.sizer)
+        self.sizer.Layout()
+        self.Fit()
+
+        self.text.Bind(wx.EVT_TEXT_ENTER, self.on_find)
+        self.button.Bind(wx.EVT_BUTTON, self.on_find)
+        self.results.Bind(wx.EVT_LIST_ITEM_ACTIVATED, self.on_activated)
+
+    def set_task(self, task):
+        self.task = task
+
+    def focus(self):
+        self.text.SetFocus()
+        self.text.SelectAll()
+
+    def on_find(self, evt):
+        if self.job is not None:
+            self.stop()
+            return
+        editor = self.task.active_editor
+        if editor is None or not hasattr(editor, "bytestore"):
+            return
+        try:
+            pattern = get_pattern(self.text.GetValue(), self.mode.GetStringSelection(), self.ignore_case.GetValue())
+        except SearchError, e:
+            self.status.SetLabel(str(e))
+            return
+        data = editor.bytestore.data
+        self.results.clear(data)
+        self.job_count += 1
+        self.job = SearchJob("search-%d" % self.job_count, data, pattern)
+        manager = get_global_job_manager()
+        if manager is None:
+            # No job threads available, so search synchronously
+            self.job._start(self)
+            return
+        manager.register_job_id_callback(self.job.job_id, self.on_progress)
+        self.button.SetLabel("Stop")
+        manager.add_job(self.job)
+
+    def _progress_update(self, report):
+        """Receives the search progress when there's no job manager"""
+        self.on_progress(report)
+
+    def stop(self):
+        self.job.cancel()
+
+    def on_progress(self, report):
+        if self.job is None or report.job_id != self.job.job_id:
+            # Late report from a previous search
+            return
+        pos, hits = report.report
+        self.results.add_hits(hits)
+        size = self.job.data.size
+        if report.is_finished():
+            self.status.SetLabel("%d matches for %s" % (self.results.num_hits, self.job.pattern))
+            self.job = None
+            self.button.SetLabel("Find All")
+        else:
+            percent = 100 * pos / size if size > 0 else 100
+            self.status.SetLabel("%d matches, %d%% searched" % (self.results.num_hits, percent))
+
+    def on_activated(self, evt):
+        editor = self.task.active_editor
+        if editor is not None and getattr(editor, "bytestore", None) is not None and editor.bytestore.data is self.results.data:
+            editor.control.GotoPos(self.results.get_offset(evt.GetIndex()))
@@ -1,6 +1,8 @@
 """ Text editor sample task
 
 """
+import os
+
 # Enthought library imports.
 from pyface.api import ImageResource, ConfirmationDialog, FileDialog, \
     ImageResource, YES, OK, CANCEL
@@ -8,13 +10,41 @@ from pyface.action.api import Action
 from pyface.tasks.api import Task, TaskWindow, TaskLayout, PaneItem, IEditor, \
     IEditorAreaPane, EditorAreaPane, Editor, DockPane, HSplitter, VSplitter
 from pyface.tasks.action.api import DockPaneToggleGroup, SMenuBar, \
-    SMenu, SToolBar, TaskAction, TaskToggleGroup
+    SMenu, SToolBar, TaskAction, EditorAction, TaskToggleGroup
 from traits.api import on_trait_change, Property, Instance
 
 from peppy2.framework.task import FrameworkTask
+from peppy2.utils.bitpyramid import prebuild_cache
 from hex_editor import HexEditor
+from compare_editor import HexCompareEditor
 from preferences import HexEditPreferences
-from panes import MOS6502DisassemblyPane, ByteGraphicsPane
+from panes import MOS6502DisassemblyPane, ByteGraphicsPane, OverviewPane, SearchPane, ChecksumPane
+
+
+class FindAllAction(TaskAction):
+    name = 'Find All...'
+    accelerator = 'Ctrl+F'
+    tooltip = 'Find all occurrences of bytes or text'
+
+    def perform(self, event):
+        pane = self.task.window.get_dock_pane('hex_edit.search')
+        pane.visible = True
+        pane.build_contents().focus()
+
+
+class CompareAction(EditorAction):
+    name = 'Compare With...'
+    tooltip = 'Compare the current file with another file'
+
+    def perform(self, event):
+        dialog = FileDialog(parent=event.task.window.control)
+        if dialog.open() == OK:
+            source = self.active_editor
+            editor = HexCompareEditor()
+            event.task.editor_area.add_editor(editor)
+            event.task.editor_area.activate_editor(editor)
+            editor.compare(source, dialog.path)
+
 
 class HexEditTask(FrameworkTask):
     """ A simple task for opening a blank editor.
@@ -28,12 +58,17 @@ class HexEditTask(FrameworkTask):
     name = 'Hex Editor'
     
     preferences_helper = HexEditPreferences
+    
+    # Files larger than this have their byte graphics cached on disk
+    byte_graphics_cache_min_size = 4 * 1024 * 1024
 
     ###########################################################################
     # 'Task' interface.
     ###########################################################################
 
     def _default_layout_default(self):
+        # The overview, checksum and search panes aren't in the layout so
+        # they start hidden and aren't built until the user shows them
         return TaskLayout(
             right=HSplitter(
                 PaneItem('hex_edit.mos6502_disasmbly_pane'),
@@ -47,6 +82,9 @@ class HexEditTask(FrameworkTask):
         return [
             MOS6502DisassemblyPane(),
             ByteGraphicsPane(),
+            OverviewPane(),
+            SearchPane(),
+            ChecksumPane(),
             ]
 
 
@@ -54,6 +92,16 @@ class HexEditTask(FrameworkTask):
     # 'FrameworkTask' interface.
     ###########################################################################
 
+    def get_actions(self, location, menu_name, group_name):
+        if location == "Menu" and menu_name == "Edit" and group_name == "FindGroup":
+            return [
+                FindAllAction(),
+                ]
+        if location == "Menu" and menu_name == "File" and group_name == "OpenGroup":
+            actions = super(HexEditTask, self).get_actions(location, menu_name, group_name)
+            return actions + [CompareAction()]
+        return super(HexEditTask, self).get_actions(location, menu_name, group_name)
+
     def get_editor(self, guess=None):
         """ Opens a new empty window
         """
@@ -64,3 +112,10 @@ class HexEditTask(FrameworkTask):
     @classmethod
     def can_edit(cls, mime):
         return mime == "application/octet-stream"
+
+    @classmethod
+    def prewarm_file(cls, path, cache_dir):
+        # Smaller files don't use the cache; their byte graphics are quick to
+        # compute when the file is opened
+        if os.path.getsize(path) > cls.byte_graphics_cache_min_size:
+            prebuild_cache(os.path.join(cache_dir, "bitview"), path)
@@ -6,12 +6,17 @@ from os.path import basename
 import wx
 
 # Enthought library imports.
-from traits.api import Bool, Event, Instance, File, Unicode, Property, provides
+from traits.api import Any, Bool, Event, Float, Instance, File, Unicode, Property, provides
 from pyface.tasks.api import Editor
 
 # Local imports.
 from i_bitmap_editor import IBitmapEditor
 from peppy2.utils.wx.bitmapscroller import BitmapScroller
+from peppy2.utils.jobs import get_global_job_manager
+from peppy2.utils.rawimage import RawImageError, open_pnm, pnm_mime_types
+from image_loader import ImageDecodeJob
+
+job_count = 0
 
 @provides(IBitmapEditor)
 class BitmapEditor(Editor):
@@ -30,6 +35,15 @@ class BitmapEditor(Editor):
     name = Property(Unicode, depends_on='path')
 
     tooltip = Property(Unicode, depends_on='path')
+    
+    # ImageDecodeJob while the image is being decoded
+    job = Any
+    
+    # Size of the displayed preview relative to the full image
+    preview_scale = Float(1.0)
+    
+    # Shared document from the application's document registry
+    document = Any
 
     #### Events ####
 
@@ -51,18 +65,104 @@ class BitmapEditor(Editor):
     def load(self, guess=None):
         """ Loads the contents of the editor.
         """
-        img = wx.EmptyImage(1,1)
+        self.job = None
         if guess is None:
             path = self.path
+            self.control.setImage(wx.EmptyImage(1,1))
         else:
             metadata = guess.get_metadata()
             path = metadata.uri
-            if not img.LoadMimeStream(guess.get_stream(), metadata.mime):
+            if self.attach_document(path, guess):
+                return
+            if metadata.mime in pnm_mime_types and self.load_pnm(path):
+                return
+            self.start_decode(path, metadata.mime)
+        self.dirty = False
+    
+    def attach_document(self, path, guess):
+        """Attach to the document shared by all the image views of the file,
+        showing its image if another view has already loaded it.
+        
+        Returns True if the image is shown.
+        """
+        registry = self.editor_area.task.window.application.document_registry
+        self.document = registry.attach(path, self, guess)
+        image = self.document.image
+        if image is None:
+            return False
+        if isinstance(image, wx.Image):
+            self.control.setImage(image)
+        else:
+            self.control.setSource(image)
+        self.dirty = False
+        return True
+    
+    def detach_document(self):
+        if self.document is not None:
+            registry = self.editor_area.task.window.application.document_registry
+            registry.detach(self.document, self)
+            self.document = None
+    
+    def load_pnm(self, path):
+        """Memory map a binary PBM/PGM/PPM file.  Returns False for ASCII
+        files, which have to be decoded.
+        """
+        try:
+            source = open_pnm(path)
+        except RawImageError:
+            return False
+        self.control.setSource(source)
+        if self.document is not None:
+            self.document.image = source
+        self.dirty = False
+        return True
+    
+    def load_source(self, path, source):
+        """Display an image source, e.g. a RawImageSource for a headerless
+        raw image
+        """
+        self.job = None
+        self.path = path
+        self.control.setSource(source)
+        self.dirty = False
+    
+    def start_decode(self, path, mime):
+        """Decode the image on a job thread, showing a preview if possible
+        """
+        global job_count
+        job_count += 1
+        self.job = ImageDecodeJob("decode-%d" % job_count, path, mime)
+        manager = get_global_job_manager()
+        if manager is None:
+            self.job._start(self)
+            return
+        manager.register_job_id_callback(self.job.job_id, self.on_decode_progress)
+        manager.add_job(self.job)
+    
+    def _progress_update(self, report):
+        """Receives the decoded images when there's no job manager"""
+        self.on_decode_progress(report)
+    
+    def on_decode_progress(self, report):
+        if self.job is None or report.job_id != self.job.job_id or self.control is None:
+            # Superseded by another load or the editor has been closed
+            return
+        decoded = report.report
+        if report.is_finished():
+            self.job = None
+            img = decoded.image
+            if img is None:
                 #raise TypeError("Bad image -- either it really isn't an image, or wxPython doesn't support the image format.")
                 img = wx.EmptyImage(1,1)
-
-        self.control.setImage(img)
-        self.dirty = False
+            elif self.document is not None:
+                self.document.image = img
+            # Keep the apparent size of the preview
+            zoom = self.control.zoom / self.preview_scale
+            self.preview_scale = 1.0
+            self.control.setImage(img, zoom=zoom)
+        else:
+            self.preview_scale = decoded.scale
+            self.control.setImage(decoded.image, zoom=self.control.zoom * decoded.scale)
 
     def save(self, path=None):
         """ Saves the contents of the editor.
@@ -74,6 +174,10 @@ class BitmapEditor(Editor):
 
         self.dirty = False
 
+    def destroy(self):
+        self.detach_document()
+        super(BitmapEditor, self).destroy()
+
     ###########################################################################
     # Trait handlers.
     ###########################################################################
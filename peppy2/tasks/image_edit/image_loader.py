@@ -0,0 +1,90 @@
+"""Image decoding on a job thread
+
+Decoding large images can take seconds, so it's done on a job thread while
+the editor stays responsive.  If PIL is available and can decode a reduced
+size version of the image quickly (e.g. JPEG draft mode), a preview is sent
+to the editor before the full resolution image.
+"""
+import wx
+
+from peppy2.utils.jobs import ThreadJob, ProgressReport, Finished
+
+try:
+    from PIL import Image as PILImage
+except ImportError:
+    PILImage = None
+
+import logging
+log = logging.getLogger(__name__)
+
+
+class DecodedImage(object):
+    """A stage of the decoded image
+
+    scale is the size of the image relative to the full resolution image,
+    which is less than 1 for previews.  image is None if the full resolution
+    image couldn't be decoded.
+    """
+    def __init__(self, image, scale=1.0):
+        self.image = image
+        self.scale = scale
+
+
+def get_preview(path, size):
+    """Return a DecodedImage with a preview no larger than about size pixels
+    on a side, or None if PIL isn't available or can't produce the preview
+    much faster than decoding the whole image.
+    """
+    if PILImage is None:
+        return None
+    try:
+        pil = PILImage.open(path)
+        full_width = pil.size[0]
+        pil.draft("RGB", (size, size))
+        if max(pil.size) > size * 2:
+            # Draft mode isn't supported, so the preview would need a full
+            # decode anyway
+            return None
+        pil = pil.convert("RGB")
+        pil.thumbnail((size, size))
+        tobytes = getattr(pil, "tobytes", None) or pil.tostring
+        img = wx.EmptyImage(pil.size[0], pil.size[1])
+        img.SetData(tobytes())
+    except Exception, e:
+        log.debug("No preview for %s: %s" % (path, e))
+        return None
+    return DecodedImage(img, float(pil.size[0]) / full_width)
+
+
+class ImageDecodeJob(ThreadJob):
+    """Decode an image file, sending a ProgressReport with the preview if
+    there is one and a Finished report with the full resolution image.
+
+    Both reports hold DecodedImage instances.  The Finished report is always
+    sent, with no image if the file couldn't be decoded.
+    """
+    def __init__(self, job_id, path, mime, preview_size=1024):
+        ThreadJob.__init__(self, job_id)
+        self.path = path
+        self.mime = mime
+        self.preview_size = preview_size
+
+    def get_name(self):
+        return "decode %s" % self.path
+
+    def _start(self, dispatcher):
+        preview = get_preview(self.path, self.preview_size)
+        if preview is not None:
+            dispatcher._progress_update(ProgressReport(self.job_id, preview))
+        try:
+            img = wx.EmptyImage(1, 1)
+            with open(self.path, "rb") as fh:
+                if not img.LoadMimeStream(fh, self.mime):
+                    img = None
+        except Exception, e:
+            # The editor is waiting for the Finished report, so it must be
+            # sent even if the decoder fails
+            self.error = str(e)
+            log.error("Failed decoding %s: %s" % (self.path, e))
+            img = None
+        dispatcher._progress_update(Finished(self.job_id, DecodedImage(img)))
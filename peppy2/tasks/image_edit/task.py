@@ -1,19 +1,72 @@
 """Image editor sample task
 
 """
+# Standard library imports.
+import os
+
 # Enthought library imports.
-from pyface.api import ImageResource
+from pyface.api import ImageResource, FileDialog, OK
 from pyface.tasks.api import Task, TaskWindow, TaskLayout, PaneItem, IEditor, \
     IEditorAreaPane, EditorAreaPane, Editor, DockPane, HSplitter, VSplitter
 from pyface.tasks.action.api import DockPaneToggleGroup, SMenuBar, \
     SMenu, SToolBar, TaskAction, TaskToggleGroup
-from traits.api import on_trait_change, Property, Instance
+from traits.api import on_trait_change, Property, Instance, HasTraits, Int, Enum
+from traitsui.api import View, Item, OKCancelButtons
 
 
 from peppy2.framework.task import FrameworkTask
 from panes import Pane1, Pane2, Pane3
 from bitmap_editor import BitmapEditor
 from preferences import ImageEditPreferences
+from peppy2.utils.rawimage import RawImageFormat, RawImageSource, RawImageError, pixel_format_names, pnm_mime_types
+
+
+class RawImageSettings(HasTraits):
+    """Layout of the pixels of a headerless raw image file"""
+    width = Int(1)
+    height = Int(1)
+    offset = Int(0)
+    stride = Int(0, desc="bytes per row, or 0 if the rows are packed")
+    pixel_format = Enum(*pixel_format_names)
+
+    traits_view = View(
+        Item('pixel_format'),
+        Item('width'),
+        Item('height'),
+        Item('offset'),
+        Item('stride'),
+        title="Raw Image Format",
+        buttons=OKCancelButtons)
+
+    def get_format(self):
+        return RawImageFormat(self.width, self.height, self.pixel_format, self.offset, self.stride or None)
+
+
+class OpenRawImageAction(TaskAction):
+    name = 'Open Raw Image...'
+    tooltip = 'View a headerless image file by specifying its pixel layout'
+
+    def perform(self, event):
+        window = event.task.window
+        dialog = FileDialog(parent=window.control)
+        if dialog.open() != OK:
+            return
+        path = dialog.path
+        guess = RawImageFormat.guess(os.path.getsize(path))
+        settings = RawImageSettings(width=guess.width, height=guess.height)
+        ui = settings.edit_traits(parent=window.control, kind='livemodal')
+        if not ui.result:
+            return
+        try:
+            source = RawImageSource(path, settings.get_format())
+        except (RawImageError, IOError), e:
+            window.error(str(e), "Can't Open Raw Image")
+            return
+        editor = BitmapEditor()
+        event.task.editor_area.add_editor(editor)
+        event.task.editor_area.activate_editor(editor)
+        editor.load_source(path, source)
+
 
 class ImageEditTask(FrameworkTask):
     """ A simple task for opening a blank editor.
@@ -45,6 +98,12 @@ class ImageEditTask(FrameworkTask):
         """
         return [ Pane1(), Pane2(), Pane3() ]
 
+    def get_actions(self, location, menu_name, group_name):
+        if location == "Menu" and menu_name == "File" and group_name == "OpenGroup":
+            actions = super(ImageEditTask, self).get_actions(location, menu_name, group_name)
+            return actions + [OpenRawImageAction()]
+        return super(ImageEditTask, self).get_actions(location, menu_name, group_name)
+
     ###########################################################################
     # 'FrameworkTask' interface.
     ###########################################################################
@@ -58,4 +117,4 @@ class ImageEditTask(FrameworkTask):
     ###
     @classmethod
     def can_edit(cls, mime):
-        return mime == "image/jpeg" or mime == "image/png"
+        return mime == "image/jpeg" or mime == "image/png" or mime in pnm_mime_types
@@ -25,6 +25,7 @@ from pyface.util.python_stc import PythonSTC, faces
 
 # Local imports.
 from peppy2.framework.editor import FrameworkEditor
+from peppy2.utils.file_guess import FileGuess
 from i_styled_text_editor import IStyledTextEditor
 from pyface.key_pressed_event import KeyPressedEvent
 
@@ -58,16 +59,38 @@ class StyledTextEditor(FrameworkEditor):
         """
         if guess is None:
             path = self.path
-            text = ''
+            self.control.SetTextUTF8('')
+            self.control.EmptyUndoBuffer()
         else:
             metadata = guess.get_metadata()
             path = metadata.uri
-            text = guess.get_utf8()
+            self.attach_document(path, guess)
 
-        self.control.SetTextUTF8(text)
-        self.control.EmptyUndoBuffer()
         self.path = path
-        self.dirty = False
+        self.dirty = self.control.CanUndo()
+        self.can_undo = self.control.CanUndo()
+        self.can_redo = self.control.CanRedo()
+
+    def attach_document(self, path, guess):
+        """Show the Scintilla document shared by all the text views of the
+        file, loading the text only if this is the first view of it.
+        """
+        registry = self.window.application.document_registry
+        self.document = registry.attach(path, self, guess)
+        if self.document.text_document is None:
+            self.control.SetTextUTF8(guess.get_utf8())
+            self.control.EmptyUndoBuffer()
+            self.document.text_document = self.control.GetDocPointer()
+        else:
+            # Scintilla reference counts its documents, so the text lives as
+            # long as any view is showing it
+            self.control.SetDocPointer(self.document.text_document)
+
+    def detach_document(self):
+        if self.document is not None:
+            registry = self.window.application.document_registry
+            registry.detach(self.document, self)
+            self.document = None
 
     def save(self, path=None):
         """ Saves the contents of the editor.
@@ -79,8 +102,55 @@ class StyledTextEditor(FrameworkEditor):
         f.write(self.control.GetTextUTF8())
         f.close()
 
-        self.dirty = False
+        if self.document is not None and path != self.document.path:
+            registry = self.window.application.document_registry
+            registry.rename(self.document.path, path)
+        views = self.document.views if self.document is not None else [self]
+        for view in views:
+            if isinstance(view, StyledTextEditor):
+                view.dirty = False
+                view.path = path
+
+    def destroy(self):
+        self.detach_document()
+        super(StyledTextEditor, self).destroy()
     
+    def get_memory_size(self):
+        return self.control.GetLength()
+
+    def get_view_position(self):
+        return {'top': self.control.GetFirstVisibleLine(),
+                'pos': self.control.GetCurrentPos(),
+                }
+
+    def set_view_position(self, data):
+        c = self.control
+        if 'top' in data:
+            c.ScrollToLine(min(data['top'], c.GetLineCount() - 1))
+        if 'pos' in data:
+            pos = min(data['pos'], c.GetLength())
+            c.SetCurrentPos(pos)
+            c.SetSelection(pos, pos)
+
+    def release_data(self):
+        if self.document is not None:
+            # Switch to a new empty document; the shared one is freed when
+            # its last view lets go of it
+            self.detach_document()
+            self.control.SetDocPointer(None)
+        else:
+            self.control.ClearAll()
+            self.control.EmptyUndoBuffer()
+            self.control.SetSavePoint()
+        # Clearing fires the change event, which marks the editor as dirty,
+        # so reset the state afterwards the same way load does
+        self.dirty = False
+        self.can_undo = False
+        self.can_redo = False
+
+    def reload_data(self):
+        self.load(FileGuess(self.path))
+
     def undo(self):
         self.control.Undo()
     
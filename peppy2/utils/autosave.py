@@ -0,0 +1,287 @@
+"""Autosave journals for byte stores
+
+Rather than periodically writing the entire buffer, only the changes since
+the last snapshot are appended to a journal file.  Taking a snapshot copies
+only the modified ranges of the buffer, so the GUI thread never pauses for a
+time proportional to the size of the document.  The journal is written by a
+background job.
+
+A journal starts with a header identifying the original file, followed by
+a series of snapshots.  Each snapshot is a list of structural edits (bytes
+inserted or deleted, recorded as offsets and lengths only), then the current
+contents of every modified range, then a commit record.  Replaying the
+committed snapshots over the original file reproduces the buffer; an
+incomplete snapshot at the end of the journal (e.g. from a crash during a
+write) is ignored.
+"""
+import os
+import json
+import struct
+import hashlib
+
+from peppy2.utils.jobs import ThreadJob, get_global_job_manager
+from peppy2.utils.ranges import add_range, shift_ranges
+
+import logging
+log = logging.getLogger(__name__)
+
+
+journal_magic = "peppy2 autosave journal 1\n"
+
+# kind, three integer arguments, length of the data that follows
+record_header = struct.Struct("<cQQQQ")
+
+
+class JournalTracker(object):
+    """Record of the changes to a byte store since the last snapshot
+
+    Used as a dirty tracker of a L{BinarySTC}.  Modified regions are rounded
+    out to pages and kept as byte ranges in the current coordinates of the
+    buffer, so they remain valid after bytes are inserted or deleted.
+    """
+    def __init__(self, page_size):
+        self.page_size = page_size
+        self.clear()
+
+    def clear(self):
+        self.edits = []
+        self.ranges = []
+
+    def is_clean(self):
+        return not self.edits and not self.ranges
+
+    def mark(self, start, end, new_length):
+        if end - start != new_length:
+            self.edits.append((start, end - start, new_length))
+            self.ranges = shift_ranges(self.ranges, start, end, new_length)
+        if new_length > 0:
+            first = start - (start % self.page_size)
+            last = start + new_length
+            last += -last % self.page_size
+            self.ranges = add_range(self.ranges, first, last)
+
+    def get_records(self, data):
+        """Return the journal records for a snapshot of the data
+
+        Only the modified ranges are copied, so this is fast enough to call
+        from the GUI thread.
+        """
+        records = [("E", start, old_length, new_length, "") for start, old_length, new_length in self.edits]
+        for start, end in self.ranges:
+            end = min(end, data.size)
+            if start < end:
+                records.append(("P", start, 0, 0, data[start:end].tostring()))
+        records.append(("C", data.size, 0, 0, ""))
+        return records
+
+
+def get_file_header(path):
+    """Identifying information about the file the journal applies to
+    """
+    stat = os.stat(path)
+    return {
+        "path": os.path.abspath(path),
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+        }
+
+
+def get_base_header(path):
+    """The header of the file as it is on disk before any changes are made
+
+    @returns: the header, or None if the file doesn't exist yet
+    """
+    if not os.path.exists(path):
+        return None
+    return get_file_header(path)
+
+
+def write_journal(journal_path, header, records):
+    """Append a snapshot to the journal, creating it if necessary
+    """
+    new_file = not os.path.exists(journal_path) or os.path.getsize(journal_path) == 0
+    fh = open(journal_path, "ab")
+    try:
+        if new_file:
+            fh.write(journal_magic)
+            fh.write(json.dumps(header) + "\n")
+        for kind, a, b, c, data in records:
+            fh.write(record_header.pack(kind, a, b, c, len(data)))
+            fh.write(data)
+        fh.flush()
+        os.fsync(fh.fileno())
+    finally:
+        fh.close()
+
+
+def read_journal(journal_path):
+    """Read the header and all the records from committed snapshots
+
+    @returns: tuple of the header dict and the list of records
+    """
+    fh = open(journal_path, "rb")
+    try:
+        if fh.readline() != journal_magic:
+            raise ValueError("%s is not an autosave journal" % journal_path)
+        header = json.loads(fh.readline())
+        committed = []
+        pending = []
+        while True:
+            raw = fh.read(record_header.size)
+            if len(raw) < record_header.size:
+                break
+            kind, a, b, c, count = record_header.unpack(raw)
+            data = fh.read(count)
+            if len(data) < count:
+                break
+            pending.append((kind, a, b, c, data))
+            if kind == "C":
+                committed.extend(pending)
+                pending = []
+    finally:
+        fh.close()
+    if pending:
+        log.warning("Ignoring incomplete snapshot at end of %s" % journal_path)
+    return header, committed
+
+
+def replay_records(store, records):
+    """Apply journal records to a byte store containing the original file
+    """
+    for kind, a, b, c, data in records:
+        if kind == "E":
+            store.SetBytes(a, a + b, "\0" * c)
+        elif kind == "P":
+            store.SetBytes(a, a + len(data), data)
+        elif kind == "C":
+            if store.GetLength() != a:
+                raise ValueError("Autosave journal inconsistent: length %d, expected %d" % (store.GetLength(), a))
+
+
+class AutosaveJob(ThreadJob):
+    # Journal writes must not wait for long running jobs
+    queue_name = "autosave"
+
+    def __init__(self, journal_path, header, records):
+        ThreadJob.__init__(self)
+        self.journal_path = journal_path
+        self.header = header
+        self.records = records
+
+    def get_name(self):
+        return "autosave %s" % self.header["path"]
+
+    def _start(self, dispatcher):
+        write_journal(self.journal_path, self.header, self.records)
+
+
+class DiscardJournalJob(ThreadJob):
+    queue_name = "autosave"
+
+    def __init__(self, journal_path):
+        ThreadJob.__init__(self)
+        self.journal_path = journal_path
+
+    def _start(self, dispatcher):
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+
+
+class AutosaveService(object):
+    """Periodically journals the changes to registered byte stores
+
+    Journal writes and deletions are serialized through the global job
+    manager so they happen in order, off the GUI thread.  If there's no job
+    manager, the jobs are run immediately.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        # Maps store to [path, tracker, header]
+        self.documents = {}
+
+    def get_journal_path(self, path):
+        digest = hashlib.md5(os.path.abspath(path).encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, "%s.journal" % digest)
+
+    def run_job(self, job):
+        manager = get_global_job_manager()
+        if manager is None or not manager.add_job(job):
+            job._start(None)
+
+    def register(self, store, path):
+        tracker = JournalTracker(store.page_size)
+        store.add_dirty_tracker(tracker)
+        store.autosave_filename = self.get_journal_path(path)
+
+        # The journal applies to the file as it was when editing started, so
+        # record its state now rather than at the first snapshot, which may
+        # happen after the file has been changed by another program.
+        self.documents[store] = [path, tracker, get_base_header(path)]
+
+    def unregister(self, store):
+        """Stop tracking the store and remove its journal
+        """
+        if store in self.documents:
+            path, tracker, header = self.documents.pop(store)
+            store.remove_dirty_tracker(tracker)
+            self.discard(path)
+
+    def snapshot(self):
+        """Journal all the changes since the last snapshot
+        """
+        for store, entry in self.documents.iteritems():
+            path, tracker, header = entry
+            if tracker.is_clean():
+                continue
+            if header is None:
+                # Nothing to replay the changes over
+                continue
+            records = tracker.get_records(store.data)
+            tracker.clear()
+            self.run_job(AutosaveJob(self.get_journal_path(path), header, records))
+
+    def saved(self, store, path):
+        """The store has been saved, so existing journal entries are obsolete
+        """
+        if store in self.documents:
+            entry = self.documents[store]
+            if entry[0] != path:
+                self.discard(entry[0])
+                store.autosave_filename = self.get_journal_path(path)
+            entry[0] = path
+            entry[1].clear()
+            entry[2] = get_base_header(path)
+        self.discard(path)
+
+    def discard(self, path):
+        self.run_job(DiscardJournalJob(self.get_journal_path(path)))
+
+    def is_recoverable(self, path):
+        """Is there a valid journal for the file?
+
+        The journal is only valid if the file hasn't been changed since the
+        journal was started.
+        """
+        journal_path = self.get_journal_path(path)
+        if not os.path.exists(journal_path):
+            return False
+        try:
+            header, records = read_journal(journal_path)
+            current = get_file_header(path)
+        except (ValueError, IOError, OSError), e:
+            log.warning("Invalid autosave journal %s: %s" % (journal_path, e))
+            return False
+        return bool(records) and header == current
+
+    def recover(self, store, path):
+        """Replay the journal for the file into the store
+
+        The store should be registered before recovery so that the replayed
+        changes will be journaled again, because the old journal is discarded.
+        """
+        header, records = read_journal(self.get_journal_path(path))
+        replay_records(store, records)
+        self.discard(path)
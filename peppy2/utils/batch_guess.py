@@ -0,0 +1,81 @@
+"""Reading and recognizing many files at once
+
+Opening a file reads its first megabyte and runs the file recognizers on it.
+When many files are opened together, the files are read by a pool of threads
+so the reads overlap, and the whole batch runs in a job so the GUI thread is
+free until the results are ready.
+"""
+from multiprocessing.pool import ThreadPool
+
+from peppy2.utils.file_guess import FileGuess
+from peppy2.utils.jobs import ThreadJob
+
+import logging
+log = logging.getLogger(__name__)
+
+
+def guess_file(uri, recognize, get_cached_mime=None):
+    """Read and recognize a single file
+
+    Returns (uri, guess, None) on success or (uri, None, error message) if the
+    file can't be read.
+
+    @param recognize: function setting the MIME type of a FileGuess
+    @param get_cached_mime: optional function returning a previously
+    recognized MIME type of the uri, or None if it must be recognized
+    """
+    try:
+        guess = FileGuess(uri)
+    except IOError, e:
+        return uri, None, str(e)
+    mime = get_cached_mime(uri) if get_cached_mime is not None else None
+    if mime:
+        guess.metadata.mime = mime
+    else:
+        recognize(guess)
+    return uri, guess, None
+
+
+def guess_files(uris, recognize, get_cached_mime=None, threads=4):
+    """Read and recognize the files using a pool of threads
+
+    Returns a list of guess_file results in the same order as the uris.
+    """
+    if len(uris) < 2 or threads < 2:
+        return [guess_file(uri, recognize, get_cached_mime) for uri in uris]
+    pool = ThreadPool(min(threads, len(uris)))
+    try:
+        return pool.map(lambda uri: guess_file(uri, recognize, get_cached_mime), uris)
+    finally:
+        pool.close()
+        pool.join()
+
+
+class GuessFilesJob(ThreadJob):
+    """Read and recognize files on a job thread
+
+    Uris found in known, a dict of uri to FileGuess (e.g. files that are
+    already open), aren't read again.  The callback is called in the GUI
+    thread with the job, whose results attribute is the list of guess_file
+    results in the order of the uris.
+    """
+    def __init__(self, uris, recognize, callback, get_cached_mime=None, known=None, threads=4):
+        ThreadJob.__init__(self)
+        self.uris = list(uris)
+        self.recognize = recognize
+        self.callback = callback
+        self.get_cached_mime = get_cached_mime
+        self.known = known or {}
+        self.threads = threads
+        self.results = []
+
+    def get_name(self):
+        return "reading %d files" % len(self.uris)
+
+    def _start(self, dispatcher):
+        unknown = [uri for uri in self.uris if uri not in self.known]
+        guessed = dict((r[0], r) for r in guess_files(unknown, self.recognize, self.get_cached_mime, self.threads))
+        self.results = [(uri, self.known[uri], None) if uri in self.known else guessed[uri] for uri in self.uris]
+
+    def success_callback(self):
+        self.callback(self)
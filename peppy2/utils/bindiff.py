@@ -0,0 +1,322 @@
+"""Binary difference between two byte arrays
+
+The result is a list of opcodes in the same format as
+difflib.SequenceMatcher.get_opcodes: (tag, a_start, a_end, b_start, b_end)
+where tag is one of 'equal', 'replace', 'delete' or 'insert'.
+
+Arrays of the same length are compared position by position, a chunk at a
+time.  Otherwise, the common prefix and suffix are removed and the middle is
+aligned using anchors: positions chosen by a hash of the surrounding bytes
+rather than by offset, so the same content produces the same anchors in both
+arrays no matter how much data has been inserted or deleted before it.
+Anchors whose following block of bytes hash to the same value in both
+arrays are matched, and the equal regions are grown outward from each match.
+"""
+import bisect
+
+import numpy as np
+
+from peppy2.utils.fileutil import chunk_size
+from peppy2.utils.jobs import ThreadJob
+
+import logging
+log = logging.getLogger(__name__)
+
+
+# Anchors are placed on average every 2**anchor_bits bytes
+anchor_bits = 10
+
+# Number of bytes following an anchor that are hashed to match anchors
+anchor_block = 32
+
+# Multipliers for the hashes; both are odd so no bits are lost
+gram_multiplier = np.uint32(0x9E3779B1)
+block_multiplier = np.uint64(0x100000001B3)
+
+
+def common_prefix_length(a, b):
+    """Number of equal bytes at the start of both arrays
+    """
+    count = min(a.size, b.size)
+    pos = 0
+    size = 4096
+    while pos < count:
+        end = min(pos + size, count)
+        diff = np.flatnonzero(a[pos:end] != b[pos:end])
+        if diff.size > 0:
+            return pos + int(diff[0])
+        pos = end
+        # Long equal regions are compared in larger and larger pieces
+        size = min(size * 2, chunk_size)
+    return count
+
+
+def common_suffix_length(a, b):
+    """Number of equal bytes at the end of both arrays
+    """
+    return common_prefix_length(a[::-1], b[::-1])
+
+
+def compare_same_length(a, b, a_offset=0, b_offset=0):
+    """Opcodes for two arrays of the same length, compared position by
+    position.
+    """
+    runs = []
+    current = None
+    run_start = 0
+    for pos in xrange(0, a.size, chunk_size):
+        end = min(pos + chunk_size, a.size)
+        ne = a[pos:end] != b[pos:end]
+        if current is None:
+            current = bool(ne[0])
+        elif ne[0] != current:
+            runs.append((current, run_start, pos))
+            run_start = pos
+            current = not current
+        # States alternate at each boundary within the chunk
+        for boundary in (np.flatnonzero(ne[1:] != ne[:-1]) + (pos + 1)).tolist():
+            runs.append((current, run_start, boundary))
+            run_start = boundary
+            current = not current
+    if a.size > 0:
+        runs.append((current, run_start, a.size))
+    return [('replace' if state else 'equal', a_offset + s, a_offset + e, b_offset + s, b_offset + e) for state, s, e in runs]
+
+
+def find_anchors(data):
+    """Return the sorted positions of the anchors in the array
+    """
+    found = []
+    mask = np.uint32(0xffffffff << (32 - anchor_bits) & 0xffffffff)
+    count = data.size - anchor_block
+    for pos in xrange(0, max(count, 0), chunk_size):
+        end = min(pos + chunk_size, count)
+        d = data[pos:end + 3].astype(np.uint32)
+        grams = d[:-3] | (d[1:-2] << 8) | (d[2:-1] << 16) | (d[3:] << 24)
+        hashes = grams * gram_multiplier
+        found.append(np.flatnonzero((hashes & mask) == 0) + pos)
+    if not found:
+        return np.zeros(0, dtype=np.int64)
+    anchors = np.concatenate(found)
+    if anchors.size == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    # Runs of repeated data produce anchors at every position, so only one
+    # anchor per block is kept
+    buckets = anchors // anchor_block
+    keep = np.concatenate(([True], buckets[1:] != buckets[:-1]))
+    return anchors[keep]
+
+
+def hash_blocks(data, anchors):
+    """Hash the anchor_block bytes starting at each anchor
+    """
+    hashes = np.zeros(anchors.size, dtype=np.uint64)
+    for i in range(anchor_block):
+        hashes = hashes * block_multiplier + data[anchors + i].astype(np.uint64)
+    return hashes
+
+
+def match_anchors(a, b):
+    """Find pairs of anchors with the same hash in both arrays
+
+    Only hashes that are unique in both arrays are used, and the pairs are
+    reduced to the longest sequence that is increasing in both arrays.
+
+    @returns: list of (a_pos, b_pos) tuples
+    """
+    a_anchors = find_anchors(a)
+    b_anchors = find_anchors(b)
+    if a_anchors.size == 0 or b_anchors.size == 0:
+        return []
+    a_hashes = hash_blocks(a, a_anchors)
+    b_hashes = hash_blocks(b, b_anchors)
+    a_unique, a_index, a_counts = np.unique(a_hashes, return_index=True, return_counts=True)
+    b_unique, b_index, b_counts = np.unique(b_hashes, return_index=True, return_counts=True)
+    a_unique = a_unique[a_counts == 1]
+    a_index = a_index[a_counts == 1]
+    b_unique = b_unique[b_counts == 1]
+    b_index = b_index[b_counts == 1]
+    common, a_which, b_which = np.intersect1d(a_unique, b_unique, assume_unique=True, return_indices=True)
+    a_pos = a_anchors[a_index[a_which]]
+    b_pos = b_anchors[b_index[b_which]]
+    order = np.argsort(a_pos)
+    return longest_increasing(a_pos[order].tolist(), b_pos[order].tolist())
+
+
+def longest_increasing(a_pos, b_pos):
+    """Longest subsequence of pairs where the b positions are also increasing
+    """
+    tails = []
+    tail_index = []
+    previous = [-1] * len(b_pos)
+    for i, b in enumerate(b_pos):
+        j = bisect.bisect_left(tails, b)
+        if j > 0:
+            previous[i] = tail_index[j - 1]
+        if j == len(tails):
+            tails.append(b)
+            tail_index.append(i)
+        else:
+            tails[j] = b
+            tail_index[j] = i
+    pairs = []
+    i = tail_index[-1] if tail_index else -1
+    while i >= 0:
+        pairs.append((a_pos[i], b_pos[i]))
+        i = previous[i]
+    pairs.reverse()
+    return pairs
+
+
+def gap_opcodes(a, b, a_start, a_end, b_start, b_end):
+    """Opcodes for a region between equal regions
+    """
+    if a_start == a_end and b_start == b_end:
+        return []
+    if a_start == a_end:
+        return [('insert', a_start, a_end, b_start, b_end)]
+    if b_start == b_end:
+        return [('delete', a_start, a_end, b_start, b_end)]
+    if a_end - a_start == b_end - b_start:
+        return compare_same_length(a[a_start:a_end], b[b_start:b_end], a_start, b_start)
+    return [('replace', a_start, a_end, b_start, b_end)]
+
+
+def merge_opcodes(opcodes):
+    """Join adjacent opcodes with the same tag and remove empty ones"""
+    merged = []
+    for op in opcodes:
+        if op[1] == op[2] and op[3] == op[4]:
+            continue
+        if merged and merged[-1][0] == op[0] and op[0] in ('equal', 'replace'):
+            last = merged[-1]
+            merged[-1] = (op[0], last[1], op[2], last[3], op[4])
+        else:
+            merged.append(op)
+    return merged
+
+
+def diff(a, b):
+    """Compute the opcodes that transform the array a into the array b
+    """
+    if a.size == b.size:
+        return compare_same_length(a, b)
+    prefix = common_prefix_length(a, b)
+    suffix = common_suffix_length(a[prefix:], b[prefix:])
+    a_mid_end = a.size - suffix
+    b_mid_end = b.size - suffix
+    opcodes = [('equal', 0, prefix, 0, prefix)]
+
+    a_mid = a[prefix:a_mid_end]
+    b_mid = b[prefix:b_mid_end]
+    a_cur = b_cur = 0
+    for a_anchor, b_anchor in match_anchors(a_mid, b_mid):
+        if a_anchor < a_cur or b_anchor < b_cur:
+            # Already part of the equal region grown from an earlier anchor
+            continue
+        forward = common_prefix_length(a_mid[a_anchor:], b_mid[b_anchor:])
+        if forward == 0:
+            # Hash collision
+            continue
+        back = common_suffix_length(a_mid[a_cur:a_anchor], b_mid[b_cur:b_anchor])
+        a_start = a_anchor - back
+        b_start = b_anchor - back
+        opcodes.extend(gap_opcodes(a_mid, b_mid, a_cur, a_start, b_cur, b_start))
+        a_cur = a_anchor + forward
+        b_cur = b_anchor + forward
+        opcodes.append(('equal', a_start, a_cur, b_start, b_cur))
+    opcodes.extend(gap_opcodes(a_mid, b_mid, a_cur, a_mid.size, b_cur, b_mid.size))
+
+    # Shift the middle back to the offsets in the full arrays
+    shifted = [opcodes[0]]
+    for tag, a1, a2, b1, b2 in opcodes[1:]:
+        shifted.append((tag, a1 + prefix, a2 + prefix, b1 + prefix, b2 + prefix))
+    shifted.append(('equal', a_mid_end, a.size, b_mid_end, b.size))
+    return merge_opcodes(shifted)
+
+
+class DiffResult(object):
+    """Opcodes with navigation among the differences
+    """
+    def __init__(self, opcodes):
+        self.opcodes = opcodes
+        self.differences = [op for op in opcodes if op[0] != 'equal']
+        self.a_starts = [op[1] for op in self.differences]
+        self.b_starts = [op[3] for op in self.differences]
+        self.a_opcode_starts = [op[1] for op in opcodes]
+        self.b_opcode_starts = [op[3] for op in opcodes]
+
+    def __len__(self):
+        return len(self.differences)
+
+    def get_ranges(self, side):
+        """List of (start, end) ranges that differ in one of the arrays
+
+        @param side: 0 for the first array, 1 for the second
+        """
+        i = 1 + 2 * side
+        return [(op[i], op[i + 1]) for op in self.differences if op[i] < op[i + 1]]
+
+    def next_difference(self, side, pos):
+        """Return the index of the first difference that starts after pos,
+        or None if there are no more differences.
+        """
+        starts = self.b_starts if side else self.a_starts
+        index = bisect.bisect_right(starts, pos)
+        if index < len(starts):
+            return index
+        return None
+
+    def prev_difference(self, side, pos):
+        """Return the index of the last difference that starts before pos,
+        or None if there are no earlier differences.
+        """
+        starts = self.b_starts if side else self.a_starts
+        index = bisect.bisect_left(starts, pos) - 1
+        if index >= 0:
+            return index
+        return None
+
+    def map_offset(self, side, pos):
+        """Return the offset in the other array corresponding to pos
+
+        Offsets in equal regions map to the same byte in the other array;
+        offsets in a difference map to the start of the difference.
+        """
+        starts = self.b_opcode_starts if side else self.a_opcode_starts
+        index = bisect.bisect_right(starts, pos) - 1
+        if index < 0:
+            return 0
+        tag, a1, a2, b1, b2 = self.opcodes[index]
+        if side:
+            a1, a2, b1, b2 = b1, b2, a1, a2
+        if tag == 'equal':
+            return b1 + min(pos - a1, b2 - b1)
+        return b1
+
+
+class DiffJob(ThreadJob):
+    """Compare two byte arrays on a job thread
+
+    The callback is called in the GUI thread with the DiffResult.  If the
+    comparison fails, the error callback is called with the job instead.
+    """
+    def __init__(self, a, b, callback, error_callback=None):
+        ThreadJob.__init__(self)
+        self.a = a
+        self.b = b
+        self.callback = callback
+        self.error_callback = error_callback
+        self.result = None
+
+    def _start(self, dispatcher):
+        self.result = DiffResult(diff(self.a, self.b))
+
+    def success_callback(self):
+        self.callback(self.result)
+
+    def failure_callback(self):
+        log.error("Comparison failed: %s" % self.exception)
+        if self.error_callback is not None:
+            self.error_callback(self)
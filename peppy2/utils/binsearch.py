@@ -0,0 +1,260 @@
+"""Bulk searching of byte arrays
+
+The data is searched in large chunks so that multi-gigabyte memory mapped
+files are read sequentially, once.  Consecutive chunks overlap by the maximum
+match length so matches spanning a chunk boundary are still found, but each
+match is reported only from the chunk in which it starts.
+
+Long literal byte strings are located with str.find, which uses a Boyer-
+Moore-Horspool style skip loop in C.  Short literals, which can have many
+hits, and hex patterns with wildcard nibbles are searched by vectorized
+filtering: the candidate positions for the most selective byte of the
+pattern are found with numpy over the whole chunk, and the candidates are
+then verified against the remaining bytes one pattern position at a time.
+"""
+import re
+
+import numpy as np
+
+from peppy2.utils.fileutil import chunk_size
+from peppy2.utils.jobs import ThreadJob, ProgressReport, Finished
+
+import logging
+log = logging.getLogger(__name__)
+
+
+class SearchError(ValueError):
+    pass
+
+
+class LiteralPattern(object):
+    """Exact byte string
+    """
+    # Needles up to this length are searched with numpy rather than a
+    # python loop over the hits
+    max_filter_length = 8
+
+    def __init__(self, needle):
+        if not needle:
+            raise SearchError("Empty search string")
+        self.needle = needle
+        self.max_length = len(needle)
+        if self.max_length <= self.max_filter_length:
+            values = np.fromstring(needle, dtype=np.uint8)
+            self.filter = MaskedPattern(values, np.ones_like(values) * 0xff)
+        else:
+            self.filter = None
+
+    def __str__(self):
+        return repr(self.needle)
+
+    def find_all(self, chunk):
+        """Return an array of the offsets of every match in the chunk,
+        including overlapping matches.
+        """
+        if self.filter is not None:
+            return self.filter.find_all(chunk)
+        text = chunk.tostring()
+        needle = self.needle
+        hits = []
+        i = text.find(needle)
+        while i >= 0:
+            hits.append(i)
+            i = text.find(needle, i + 1)
+        return np.asarray(hits, dtype=np.int64)
+
+
+class MaskedPattern(object):
+    """Byte pattern where each byte is compared only at the bits set in a mask
+    """
+    def __init__(self, values, masks):
+        self.values = np.asarray(values, dtype=np.uint8)
+        self.masks = np.asarray(masks, dtype=np.uint8)
+        self.values &= self.masks
+        if self.values.size == 0:
+            raise SearchError("Empty search pattern")
+        self.max_length = self.values.size
+
+        # Verify the bytes with the most significant bits first so the first
+        # filter pass eliminates the most candidates.  Positions that are
+        # entirely wildcards always match and aren't checked.
+        bits = np.unpackbits(self.masks[:, np.newaxis], axis=1).sum(axis=1)
+        order = np.argsort(-bits, kind='mergesort')
+        self.order = [int(i) for i in order if bits[i] > 0]
+
+    def __str__(self):
+        text = []
+        for v, m in zip(self.values, self.masks):
+            hi = "%x" % (v >> 4) if m & 0xf0 else "?"
+            lo = "%x" % (v & 0xf) if m & 0x0f else "?"
+            text.append(hi + lo)
+        return " ".join(text)
+
+    def find_all(self, chunk):
+        count = chunk.size - self.max_length + 1
+        if count <= 0:
+            return np.zeros(0, dtype=np.int64)
+        if not self.order:
+            return np.arange(count, dtype=np.int64)
+        first = self.order[0]
+        window = chunk[first:first + count]
+        if self.masks[first] == 0xff:
+            candidates = np.flatnonzero(window == self.values[first])
+        else:
+            candidates = np.flatnonzero((window & self.masks[first]) == self.values[first])
+        for i in self.order[1:]:
+            if candidates.size == 0:
+                break
+            found = chunk[candidates + i]
+            if self.masks[i] != 0xff:
+                found = found & self.masks[i]
+            candidates = candidates[found == self.values[i]]
+        return candidates.astype(np.int64)
+
+
+class RegexPattern(object):
+    """Regular expression over the bytes
+
+    Matches can't be longer than max_length bytes, because only that much
+    of the following chunk is included when searching near a chunk boundary.
+    """
+    def __init__(self, regex, flags=0, max_length=4096):
+        try:
+            self.regex = re.compile(regex, flags)
+        except re.error, e:
+            raise SearchError("Bad regular expression: %s" % e)
+        self.max_length = max_length
+
+    def __str__(self):
+        return self.regex.pattern
+
+    def find_all(self, chunk):
+        hits = [m.start() for m in self.regex.finditer(chunk.tostring())]
+        return np.asarray(hits, dtype=np.int64)
+
+
+def parse_hex_pattern(text):
+    """Parse a string of hex digits into a MaskedPattern
+
+    Whitespace is ignored, and a "?" in place of a hex digit matches any
+    value for that nibble, so "4? ?? 0d 0a" matches any byte from 0x40 to
+    0x4f followed by any byte and a CR/LF pair.
+    """
+    digits = "".join(text.split())
+    if len(digits) % 2 != 0:
+        raise SearchError("Hex pattern must have an even number of digits")
+    values = []
+    masks = []
+    for i in range(0, len(digits), 2):
+        value = 0
+        mask = 0
+        for c in digits[i:i + 2]:
+            value <<= 4
+            mask <<= 4
+            if c != "?":
+                try:
+                    value |= int(c, 16)
+                except ValueError:
+                    raise SearchError("Invalid hex digit '%s'" % c)
+                mask |= 0xf
+        values.append(value)
+        masks.append(mask)
+    if all(m == 0xff for m in masks):
+        return LiteralPattern("".join(chr(v) for v in values))
+    return MaskedPattern(values, masks)
+
+
+search_modes = ["hex", "ascii", "utf-16", "regex"]
+
+def get_pattern(text, mode="hex", ignore_case=False):
+    """Create a search pattern object from user input
+
+    @param text: search string
+
+    @param mode: one of the entries in search_modes
+
+    @param ignore_case: case insensitive search for the text modes
+    """
+    if mode == "hex":
+        return parse_hex_pattern(text)
+    if mode == "regex":
+        flags = re.IGNORECASE if ignore_case else 0
+        if isinstance(text, unicode):
+            # Non-ASCII characters match their UTF-8 bytes
+            text = text.encode("utf-8")
+        return RegexPattern(text, flags)
+    try:
+        if mode == "ascii":
+            encoded = text.encode("latin-1")
+        elif mode == "utf-16":
+            encoded = text.encode("utf-16-le")
+        else:
+            raise SearchError("Unknown search mode %s" % mode)
+    except UnicodeError:
+        raise SearchError("Search text can't be encoded as %s" % mode)
+    if ignore_case:
+        return RegexPattern(re.escape(encoded), re.IGNORECASE, len(encoded))
+    return LiteralPattern(encoded)
+
+
+def iter_hits(data, pattern, start=0, end=None, size=None):
+    """Generator searching a numpy byte array in chunks
+
+    @returns: yields a tuple of the offset searched so far and an array
+    containing the offsets of the matches found in that chunk
+    """
+    if end is None or end > data.size:
+        end = data.size
+    if size is None:
+        size = chunk_size
+    overlap = pattern.max_length - 1
+    pos = start
+    while pos < end:
+        chunk_end = min(pos + size, end)
+        chunk = data[pos:min(chunk_end + overlap, end)]
+        hits = pattern.find_all(chunk)
+        hits = hits[hits < chunk_end - pos] + pos
+        yield chunk_end, hits
+        pos = chunk_end
+
+
+def find_all(data, pattern, start=0, end=None):
+    """Return an array of the offsets of all matches
+    """
+    found = [hits for pos, hits in iter_hits(data, pattern, start, end)]
+    if not found:
+        return np.zeros(0, dtype=np.int64)
+    return np.concatenate(found)
+
+
+class SearchJob(ThreadJob):
+    """Find all matches in a byte array, streaming the hits to the GUI
+
+    A ProgressReport is sent after each chunk containing the tuple of the
+    offset searched so far and the array of new hits, followed by a
+    Finished report when the search is complete or has been cancelled.
+    """
+    def __init__(self, job_id, data, pattern, start=0, end=None):
+        ThreadJob.__init__(self, job_id)
+        self.data = data
+        self.pattern = pattern
+        self.start = start
+        self.end = end
+        self.cancelled = False
+        self.num_hits = 0
+
+    def get_name(self):
+        return "search for %s" % self.pattern
+
+    def cancel(self):
+        self.cancelled = True
+
+    def _start(self, dispatcher):
+        pos = self.start
+        for pos, hits in iter_hits(self.data, self.pattern, self.start, self.end):
+            if self.cancelled:
+                break
+            self.num_hits += hits.size
+            dispatcher._progress_update(ProgressReport(self.job_id, (pos, hits)))
+        dispatcher._progress_update(Finished(self.job_id, (pos, np.zeros(0, dtype=np.int64))))
+        log.debug("%s: %d hits" % (self.get_name(), self.num_hits))
@@ -0,0 +1,264 @@
+"""Downsampled renderings of bit patterns
+
+The byte graphics view shows each bit of the data as a black or white pixel,
+bytes_per_row bytes to a row.  When zoomed out so that a pixel covers several
+rows, the pixel shows the fraction of set bits in that column of those rows as
+a gray level.
+
+The pyramid stores the gray levels at power of two reduction factors.  The
+finest stored level uses the smallest factor that keeps it below a memory
+limit; each coarser level is made by averaging pairs of rows of the level
+below, so the data only has to be read once.  Reductions finer than the stored
+levels are computed on demand from the visible part of the data.
+
+Building the pyramid for a large file takes a while, so it can be saved to a
+cache file keyed on the path, size and modification time of the file.
+"""
+import os
+import hashlib
+
+import numpy as np
+
+from peppy2.utils.fileutil import chunk_size
+from peppy2.utils.jobs import ThreadJob
+
+import logging
+log = logging.getLogger(__name__)
+
+
+# Version of the cache file format
+cache_version = 1
+
+
+def downsample_bits(data, bytes_per_row, factor):
+    """Return the gray levels of data reduced by factor rows per output row
+
+    The result is an (n, 8 * bytes_per_row) uint8 array where 0 is a column
+    with all bits set and 255 is a column with no bits set, matching the
+    black on white rendering of the unreduced bits.  Missing bytes at the end
+    of the data count as zero bits.
+    """
+    width = 8 * bytes_per_row
+    group = factor * bytes_per_row
+    count = (data.size + group - 1) // group
+    levels = np.empty((count, width), dtype=np.uint8)
+    # Chunks are a whole number of output rows
+    step = max(chunk_size // group, 1) * group
+    for pos in xrange(0, data.size, step):
+        chunk = data[pos:pos + step]
+        if chunk.size % group:
+            padded = np.zeros(chunk.size + group - chunk.size % group, dtype=np.uint8)
+            padded[:chunk.size] = chunk
+            chunk = padded
+        rows = chunk.reshape((-1, factor, bytes_per_row))
+        sums = np.empty((rows.shape[0], width), dtype=np.uint32)
+        # Summing each bit separately is faster than unpacking all the bits
+        for bit in range(8):
+            sums[:, bit::8] = ((rows >> (7 - bit)) & 1).sum(axis=1, dtype=np.uint32)
+        first = pos // group
+        levels[first:first + sums.shape[0]] = 255 - (sums * 255 + factor // 2) // factor
+    return levels
+
+
+def reduce_pairs(levels):
+    """Average pairs of rows, treating a missing last row as white"""
+    if levels.shape[0] % 2:
+        levels = np.vstack((levels, np.empty((1, levels.shape[1]), dtype=np.uint8)))
+        levels[-1] = 255
+    total = levels[0::2].astype(np.uint16) + levels[1::2]
+    return ((total + 1) // 2).astype(np.uint8)
+
+
+def get_reduced_rows(data, bytes_per_row, factor, start, count):
+    """Return count rows of data reduced by factor, starting at reduced row
+    start.  Rows past the end of the data are white.
+    """
+    rows = np.empty((count, 8 * bytes_per_row), dtype=np.uint8)
+    rows[:] = 255
+    group = factor * bytes_per_row
+    levels = downsample_bits(data[start * group:(start + count) * group], bytes_per_row, factor)
+    rows[:levels.shape[0]] = levels
+    return rows
+
+
+def get_cache_file(cache_dir, path, bytes_per_row):
+    """Name of the cache file for the pyramid of the file on disk
+
+    Returns None if the file doesn't exist.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    key = "%s\0%d\0%f\0%d\0%d" % (os.path.abspath(path), stat.st_size, stat.st_mtime, bytes_per_row, cache_version)
+    return os.path.join(cache_dir, hashlib.md5(key).hexdigest() + ".npz")
+
+
+def prune_cache(cache_dir, max_files=32):
+    """Remove the least recently modified cache files beyond max_files"""
+    try:
+        names = [os.path.join(cache_dir, n) for n in os.listdir(cache_dir) if n.endswith(".npz")]
+        if len(names) > max_files:
+            names.sort(key=os.path.getmtime)
+            for name in names[:len(names) - max_files]:
+                os.remove(name)
+    except OSError, e:
+        log.error("Failed pruning %s: %s" % (cache_dir, e))
+
+
+class BitPyramid(object):
+    """Gray level renderings of data at every power of two reduction
+    """
+    def __init__(self, data, bytes_per_row=1, max_bytes=16 * 1024 * 1024, base_factor=None):
+        self.size = data.size
+        self.bytes_per_row = bytes_per_row
+        self.rows = (data.size + bytes_per_row - 1) // bytes_per_row
+        width = 8 * bytes_per_row
+        if base_factor is None:
+            base_factor = 2
+            while (self.rows // base_factor) * width > max_bytes:
+                base_factor *= 2
+        self.base_factor = base_factor
+        self.levels = [downsample_bits(data, bytes_per_row, base_factor)]
+        while self.levels[-1].shape[0] > 1:
+            self.levels.append(reduce_pairs(self.levels[-1]))
+
+    def get_level_index(self, factor):
+        """Index of the stored level for the reduction factor, or None if the
+        factor is finer than the stored levels.
+        """
+        if factor < self.base_factor:
+            return None
+        index = 0
+        f = self.base_factor
+        while f < factor and index + 1 < len(self.levels):
+            f *= 2
+            index += 1
+        return index
+
+    def get_rows(self, data, factor, start, count):
+        """Return count reduced rows starting at reduced row start
+
+        Uses the stored levels when possible, otherwise reduces the needed
+        part of the data.  Rows past the end of the data are white.
+        """
+        index = self.get_level_index(factor)
+        if index is None:
+            return get_reduced_rows(data, self.bytes_per_row, factor, start, count)
+        rows = np.empty((count, 8 * self.bytes_per_row), dtype=np.uint8)
+        rows[:] = 255
+        levels = self.levels[index][start:start + count]
+        rows[:levels.shape[0]] = levels
+        return rows
+
+    def update(self, data, start, end):
+        """Recompute the levels covering bytes start:end
+
+        Only valid if the length of the data hasn't changed.
+        """
+        if start >= end:
+            return
+        group = self.base_factor * self.bytes_per_row
+        first = start // group
+        last = (end - 1) // group
+        self.levels[0][first:last + 1] = downsample_bits(data[first * group:(last + 1) * group], self.bytes_per_row, self.base_factor)
+        for index in range(1, len(self.levels)):
+            below = self.levels[index - 1]
+            first //= 2
+            last //= 2
+            self.levels[index][first:last + 1] = reduce_pairs(below[first * 2:(last + 1) * 2])
+
+    def save(self, filename):
+        """Save the levels to a cache file
+        """
+        arrays = dict(("level%d" % i, level) for i, level in enumerate(self.levels))
+        header = np.array([cache_version, self.size, self.bytes_per_row, self.base_factor], dtype=np.int64)
+        dirname = os.path.dirname(filename)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+        with open(filename, "wb") as fh:
+            np.savez(fh, header=header, **arrays)
+
+    @classmethod
+    def load(cls, filename, size, bytes_per_row):
+        """Load the pyramid from a cache file
+
+        Returns None if the file is missing, unreadable or doesn't match the
+        size and bytes per row.
+        """
+        try:
+            archive = np.load(filename)
+            header = archive['header'].tolist()
+            if header != [cache_version, size, bytes_per_row, header[3]]:
+                return None
+            pyramid = cls.__new__(cls)
+            pyramid.size = size
+            pyramid.bytes_per_row = bytes_per_row
+            pyramid.rows = (size + bytes_per_row - 1) // bytes_per_row
+            pyramid.base_factor = header[3]
+            pyramid.levels = []
+            while "level%d" % len(pyramid.levels) in archive.files:
+                pyramid.levels.append(archive["level%d" % len(pyramid.levels)])
+            archive.close()
+        except (IOError, OSError, ValueError, KeyError), e:
+            log.debug("Can't load pyramid from %s: %s" % (filename, e))
+            return None
+        return pyramid
+
+
+class BitPyramidJob(ThreadJob):
+    """Build or load a BitPyramid on a job thread
+
+    If a cache file is given, the pyramid is loaded from it if possible,
+    otherwise it is built and saved there.  The callback is called in the GUI
+    thread with the job, whose pyramid attribute holds the result, unless
+    the job has been cancelled.
+    """
+    def __init__(self, data, bytes_per_row, callback, cache_file=None):
+        ThreadJob.__init__(self)
+        self.data = data
+        self.bytes_per_row = bytes_per_row
+        self.callback = callback
+        self.cache_file = cache_file
+        self.pyramid = None
+        self.cancelled = False
+
+    def cancel(self):
+        """Skip the work if the job hasn't started yet and don't call the
+        callback when it's done.
+        """
+        self.cancelled = True
+
+    def _start(self, dispatcher):
+        if self.cancelled:
+            return
+        if self.cache_file is not None:
+            self.pyramid = BitPyramid.load(self.cache_file, self.data.size, self.bytes_per_row)
+            if self.pyramid is not None:
+                return
+        self.pyramid = BitPyramid(self.data, self.bytes_per_row)
+        if self.cache_file is not None:
+            try:
+                self.pyramid.save(self.cache_file)
+                prune_cache(os.path.dirname(self.cache_file))
+            except (IOError, OSError), e:
+                log.error("Failed saving %s: %s" % (self.cache_file, e))
+
+    def success_callback(self):
+        if not self.cancelled:
+            self.callback(self)
+
+
+def prebuild_cache(cache_dir, path, bytes_per_row=1):
+    """Build and save the pyramid of a file on disk unless it's already in
+    the cache, so opening the file later only has to load it.
+
+    Returns the name of the cache file, or None if the file doesn't exist.
+    """
+    cache_file = get_cache_file(cache_dir, path, bytes_per_row)
+    if cache_file is None or os.path.exists(cache_file) or os.path.getsize(path) == 0:
+        return cache_file
+    data = np.memmap(path, dtype=np.uint8, mode="r")
+    BitPyramid(data, bytes_per_row).save(cache_file)
+    prune_cache(cache_dir)
+    return cache_file
@@ -0,0 +1,409 @@
+"""Incremental checksums of byte stores
+
+The data is divided into fixed size blocks and the CRC32 of each block is
+kept in an index.  The CRC of any range of blocks is computed by combining the
+block CRCs, using a binary tree of combined CRCs so that changing one block
+only requires recombining the nodes on its path to the root.
+
+Cryptographic digests can't be combined, but the hash state can be copied,
+so the index also keeps checkpoints of the state of each digest.  Hash states
+are much larger than CRCs, so there is only a checkpoint at the end of every
+checkpoint_interval blocks.  After an edit, the digest of the whole file is
+resumed from the last checkpoint before the first modified block instead of
+rehashing from the start.
+
+The index is a dirty tracker of the byte store, so edits invalidate only the
+blocks they touch.  Insertions and deletions shift all the following blocks,
+which invalidates everything after the edit.
+"""
+import hashlib
+import zlib
+
+import numpy as np
+
+from peppy2.utils.jobs import ThreadJob
+
+import logging
+log = logging.getLogger(__name__)
+
+
+digest_algorithms = ["md5", "sha1", "sha256"]
+
+
+def gf2_matrix_times(mat, vec):
+    total = 0
+    i = 0
+    while vec:
+        if vec & 1:
+            total ^= mat[i]
+        vec >>= 1
+        i += 1
+    return total
+
+
+def gf2_matrix_multiply(a, b):
+    """Operator applying b followed by a"""
+    return [gf2_matrix_times(a, col) for col in b]
+
+
+# Operator for a single zero bit, using the reflected CRC-32 polynomial
+_one_bit = [0xedb88320] + [1 << i for i in range(31)]
+
+# Operators for 2**n zero bytes, starting by squaring up to one byte
+_powers = [_one_bit]
+for i in range(3):
+    _powers[0] = gf2_matrix_multiply(_powers[0], _powers[0])
+
+_operator_cache = {}
+
+def get_power(bit):
+    while bit >= len(_powers):
+        _powers.append(gf2_matrix_multiply(_powers[-1], _powers[-1]))
+    return _powers[bit]
+
+
+def zeros_operator(length):
+    """Operator that updates a CRC for appending length zero bytes
+
+    Combining uses the fact that crc(A + B) is crc(A) advanced by len(B) zero
+    bytes, xor'd with crc(B).  Building the operator is expensive, so they are
+    cached; this should only be used for lengths that are used repeatedly.
+    """
+    if length in _operator_cache:
+        return _operator_cache[length]
+    op = [1 << i for i in range(32)]
+    bit = 0
+    n = length
+    while n:
+        if n & 1:
+            op = gf2_matrix_multiply(get_power(bit), op)
+        n >>= 1
+        bit += 1
+    _operator_cache[length] = op
+    return op
+
+
+def crc32_combine(crc1, crc2, length2):
+    """CRC32 of the concatenation of two pieces of data, given the CRC of each
+    piece and the length of the second one.
+    """
+    bit = 0
+    while length2:
+        if length2 & 1:
+            crc1 = gf2_matrix_times(get_power(bit), crc1)
+        length2 >>= 1
+        bit += 1
+    return crc1 ^ crc2
+
+
+def crc32_combine_array(crc1, crc2, length2):
+    """Vectorized crc32_combine for arrays of CRCs with the same length2"""
+    op = zeros_operator(length2)
+    result = np.array(crc2, dtype=np.uint32)
+    for i in range(32):
+        bit = (crc1 >> np.uint32(i)) & np.uint32(1)
+        result ^= bit * np.uint32(op[i])
+    return result
+
+
+def crc32(data):
+    return zlib.crc32(data) & 0xffffffff
+
+
+class BlockHashUpdate(object):
+    """The computations needed to bring an index up to date
+
+    Created in the GUI thread from the current state of the index, but the
+    run method only uses the captured values, so it can be run on a job
+    thread while the user continues to edit.
+    """
+    def __init__(self, index, algorithms):
+        self.data = index.store.data
+        self.size = index.size
+        self.block_size = index.block_size
+        self.checkpoint_interval = index.checkpoint_interval
+        self.blocks = np.flatnonzero(~index.valid)
+        self.crcs = None
+        self.digests = {}
+        for name in algorithms:
+            count, state = index.get_last_checkpoint(name)
+            self.digests[name] = (count, state)
+        self.checkpoints = {}
+
+    def run(self):
+        bs = self.block_size
+        data = self.data
+        crcs = np.empty(self.blocks.size, dtype=np.uint32)
+        for i, block in enumerate(self.blocks.tolist()):
+            crcs[i] = crc32(data[block * bs:(block + 1) * bs])
+        self.crcs = crcs
+        interval = self.checkpoint_interval
+        span = bs * interval
+        end = (self.size // span) * span
+        for name, (count, state) in self.digests.iteritems():
+            states = []
+            for start in xrange(count * span, end, bs):
+                state.update(data[start:start + bs])
+                if (start // bs + 1) % interval == 0:
+                    states.append(state.copy())
+            self.checkpoints[name] = (count, states)
+
+
+class BlockHashIndex(object):
+    """Per-block CRC32 and digest checkpoints for a byte store
+    """
+    def __init__(self, store, block_size=64 * 1024, checkpoint_interval=16):
+        self.store = store
+        self.block_size = block_size
+        self.checkpoint_interval = checkpoint_interval
+        self.reset()
+        store.add_dirty_tracker(self)
+
+    def reset(self):
+        self.size = self.store.GetLength()
+        count = self.get_num_blocks(self.size)
+        self.crcs = np.zeros(count, dtype=np.uint32)
+        self.valid = np.zeros(count, dtype=np.bool)
+        self.tree = None
+        self.changed_leaves = set()
+
+        # name -> list of hash states at the end of every checkpoint_interval
+        # blocks
+        self.checkpoints = {}
+
+        # Edits made while an update is running on a job thread
+        self.update_marks = None
+        self.update_length_changed = False
+
+    def get_num_blocks(self, size):
+        return (size + self.block_size - 1) // self.block_size
+
+    def mark(self, start, end, new_length):
+        """Dirty tracker interface: bytes start:end were replaced by
+        new_length bytes.
+        """
+        first = start // self.block_size
+        if end - start != new_length:
+            self.size += new_length - (end - start)
+            count = self.get_num_blocks(self.size)
+            self.crcs = np.resize(self.crcs, count)
+            self.valid = np.resize(self.valid, count)
+            self.valid[first:] = False
+            self.tree = None
+            last = count - 1
+            self.update_length_changed = True
+        else:
+            if new_length == 0:
+                return
+            last = (start + new_length - 1) // self.block_size
+            self.valid[first:last + 1] = False
+            self.changed_leaves.update(xrange(first, last + 1))
+        for name, states in self.checkpoints.iteritems():
+            del states[first // self.checkpoint_interval:]
+        if self.update_marks is not None:
+            self.update_marks.update(xrange(first, last + 1))
+
+    def get_last_checkpoint(self, name):
+        """Return the number of checkpoints and a copy of the hash state at
+        the last one.
+        """
+        states = self.checkpoints.get(name)
+        if states:
+            return len(states), states[-1].copy()
+        return 0, hashlib.new(name)
+
+    def prepare_update(self, algorithms=[]):
+        """Capture the work needed to update the index
+
+        If the store's data was replaced without going through the dirty
+        tracker interface, the index is rebuilt from scratch.
+        """
+        if self.store.GetLength() != self.size:
+            self.reset()
+        self.update_marks = set()
+        self.update_length_changed = False
+        return BlockHashUpdate(self, algorithms)
+
+    def install_update(self, update):
+        """Store the results of an update computed by BlockHashUpdate.run,
+        except for the blocks that were changed in the meantime.
+        """
+        marks = self.update_marks
+        self.update_marks = None
+        if self.update_length_changed:
+            log.debug("length changed during update; discarding results")
+            return False
+        if update.blocks.size > 0:
+            keep = np.array([b not in marks for b in update.blocks.tolist()], dtype=np.bool)
+            blocks = update.blocks[keep]
+            self.crcs[blocks] = update.crcs[keep]
+            self.valid[blocks] = True
+            self.changed_leaves.update(blocks.tolist())
+        first_mark = min(marks) if marks else self.get_num_blocks(self.size)
+        valid_count = first_mark // self.checkpoint_interval
+        for name, (count, states) in update.checkpoints.iteritems():
+            current = self.checkpoints.setdefault(name, [])
+            if len(current) == count:
+                current.extend(states[:max(valid_count - count, 0)])
+        return True
+
+    def update(self, algorithms=[]):
+        """Synchronously bring the index up to date"""
+        update = self.prepare_update(algorithms)
+        update.run()
+        self.install_update(update)
+
+    def is_current(self, algorithms=[]):
+        if self.store.GetLength() != self.size or not np.all(self.valid):
+            return False
+        count = self.size // (self.block_size * self.checkpoint_interval)
+        for name in algorithms:
+            if len(self.checkpoints.get(name, [])) < count:
+                return False
+        return True
+
+    def build_tree(self):
+        """Combine pairs of CRCs into the levels of a binary tree, only
+        recalculating the nodes above changed leaves.
+        """
+        if not np.all(self.valid):
+            self.update()
+        if self.tree is None:
+            self.tree = [self.crcs.copy()]
+            changed = np.arange(self.crcs.size)
+            rebuild = True
+        else:
+            changed = np.array(sorted(self.changed_leaves), dtype=np.int64)
+            self.tree[0][changed] = self.crcs[changed]
+            rebuild = False
+        self.changed_leaves = set()
+        level = 0
+        length = self.block_size
+        while self.tree[level].size > 1:
+            below = self.tree[level]
+            count = (below.size + 1) // 2
+            if rebuild:
+                self.tree.append(np.zeros(count, dtype=np.uint32))
+            nodes = np.unique(changed // 2)
+            if nodes.size == 0:
+                break
+            left = nodes * 2
+            right = left + 1
+            has_right = right < below.size
+            result = below[left].copy()
+            # The last node at each level may be shorter than a full node
+            full = has_right & (right < below.size - 1)
+            result[full] = crc32_combine_array(below[left[full]], below[right[full]], length)
+            last = np.flatnonzero(has_right & ~full)
+            for i in last.tolist():
+                right_length = self.size - right[i] * length
+                result[i] = crc32_combine(int(below[left[i]]), int(below[right[i]]), right_length)
+            self.tree[level + 1][nodes] = result
+            changed = nodes
+            level += 1
+            length *= 2
+
+    def crc32(self, start=0, end=None):
+        """CRC32 of the bytes start:end
+        """
+        if end is None or end > self.size:
+            end = self.size
+        if start >= end:
+            return 0
+        self.build_tree()
+        bs = self.block_size
+        data = self.store.data
+        first = (start + bs - 1) // bs
+        last = end // bs
+        if first >= last:
+            return crc32(data[start:end])
+        crc = crc32(data[start:first * bs])
+        # Walk up the tree taking the largest aligned nodes in the range
+        block = first
+        while block < last:
+            level = 0
+            while level + 1 < len(self.tree) and block % (2 << level) == 0 and block + (2 << level) <= last:
+                level += 1
+            node_start = block * bs
+            node_end = min((block + (1 << level)) * bs, self.size)
+            crc = crc32_combine(crc, int(self.tree[level][block >> level]), node_end - node_start)
+            block += 1 << level
+        return crc32_combine(crc, crc32(data[last * bs:end]), end - last * bs)
+
+    def hexdigest(self, name, start=0, end=None):
+        """Digest of the bytes start:end using the hashlib algorithm
+
+        Ranges starting at zero resume from the last checkpoint before the
+        end; other ranges have to be hashed in full.
+        """
+        if end is None or end > self.size:
+            end = self.size
+        bs = self.block_size
+        data = self.store.data
+        if start == 0:
+            span = bs * self.checkpoint_interval
+            needed = end // span
+            states = self.checkpoints.get(name, [])
+            if len(states) < needed:
+                self.update([name])
+                states = self.checkpoints.get(name, [])
+            count = min(len(states), needed)
+            if count > 0:
+                state = states[count - 1].copy()
+            else:
+                state = hashlib.new(name)
+            start = count * span
+        else:
+            state = hashlib.new(name)
+        for pos in xrange(start, end, bs):
+            state.update(data[pos:min(pos + bs, end)])
+        return state.hexdigest()
+
+
+class BlockHashJob(ThreadJob):
+    """Update a block hash index on a job thread
+
+    The callback is called in the GUI thread after the results have been
+    stored in the index.
+    """
+    def __init__(self, index, algorithms, callback):
+        ThreadJob.__init__(self)
+        self.index = index
+        self.update = index.prepare_update(algorithms)
+        self.callback = callback
+
+    def _start(self, dispatcher):
+        self.update.run()
+
+    def success_callback(self):
+        self.index.install_update(self.update)
+        self.callback(self)
+
+
+class RangeDigestJob(ThreadJob):
+    """Digests of a range of the data on a job thread
+
+    Ranges that don't start at zero can't resume from the checkpoints of an
+    index, so the whole range has to be hashed.  The callback is called in
+    the GUI thread with the job, whose digests attribute maps the algorithm
+    name to the hex digest.
+    """
+    def __init__(self, data, start, end, algorithms, callback, block_size=64 * 1024):
+        ThreadJob.__init__(self)
+        self.data = data
+        self.start = start
+        self.end = end
+        self.algorithms = algorithms
+        self.callback = callback
+        self.block_size = block_size
+        self.digests = {}
+
+    def _start(self, dispatcher):
+        for name in self.algorithms:
+            state = hashlib.new(name)
+            for pos in xrange(self.start, self.end, self.block_size):
+                state.update(self.data[pos:min(pos + self.block_size, self.end)])
+            self.digests[name] = state.hexdigest()
+
+    def success_callback(self):
+        self.callback(self)
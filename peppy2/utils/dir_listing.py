@@ -0,0 +1,297 @@
+"""Directory listings read on a background thread
+
+The file browser asks a DirectoryLister for the contents of a directory and
+gets the entries back in batches as the directory is read, so a directory
+with thousands of files (or one on a slow network mount) never blocks the
+GUI.  Finished listings are kept in a ListingCache and reused as long as the
+modification time of the directory hasn't changed.
+
+After a directory has been listed, the lister uses its idle time to list the
+subdirectories into the cache, so that browsing into them is instant, and to
+recognize the MIME types of the files.
+"""
+import os
+import stat
+import fnmatch
+import threading
+from collections import OrderedDict, deque
+
+try:
+    from scandir import scandir
+except ImportError:
+    scandir = None
+
+from peppy2.utils.batch_guess import guess_file
+
+import logging
+log = logging.getLogger(__name__)
+
+
+class DirEntry(object):
+    """A file or directory in a listing
+
+    mime is None until the MIME type has been recognized.
+    """
+    __slots__ = ['name', 'path', 'is_dir', 'size', 'mtime', 'mime']
+
+    def __init__(self, name, path, is_dir, size, mtime):
+        self.name = name
+        self.path = path
+        self.is_dir = is_dir
+        self.size = size
+        self.mtime = mtime
+        self.mime = None
+
+    def __repr__(self):
+        return "DirEntry(%s%s)" % (self.name, "/" if self.is_dir else "")
+
+
+def _iter_stats(path):
+    """Yield (name, stat result) for the entries of the directory, skipping
+    entries that can't be stat'ed, like broken links.
+    """
+    if scandir is not None:
+        for item in scandir(path):
+            try:
+                yield item.name, item.stat()
+            except OSError:
+                pass
+    else:
+        for name in os.listdir(path):
+            try:
+                yield name, os.stat(os.path.join(path, name))
+            except OSError:
+                pass
+
+
+def iter_entries(path, batch_size=256, show_hidden=False):
+    """Yield lists of DirEntry as the directory is read
+
+    Raises OSError if the directory can't be read.
+    """
+    batch = []
+    for name, st in _iter_stats(path):
+        if not show_hidden and name.startswith("."):
+            continue
+        batch.append(DirEntry(name, os.path.join(path, name), stat.S_ISDIR(st.st_mode), st.st_size, st.st_mtime))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def filter_entries(entries, filters):
+    """Return the directories and the files matching any of the wildcard
+    filters, or all the entries if there are no filters.
+    """
+    if not filters:
+        return list(entries)
+    return [e for e in entries if e.is_dir or any(fnmatch.fnmatch(e.name, f) for f in filters)]
+
+
+def sort_entries(entries):
+    """Sort directories before files, then by name ignoring case"""
+    entries.sort(key=lambda e: (not e.is_dir, e.name.lower(), e.name))
+    return entries
+
+
+def get_mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+class ListingCache(object):
+    """Complete listings of the most recently used directories
+
+    A listing is only returned if the directory's modification time is the
+    same as when the listing was read.  Shared between the GUI and lister
+    threads.
+    """
+    def __init__(self, max_dirs=64):
+        self.max_dirs = max_dirs
+        self.listings = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, path):
+        """Return the cached list of DirEntry, or None if there's no valid
+        listing
+        """
+        with self.lock:
+            item = self.listings.pop(path, None)
+        if item is None:
+            return None
+        mtime, entries = item
+        if get_mtime(path) != mtime:
+            return None
+        with self.lock:
+            self.listings[path] = item
+        return entries
+
+    def peek(self, path):
+        """Return the cached list of DirEntry without checking that it's
+        still valid, which doesn't touch the file system.
+        """
+        with self.lock:
+            item = self.listings.get(path)
+        if item is None:
+            return None
+        return item[1]
+
+    def __contains__(self, path):
+        with self.lock:
+            return path in self.listings
+
+    def put(self, path, mtime, entries):
+        """Save a listing, which must have been started after getting the
+        directory's modification time.
+        """
+        with self.lock:
+            self.listings.pop(path, None)
+            self.listings[path] = (mtime, entries)
+            while len(self.listings) > self.max_dirs:
+                self.listings.popitem(last=False)
+
+
+class DirectoryLister(object):
+    """Lists directories on a background thread
+
+    Requests from list_directory replace any request that hasn't finished and
+    any pending prefetching.  Callbacks are called from the lister thread, so
+    they must pass the results on to the GUI thread themselves.
+
+    @param callback: called with the request id, the directory, a list of
+    DirEntry, whether the listing is complete, and an error message or None.
+    The entries are batches in the order they're read until the listing is
+    complete; the final call has all the entries, sorted.
+    @param mime_callback: called with the directory after MIME types have
+    been recognized for some of its files
+    @param recognize: function setting the MIME type of a FileGuess, or None
+    to skip recognizing files
+    """
+    batch_size = 256
+
+    # Subdirectories and files of each listed directory that are prefetched
+    prefetch_dirs = 32
+    prefetch_mimes = 64
+
+    def __init__(self, callback, mime_callback=None, recognize=None, cache=None):
+        self.callback = callback
+        self.mime_callback = mime_callback
+        self.recognize = recognize
+        self.cache = cache if cache is not None else ListingCache()
+        self.request = None
+        self.request_id = 0
+        self.prefetch = deque()
+        self.condition = threading.Condition()
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="DirectoryLister")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def list_directory(self, path, filters=None):
+        """Start listing the directory, or the directory containing the path
+        if it isn't a directory, returning the id of the request that will be
+        passed to the callback.
+        """
+        with self.condition:
+            self.request_id += 1
+            self.request = (self.request_id, path, filters)
+            self.prefetch.clear()
+            self.condition.notify()
+            return self.request_id
+
+    def is_current(self, request_id):
+        return request_id == self.request_id
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        self.thread.join()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.running and self.request is None and not self.prefetch:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                if self.request is not None:
+                    request, self.request = self.request, None
+                    task = None
+                else:
+                    request = None
+                    task = self.prefetch.popleft()
+            try:
+                if request is not None:
+                    self.list_request(*request)
+                else:
+                    task[0](*task[1:])
+            except Exception, e:
+                log.error("Directory lister failed: %s" % e)
+
+    def list_request(self, request_id, path, filters):
+        if not os.path.isdir(path):
+            path = os.path.dirname(path)
+        entries = self.cache.get(path)
+        if entries is not None:
+            self.callback(request_id, path, filter_entries(entries, filters), True, None)
+        else:
+            entries = self.read_directory(path, request_id, filters)
+            if entries is None:
+                return
+        with self.condition:
+            if not self.is_current(request_id):
+                return
+            # Directories are sorted first
+            for entry in entries[:self.prefetch_dirs]:
+                if entry.is_dir:
+                    self.prefetch.append((self.prefetch_directory, entry.path))
+            if self.recognize is not None:
+                files = [e for e in filter_entries(entries, filters) if not e.is_dir and e.mime is None]
+                if files:
+                    self.prefetch.append((self.recognize_files, path, files[:self.prefetch_mimes]))
+
+    def read_directory(self, path, request_id=None, filters=None):
+        """Read the directory into the cache, sending the batches to the
+        callback if there is a request id.  Returns the sorted list of all
+        the entries, or None if the directory can't be read or the request
+        was replaced by a newer one.
+        """
+        mtime = get_mtime(path)
+        entries = []
+        try:
+            for batch in iter_entries(path, self.batch_size):
+                if request_id is not None:
+                    if not self.is_current(request_id):
+                        return None
+                    self.callback(request_id, path, filter_entries(batch, filters), False, None)
+                entries.extend(batch)
+        except OSError, e:
+            if request_id is not None:
+                self.callback(request_id, path, [], True, str(e))
+            return None
+        sort_entries(entries)
+        if mtime is not None:
+            self.cache.put(path, mtime, entries)
+        if request_id is not None:
+            self.callback(request_id, path, filter_entries(entries, filters), True, None)
+        return entries
+
+    def prefetch_directory(self, path):
+        if self.cache.get(path) is None:
+            self.read_directory(path)
+
+    def recognize_files(self, path, entries):
+        for entry in entries:
+            if not self.running or self.request is not None:
+                # The user has moved on; the rest are recognized if the
+                # directory is shown again
+                return
+            uri, guess, error = guess_file(entry.path, self.recognize)
+            entry.mime = guess.metadata.mime if guess is not None else ""
+        if self.mime_callback is not None:
+            self.mime_callback(path)
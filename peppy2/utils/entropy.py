@@ -0,0 +1,147 @@
+"""Byte statistics of large arrays at multiple resolutions
+
+A histogram of byte values is computed for each fixed size block, and pairs of
+histograms are summed to form the coarser levels of a pyramid.  Because
+histograms add exactly, the entropy and byte class fractions at any level are
+the same as if they had been computed directly from the bytes, so zooming out
+never has to look at the data again.
+"""
+import numpy as np
+
+from peppy2.utils.fileutil import chunk_size
+from peppy2.utils.jobs import ThreadJob
+
+import logging
+log = logging.getLogger(__name__)
+
+
+# Bytes counted as ASCII text: printable characters plus tab, LF and CR
+ascii_values = np.zeros(256, dtype=np.bool)
+ascii_values[32:127] = True
+ascii_values[[9, 10, 13]] = True
+
+
+def block_histograms(data, block_size):
+    """Return an (n, 256) array of the byte counts of each block
+
+    The last block may be partial.
+    """
+    count = (data.size + block_size - 1) // block_size
+    hist = np.zeros((count, 256), dtype=np.int32)
+    # Chunks are a whole number of blocks
+    step = max(chunk_size // block_size, 1) * block_size
+    base = (np.arange(min(step, data.size), dtype=np.int32) // block_size) * 256
+    for pos in xrange(0, data.size, step):
+        chunk = data[pos:pos + step]
+        first = pos // block_size
+        blocks = (chunk.size + block_size - 1) // block_size
+        index = base[:chunk.size] + chunk
+        hist[first:first + blocks] = np.bincount(index, minlength=blocks * 256).reshape((blocks, 256))
+    return hist
+
+
+def entropy(hist):
+    """Shannon entropy in bits per byte (0 to 8) of each histogram
+    """
+    totals = hist.sum(axis=1).astype(np.float64)
+    totals[totals == 0] = 1
+    p = hist / totals[:, np.newaxis]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        logs = np.where(p > 0, np.log2(p), 0)
+    return -(p * logs).sum(axis=1)
+
+
+def byte_classes(hist):
+    """Fraction of zero bytes, ASCII text bytes and bytes above 127
+    """
+    totals = hist.sum(axis=1).astype(np.float64)
+    totals[totals == 0] = 1
+    zero = hist[:, 0] / totals
+    ascii = hist[:, ascii_values].sum(axis=1) / totals
+    high = hist[:, 128:].sum(axis=1) / totals
+    return zero, ascii, high
+
+
+class OverviewLevel(object):
+    """Statistics for one level of the pyramid"""
+    def __init__(self, hist, block_size):
+        self.block_size = block_size
+        self.entropy = entropy(hist)
+        self.zero, self.ascii, self.high = byte_classes(hist)
+
+    def __len__(self):
+        return self.entropy.size
+
+
+class OverviewPyramid(object):
+    """Histograms of the data at block_size and every power of two multiple
+    """
+    def __init__(self, data, block_size=64 * 1024):
+        self.size = data.size
+        self.block_size = block_size
+        self.histograms = [block_histograms(data, block_size)]
+        while self.histograms[-1].shape[0] > 1:
+            # The counts of the coarser levels can exceed 2**31 for large data
+            below = self.histograms[-1].astype(np.int64)
+            if below.shape[0] % 2:
+                below = np.vstack((below, np.zeros((1, 256), dtype=np.int64)))
+            self.histograms.append(below[0::2] + below[1::2])
+        self.levels = {}
+
+    def get_level(self, level):
+        """Return the OverviewLevel, computing its statistics the first time
+        """
+        if level not in self.levels:
+            self.levels[level] = OverviewLevel(self.histograms[level], self.block_size << level)
+        return self.levels[level]
+
+    def get_level_for(self, num_buckets):
+        """Return the coarsest level with at least num_buckets buckets, or the
+        finest level if the data is too small.
+        """
+        level = 0
+        while level + 1 < len(self.histograms) and self.histograms[level + 1].shape[0] >= num_buckets:
+            level += 1
+        return self.get_level(level)
+
+    def update(self, data, start, end):
+        """Recompute the histograms of the blocks touched by start:end
+
+        Only valid if the length of the data hasn't changed.
+        """
+        if start >= end:
+            return
+        bs = self.block_size
+        first = start // bs
+        last = (end - 1) // bs
+        self.histograms[0][first:last + 1] = block_histograms(data[first * bs:(last + 1) * bs], bs)
+        for level in range(1, len(self.histograms)):
+            first //= 2
+            last //= 2
+            below = self.histograms[level - 1]
+            for i in range(first, last + 1):
+                total = below[2 * i].astype(np.int64)
+                if 2 * i + 1 < below.shape[0]:
+                    total += below[2 * i + 1]
+                self.histograms[level][i] = total
+        self.levels = {}
+
+
+class OverviewJob(ThreadJob):
+    """Build an OverviewPyramid on a job thread
+
+    The callback is called in the GUI thread with the job, whose pyramid
+    attribute holds the result.
+    """
+    def __init__(self, data, callback, block_size=64 * 1024):
+        ThreadJob.__init__(self)
+        self.data = data
+        self.callback = callback
+        self.block_size = block_size
+        self.pyramid = None
+
+    def _start(self, dispatcher):
+        self.pyramid = OverviewPyramid(self.data, self.block_size)
+
+    def success_callback(self):
+        self.callback(self)
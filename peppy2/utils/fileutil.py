@@ -0,0 +1,118 @@
+"""Utilities for safely writing files
+
+Saving should never leave a partially written file in place of the original,
+and saving a small change to a large file shouldn't require rewriting the
+entire file.
+"""
+import os
+import shutil
+import tempfile
+
+import logging
+log = logging.getLogger(__name__)
+
+
+# Writes are performed in large chunks to keep the number of system calls
+# (and temporary string copies) low
+chunk_size = 4 * 1024 * 1024
+
+
+def iter_array_chunks(data, size=None):
+    """Generator yielding the bytes of the numpy array as a series of strings
+    """
+    if size is None:
+        size = chunk_size
+    for start in xrange(0, data.size, size):
+        yield data[start:start + size].tostring()
+
+
+def fsync_directory(dirname):
+    """Flush the directory entry so a rename survives a crash
+
+    Not possible on all platforms, so failures are ignored.
+    """
+    if os.name == 'nt':
+        return
+    try:
+        fd = os.open(dirname, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def atomic_write(path, chunks):
+    """Write the sequence of strings to path, replacing any existing file
+
+    The data is written to a temporary file in the same directory and synced
+    to disk before being renamed over the original, so at any point in time
+    the file on disk is either the complete old version or the complete new
+    version.
+    """
+    path = os.path.abspath(path)
+    dirname, basename = os.path.split(path)
+    fd, temp_path = tempfile.mkstemp(prefix=".%s." % basename, suffix=".tmp", dir=dirname)
+    try:
+        fh = os.fdopen(fd, "wb")
+        try:
+            for chunk in chunks:
+                fh.write(chunk)
+            fh.flush()
+            os.fsync(fh.fileno())
+        finally:
+            fh.close()
+        if os.path.exists(path):
+            try:
+                shutil.copymode(path, temp_path)
+            except OSError:
+                log.warning("Can't copy permissions of %s" % path)
+            if os.name == 'nt':
+                # Windows doesn't allow rename to an existing file
+                os.remove(path)
+        os.rename(temp_path, path)
+    except:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    fsync_directory(dirname)
+
+
+def patch_in_place(path, data, runs):
+    """Overwrite byte ranges of an existing file
+
+    @param path: file to modify; its length must not change
+    @param data: numpy array containing the entire new contents of the file
+    @param runs: list of (start, end) byte ranges that will be written
+    """
+    fh = open(path, "r+b")
+    try:
+        for start, end in runs:
+            fh.seek(start)
+            for chunk_start in xrange(start, end, chunk_size):
+                chunk_end = min(chunk_start + chunk_size, end)
+                fh.write(data[chunk_start:chunk_end].tostring())
+        fh.flush()
+        os.fsync(fh.fileno())
+    finally:
+        fh.close()
+
+
+def readahead(path, length):
+    """Ask the OS to read the start of the file into the page cache
+
+    Uses posix_fadvise where it's available; otherwise the data is read and
+    thrown away, which has the same effect.
+    """
+    with open(path, "rb") as fh:
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(fh.fileno(), 0, length, os.POSIX_FADV_WILLNEED)
+            return
+        while length > 0:
+            data = fh.read(min(length, chunk_size))
+            if not data:
+                break
+            length -= len(data)
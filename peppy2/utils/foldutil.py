@@ -0,0 +1,169 @@
+"""Fold computations for Scintilla fold levels
+
+Scintilla only provides per-line calls to query and change the folding state,
+which is far too slow to drive from python on large files.  Instead, the fold
+levels are read into a numpy array once and the fold hierarchy is computed
+here, so the caller only needs to apply the resulting visibility changes as a
+small number of line ranges.
+
+The flag values are the same as the wx.stc.STC_FOLDLEVEL* constants, copied
+here so this module doesn't depend on wx.
+"""
+import numpy as np
+
+FOLDLEVELBASE = 0x400
+FOLDLEVELWHITEFLAG = 0x1000
+FOLDLEVELHEADERFLAG = 0x2000
+FOLDLEVELNUMBERMASK = 0x0FFF
+
+
+def visibility_runs(visibility):
+    """Convert a visibility array into line ranges
+
+    @param visibility: int8 array with one entry per line, 1 for lines that
+    should be shown, 0 for lines that should be hidden, and -1 for lines that
+    aren't changed.
+
+    @returns: list of (first_line, last_line, show) tuples, where last_line
+    is inclusive to match ShowLines and HideLines.
+    """
+    changed = np.flatnonzero(visibility >= 0)
+    if changed.size == 0:
+        return []
+    # Split wherever the line numbers aren't consecutive or the state changes
+    values = visibility[changed]
+    breaks = np.flatnonzero((np.diff(changed) != 1) | (np.diff(values) != 0)) + 1
+    starts = np.concatenate(([0], breaks))
+    ends = np.concatenate((breaks, [changed.size])) - 1
+    return [(int(changed[s]), int(changed[e]), bool(values[s])) for s, e in zip(starts, ends)]
+
+
+def offset_fold_changes(runs, changes, offset):
+    """Shift the results of a L{FoldStructure} built from the fold levels
+    starting at line offset to document line numbers
+    """
+    runs = [(first + offset, last + offset, show) for first, last, show in runs]
+    changes = [(line + offset, expanded) for line, expanded in changes]
+    return runs, changes
+
+
+class FoldStructure(object):
+    """Fold hierarchy computed from the fold levels of every line
+    """
+    def __init__(self, levels):
+        self.levels = np.asarray(levels, dtype=np.int32)
+        self.numbers = self.levels & FOLDLEVELNUMBERMASK
+        self.white = (self.levels & FOLDLEVELWHITEFLAG) != 0
+        self.headers = np.flatnonzero(self.levels & FOLDLEVELHEADERFLAG)
+        self.header_last_children = self.find_last_children(self.headers)
+        self.last_child_map = dict(zip(self.headers.tolist(), self.header_last_children.tolist()))
+
+    def __len__(self):
+        return self.levels.size
+
+    def find_last_children(self, lines):
+        """Equivalent to calling Scintilla's GetLastChild(line, -1) for each
+        of the lines.
+
+        Rather than scanning forward from each line, all lines at the same
+        fold level are handled at once by searching for the next non-blank
+        line with a fold level less than or equal to theirs.
+        """
+        lines = np.asarray(lines, dtype=np.int64)
+        last = np.empty(lines.size, dtype=np.int64)
+        if lines.size == 0:
+            return last
+        count = self.levels.size
+        numbers = self.numbers[lines]
+        for number in np.unique(numbers):
+            which = np.flatnonzero(numbers == number)
+            starts = lines[which]
+            stops = np.flatnonzero(~self.white & (self.numbers <= number))
+            index = np.searchsorted(stops, starts, side='right')
+            stop = np.where(index < stops.size, stops[np.minimum(index, stops.size - 1)], count)
+            result = stop - 1
+
+            # Blank lines at the end of the fold that belong to the parent
+            # are given back, but only a single line as Scintilla does
+            stop_number = np.where(stop < count, self.numbers[np.minimum(stop, count - 1)], FOLDLEVELBASE)
+            seek_back = (result > starts) & (number > stop_number) & self.white[result]
+            result[seek_back] -= 1
+            last[which] = result
+        return last
+
+    def get_last_child(self, line):
+        if line in self.last_child_map:
+            return self.last_child_map[line]
+        return int(self.find_last_children([line])[0])
+
+    def get_top_level_headers(self):
+        return self.headers[self.numbers[self.headers] == FOLDLEVELBASE]
+
+    def get_coverage(self, starts, ends):
+        """Count the number of ranges covering each line
+
+        @param starts: array of first lines of the ranges
+        @param ends: array of last lines (inclusive) of the ranges
+        """
+        count = self.levels.size
+        diff = np.bincount(starts, minlength=count + 1)[:count + 1] - np.bincount(ends + 1, minlength=count + 1)[:count + 1]
+        return np.cumsum(diff)[:count]
+
+    def expand(self, line, do_expand, force=False, vis_levels=0, is_expanded=None):
+        """Compute the effect of the wxPython demo's recursive Expand function
+
+        Rather than recursing, the number of nested folds enclosing each line
+        is computed for all lines at once.
+
+        @param is_expanded: function returning the current expanded state
+        of a header line; only needed if force is False
+
+        @returns: tuple containing the list of visibility runs, the list of
+        (line, expanded) changes for fold headers, and the line following
+        the fold.
+        """
+        visibility = np.empty(self.levels.size, dtype=np.int8)
+        visibility.fill(-1)
+        changes = []
+        last_child = self.get_last_child(line)
+        first = line + 1
+        if first <= last_child and (force or do_expand):
+            lo = np.searchsorted(self.headers, line, side='right')
+            hi = np.searchsorted(self.headers, last_child, side='right')
+            children = self.headers[lo:hi]
+            child_last = self.header_last_children[lo:hi]
+            if force:
+                depth = self.get_coverage(children + 1, child_last)[first:last_child + 1]
+                visibility[first:last_child + 1] = (vis_levels - depth) > 0
+                child_state = (vis_levels - depth[children - first]) > 1
+                changes = zip(children.tolist(), child_state.tolist())
+            else:
+                collapsed = np.array([not is_expanded(c) for c in children.tolist()], dtype=np.bool)
+                hidden = self.get_coverage(children[collapsed] + 1, child_last[collapsed])[first:last_child + 1]
+                visibility[first:last_child + 1] = np.where(hidden > 0, -1, 1)
+        return visibility_runs(visibility), changes, last_child + 1
+
+    def expand_all(self, is_expanded):
+        """Expand all the top level folds, leaving nested folds in their
+        current state.
+        """
+        top = self.get_top_level_headers()
+        changes = [(line, True) for line in top.tolist()]
+        top_last = np.array([self.last_child_map[line] for line, state in changes], dtype=np.int64)
+        inside = self.get_coverage(top + 1, top_last) > 0
+        nested = self.headers[inside[self.headers]]
+        collapsed = np.array([not is_expanded(c) for c in nested.tolist()], dtype=np.bool)
+        nested_last = self.find_last_children(nested[collapsed])
+        hidden = self.get_coverage(nested[collapsed] + 1, nested_last) > 0
+        visibility = np.where(inside & ~hidden, 1, -1).astype(np.int8)
+        return visibility_runs(visibility), changes
+
+    def collapse_all(self):
+        """Collapse all the top level folds
+        """
+        top = self.get_top_level_headers()
+        changes = [(line, False) for line in top.tolist()]
+        top_last = np.array([self.last_child_map[line] for line, state in changes], dtype=np.int64)
+        inside = self.get_coverage(top + 1, top_last) > 0
+        visibility = np.where(inside, 0, -1).astype(np.int8)
+        return visibility_runs(visibility), changes
@@ -0,0 +1,201 @@
+"""Tiled rendering of large images at any zoom factor
+
+Images are drawn a tile at a time so that only the visible part of the image
+is ever scaled.  Zooming out uses a resolution pyramid where each level is
+half the size of the one below it, made by averaging 2x2 blocks of pixels.
+The pyramid is built lazily, one tile at a time, and the tiles of the reduced
+levels share a least recently used cache with a fixed memory budget, so
+panning and zooming a huge image uses bounded memory.
+
+The pixels come from an image source, which only needs width, height and
+channels attributes and a get_region method returning an (h, w, channels)
+uint8 array.  ArraySource wraps numpy arrays, including memory mapped files.
+"""
+from collections import OrderedDict
+
+import numpy as np
+
+import logging
+log = logging.getLogger(__name__)
+
+
+class LRUCache(object):
+    """Cache with a limit on the total size of its values
+
+    The size of each value is given when it's added; when the total exceeds
+    max_size the least recently used values are dropped.
+    """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self.items = OrderedDict()
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, key):
+        return key in self.items
+
+    def get(self, key, default=None):
+        try:
+            value, size = self.items.pop(key)
+        except KeyError:
+            return default
+        self.items[key] = (value, size)
+        return value
+
+    def put(self, key, value, size):
+        if key in self.items:
+            self.size -= self.items.pop(key)[1]
+        self.items[key] = (value, size)
+        self.size += size
+        while self.size > self.max_size and len(self.items) > 1:
+            old_key, (old_value, old_size) = self.items.popitem(last=False)
+            self.size -= old_size
+
+    def clear(self):
+        self.items.clear()
+        self.size = 0
+
+
+def area_downsample(array):
+    """Halve the width and height of an (h, w, c) image by averaging 2x2
+    blocks.  Odd sizes are padded by repeating the last row or column, so
+    edge pixels are the average of the pixels that exist.
+    """
+    h, w = array.shape[0:2]
+    if h % 2 or w % 2:
+        array = np.pad(array, ((0, h % 2), (0, w % 2), (0, 0)), mode='edge')
+    total = array[0::2, 0::2].astype(np.uint16)
+    total += array[1::2, 0::2]
+    total += array[0::2, 1::2]
+    total += array[1::2, 1::2]
+    return ((total + 2) // 4).astype(np.uint8)
+
+
+class ArraySource(object):
+    """Image source using an (h, w, 3) RGB array and an optional (h, w) alpha
+    array.  The arrays may be views, e.g. of a wx.Image buffer or a memory
+    mapped file.
+    """
+    def __init__(self, rgb, alpha=None):
+        self.rgb = rgb
+        self.alpha = alpha
+        self.height, self.width = rgb.shape[0:2]
+        self.channels = 3 if alpha is None else 4
+
+    def get_region(self, x, y, w, h):
+        rgb = self.rgb[y:y + h, x:x + w]
+        if self.alpha is None:
+            return rgb
+        region = np.empty((rgb.shape[0], rgb.shape[1], 4), dtype=np.uint8)
+        region[:,:,0:3] = rgb
+        region[:,:,3] = self.alpha[y:y + h, x:x + w]
+        return region
+
+    def crop(self, x, y, w, h):
+        """Return a source for part of the image without copying"""
+        alpha = None if self.alpha is None else self.alpha[y:y + h, x:x + w]
+        return ArraySource(self.rgb[y:y + h, x:x + w], alpha)
+
+
+class TiledImage(object):
+    """Renders tiles of an image source at arbitrary zoom factors
+
+    Display tiles are tile_size pixels square in zoomed coordinates.  For
+    zoom factors below 1, the pyramid level with the next larger scale is
+    sampled so each display pixel is an average of the source pixels it
+    covers.
+    """
+    def __init__(self, source, tile_size=256, cache_size=128 * 1024 * 1024):
+        self.source = source
+        self.tile_size = tile_size
+        self.cache = LRUCache(cache_size)
+
+    def get_level_size(self, level):
+        scale = 1 << level
+        return ((self.source.width + scale - 1) // scale, (self.source.height + scale - 1) // scale)
+
+    def get_level_tile(self, level, i, j):
+        """Return the tile in column i, row j of a reduced pyramid level"""
+        key = ("level", level, i, j)
+        tile = self.cache.get(key)
+        if tile is None:
+            t = self.tile_size
+            tile = area_downsample(self.get_level_region(level - 1, 2 * i * t, 2 * j * t, 2 * t, 2 * t))
+            self.cache.put(key, tile, tile.nbytes)
+        return tile
+
+    def get_level_region(self, level, x, y, w, h):
+        """Return the region of the pyramid level, clipped to the level size
+
+        Level 0 is the source itself, which is not cached.
+        """
+        lw, lh = self.get_level_size(level)
+        w = min(w, lw - x)
+        h = min(h, lh - y)
+        if level == 0:
+            return self.source.get_region(x, y, w, h)
+        region = np.empty((h, w, self.source.channels), dtype=np.uint8)
+        t = self.tile_size
+        for j in range(y // t, (y + h - 1) // t + 1):
+            for i in range(x // t, (x + w - 1) // t + 1):
+                tile = self.get_level_tile(level, i, j)
+                # Intersection of the tile and the region in level coords
+                x0 = max(x, i * t)
+                y0 = max(y, j * t)
+                x1 = min(x + w, i * t + tile.shape[1])
+                y1 = min(y + h, j * t + tile.shape[0])
+                region[y0 - y:y1 - y, x0 - x:x1 - x] = tile[y0 - j * t:y1 - j * t, x0 - i * t:x1 - i * t]
+        return region
+
+    def get_display_size(self, zoom):
+        return (int(self.source.width * zoom), int(self.source.height * zoom))
+
+    def get_level_for_zoom(self, zoom):
+        """Finest level that's no smaller than the zoomed image"""
+        level = 0
+        while zoom * (2 << level) <= 1.0 and self.get_level_size(level)[0] > 1:
+            level += 1
+        return level
+
+    def get_display_tile(self, zoom, tx, ty):
+        """Return the pixels of the display tile at column tx, row ty, or
+        None if the tile is outside the zoomed image.  Tiles at the right and
+        bottom edges may be smaller than tile_size.
+
+        Display tiles aren't cached here; callers should cache them in
+        whatever form they are drawn, e.g. as bitmaps.
+        """
+        dw, dh = self.get_display_size(zoom)
+        t = self.tile_size
+        x0 = tx * t
+        y0 = ty * t
+        w = min(t, dw - x0)
+        h = min(t, dh - y0)
+        if w <= 0 or h <= 0:
+            return None
+        level = self.get_level_for_zoom(zoom)
+        scale = zoom * (1 << level)
+        lw, lh = self.get_level_size(level)
+        # Nearest level pixel for each display pixel
+        xs = np.minimum(((x0 + np.arange(w)) / scale).astype(np.int64), lw - 1)
+        ys = np.minimum(((y0 + np.arange(h)) / scale).astype(np.int64), lh - 1)
+        region = self.get_level_region(level, int(xs[0]), int(ys[0]), int(xs[-1] - xs[0] + 1), int(ys[-1] - ys[0] + 1))
+        return np.ascontiguousarray(region[(ys - ys[0])[:, np.newaxis], (xs - xs[0])[np.newaxis, :]])
+
+    def get_visible_tiles(self, zoom, x, y, w, h):
+        """Return the (tx, ty) of the display tiles that intersect the
+        rectangle in zoomed coordinates
+        """
+        dw, dh = self.get_display_size(zoom)
+        t = self.tile_size
+        x1 = min(x + w, dw)
+        y1 = min(y + h, dh)
+        x = max(x, 0)
+        y = max(y, 0)
+        tiles = []
+        for ty in range(y // t, (y1 + t - 1) // t):
+            for tx in range(x // t, (x1 + t - 1) // t):
+                tiles.append((tx, ty))
+        return tiles
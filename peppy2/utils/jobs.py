@@ -14,6 +14,11 @@ log.setLevel(logging.DEBUG)
 
 
 class Job(object):
+    # Jobs are run in order by a dispatcher for their queue, so jobs in
+    # different queues don't wait for each other.  Short jobs that must not be
+    # delayed by long running work (e.g. autosave) use their own queue.
+    queue_name = "default"
+    
     def __init__(self, job_id=None):
         self.job_id = job_id
         self.parent = None
@@ -72,6 +77,17 @@ class Job(object):
         pass
 
 
+class ThreadJob(Job):
+    """Job that runs in a thread of the main process
+
+    Useful for I/O bound work or for numpy operations that release the GIL.
+    Shares memory with the GUI, so the job must not modify any data that the
+    GUI thread may be using at the same time.
+    """
+    def _start(self, dispatcher):
+        raise RuntimeError("Abstract method")
+
+
 class ProcessJob(Job):
     def _start(self, results):
         raise RuntimeError("Abstract method")
@@ -114,8 +130,14 @@ class Worker(multiprocessing.Process):
 
 
 class JobDispatcher(object):
+    # Single use dispatchers are created for each job and exit when the job
+    # has completed, as opposed to persistent dispatchers that are started
+    # once and process jobs from their queue until shutdown.
+    single_use = False
+    
     def __init__(self, share_input_queue_with=None):
         self._want_abort = False
+        self.queue_name = Job.queue_name
         if share_input_queue_with is not None:
             self._queue = share_input_queue_with._queue
         else:
@@ -153,6 +175,9 @@ class ThreadJobDispatcher(threading.Thread, JobDispatcher):
     def can_handle(self, job):
         return isinstance(job, ThreadJob)
     
+    def _progress_update(self, item):
+        self._manager._progress_report(item)
+    
     def run(self):
         log.debug("starting thread...")
         while True:
@@ -248,6 +273,8 @@ class LargeMemoryWorker(multiprocessing.Process):
         self._progress.put(None)
 
 class LargeMemoryJobDispatcher(ThreadJobDispatcher):
+    single_use = True
+    
     def __init__(self, *args, **kwargs):
         ThreadJobDispatcher.__init__(self, *args, **kwargs)
         self._multiprocessing_progress = multiprocessing.Queue()
@@ -341,7 +368,7 @@ class JobManager(object):
         self.job_id_handlers = {}
         self._finished = Queue.Queue()
         self.dispatchers = []
-        self.dispatcher_classes = [LargeMemoryJobDispatcher]
+        self.dispatcher_classes = [ThreadJobDispatcher, LargeMemoryJobDispatcher]
         self.timer = Timer(event_callback)
     
     def start_ticks(self, resolution, expire_time):
@@ -352,12 +379,16 @@ class JobManager(object):
 
     def find_dispatcher(self, job):
         for dispatcher in self.dispatchers:
-            if dispatcher.can_handle(job):
+            if dispatcher.can_handle(job) and dispatcher.queue_name == job.queue_name:
                 return dispatcher
         for dispatcher_cls in self.dispatcher_classes:
             if dispatcher_cls.can_handle(job):
                 dispatcher = dispatcher_cls()
-                dispatcher.set_manager(self)
+                dispatcher.queue_name = job.queue_name
+                if dispatcher.single_use:
+                    dispatcher.set_manager(self)
+                else:
+                    self.start_dispatcher(dispatcher)
                 return dispatcher
         return None
             
@@ -0,0 +1,124 @@
+"""Most recently used lists with metadata for each entry
+
+The entries are kept in an OrderedDict from the least to the most recently
+used, so moving an entry to the front is a delete and an append instead of a
+search through a list.  Each entry has a dict of metadata, e.g. the MIME type
+of a file or the position of the view when it was closed.
+
+Lists are saved as one line per entry, most recent first.  Entries with
+metadata are saved as JSON objects; entries without are saved as the plain
+uri, which is also the format of files written by older versions.
+"""
+import json
+from collections import OrderedDict
+from itertools import islice
+
+import logging
+log = logging.getLogger(__name__)
+
+
+class MRUList(object):
+    """Ordered set of uris, most recently used first
+
+    @param max_size: maximum number of entries kept, or None for no limit
+    """
+    def __init__(self, max_size=None):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, uri):
+        return uri in self.entries
+
+    def __iter__(self):
+        return reversed(self.entries)
+
+    def __repr__(self):
+        return "MRUList(%s)" % list(self)
+
+    def get(self, uri):
+        """Return the metadata of the entry, or None if it isn't in the list"""
+        return self.entries.get(uri)
+
+    def add(self, uri, **metadata):
+        """Move the entry to the front, adding it if necessary, and merge the
+        metadata into the existing metadata.
+        """
+        entry = self.entries.pop(uri, None)
+        if entry is None:
+            entry = {}
+        entry.update(metadata)
+        self.entries[uri] = entry
+        self.trim()
+
+    def update(self, uri, **metadata):
+        """Merge the metadata into an entry without changing its place in the
+        list.  Returns False if the entry isn't in the list.
+        """
+        entry = self.entries.get(uri)
+        if entry is None:
+            return False
+        entry.update(metadata)
+        return True
+
+    def remove(self, uri):
+        self.entries.pop(uri, None)
+
+    def trim(self):
+        if self.max_size is not None:
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def iter_items(self, count=None):
+        """Yield (uri, metadata) pairs, most recent first
+
+        @param count: maximum number of entries, or None for all of them
+        """
+        for uri in islice(self, count):
+            yield uri, self.entries[uri]
+
+    def to_lines(self):
+        """Return the list as unicode lines, most recent first"""
+        return [format_line(uri, metadata) for uri, metadata in self.iter_items()]
+
+    def from_lines(self, lines):
+        """Replace the entries with those parsed from the lines, ignoring
+        lines that can't be parsed.
+        """
+        self.entries = OrderedDict()
+        parsed = []
+        for line in lines:
+            item = parse_line(line)
+            if item is not None:
+                parsed.append(item)
+        # Lines are most recent first, so the oldest is added first
+        for uri, metadata in reversed(parsed):
+            self.entries.pop(uri, None)
+            self.entries[uri] = metadata
+        self.trim()
+
+
+def format_line(uri, metadata):
+    if not metadata:
+        return uri
+    item = dict(metadata)
+    item['uri'] = uri
+    return json.dumps(item, sort_keys=True)
+
+
+def parse_line(line):
+    """Return (uri, metadata) for a line, or None if it's blank or bad JSON"""
+    line = line.strip()
+    if not line:
+        return None
+    if line.startswith("{"):
+        try:
+            item = json.loads(line)
+            uri = item.pop('uri')
+        except (ValueError, KeyError, AttributeError), e:
+            log.warning("Skipping bad line in recent files list: %s" % e)
+            return None
+        return uri, item
+    return line, {}
@@ -0,0 +1,92 @@
+"""Utilities for lists of byte ranges
+
+Ranges are (start, end) tuples using python slice semantics.  Range lists are
+kept sorted and non-overlapping; adjacent ranges are merged.
+"""
+
+
+def add_range(ranges, start, end):
+    """Return a new range list including the range start:end
+    """
+    if start >= end:
+        return list(ranges)
+    merged = []
+    i = 0
+    count = len(ranges)
+    while i < count and ranges[i][1] < start:
+        merged.append(ranges[i])
+        i += 1
+    while i < count and ranges[i][0] <= end:
+        start = min(start, ranges[i][0])
+        end = max(end, ranges[i][1])
+        i += 1
+    merged.append((start, end))
+    merged.extend(ranges[i:])
+    return merged
+
+
+def merge_ranges(ranges):
+    """Return a normalized range list from an arbitrary list of ranges
+    """
+    merged = []
+    for start, end in sorted(ranges):
+        if start >= end:
+            continue
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def shift_ranges(ranges, start, end, new_length):
+    """Return a new range list adjusted for the replacement of the bytes
+    start:end with new_length bytes.
+
+    Ranges (or parts of ranges) before the replacement are unchanged, those
+    after are shifted by the change in length and any part inside the
+    replaced region is dropped.
+    """
+    delta = new_length - (end - start)
+    shifted = []
+    for r_start, r_end in ranges:
+        if r_end <= start:
+            shifted.append((r_start, r_end))
+            continue
+        if r_start < start:
+            shifted.append((r_start, start))
+        if r_end > end:
+            shifted.append((max(r_start, end) + delta, r_end + delta))
+    return merge_ranges(shifted)
+
+
+class ChangeAccumulator(object):
+    """Merge a series of byte replacements into the list of ranges that must
+    be redisplayed.
+
+    The ranges are kept in the coordinates of the data after all the changes,
+    so earlier ranges are shifted by later insertions and deletions.  Once the
+    length has changed, everything after the change has moved and is dirty.
+    """
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.ranges = []
+        self.length_changed = False
+
+    def is_empty(self):
+        return not self.ranges and not self.length_changed
+
+    def add(self, start, old_length, new_length, total_length):
+        """Add the replacement of old_length bytes at start by new_length
+        bytes, where total_length is the length of the data after the change.
+        """
+        self.ranges = shift_ranges(self.ranges, start, start + old_length, new_length)
+        if old_length == new_length:
+            end = start + new_length
+        else:
+            end = total_length
+            self.length_changed = True
+        self.ranges = add_range(self.ranges, start, end)
@@ -0,0 +1,197 @@
+"""Memory mapped uncompressed images
+
+Binary PBM/PGM/PPM files and headerless raw pixel dumps store the pixels
+uncompressed, so instead of decoding the whole image the file is memory
+mapped and only the pixels of the requested region are converted to RGB.
+Opening is instant and the image size isn't limited by the available memory.
+"""
+import numpy as np
+
+import logging
+log = logging.getLogger(__name__)
+
+
+class RawImageError(ValueError):
+    pass
+
+
+# name -> (bytes per pixel, numpy dtype of a sample, samples per pixel)
+pixel_formats = {
+    "gray1": (0, np.uint8, 1),
+    "gray8": (1, np.uint8, 1),
+    "gray16le": (2, np.dtype("<u2"), 1),
+    "gray16be": (2, np.dtype(">u2"), 1),
+    "rgb24": (3, np.uint8, 3),
+    "bgr24": (3, np.uint8, 3),
+    "rgba32": (4, np.uint8, 4),
+    "rgb48be": (6, np.dtype(">u2"), 3),
+    }
+
+# MIME types of the files handled by open_pnm
+pnm_mime_types = ["image/x-portable-bitmap", "image/x-portable-graymap", "image/x-portable-pixmap"]
+
+pixel_format_names = ["gray8", "gray16le", "gray16be", "rgb24", "bgr24", "rgba32", "rgb48be", "gray1"]
+
+
+class RawImageFormat(object):
+    """Layout of the pixels in a file
+
+    @param width: pixels per row
+    @param height: number of rows
+    @param pixel_format: one of pixel_format_names
+    @param offset: byte offset of the first row
+    @param stride: bytes from the start of one row to the next, or None if
+    the rows are packed
+    @param maxval: largest sample value for 16 bit formats
+    """
+    def __init__(self, width, height, pixel_format="gray8", offset=0, stride=None, maxval=None):
+        if pixel_format not in pixel_formats:
+            raise RawImageError("Unknown pixel format %s" % pixel_format)
+        if width <= 0 or height <= 0:
+            raise RawImageError("Image size must be positive")
+        self.width = width
+        self.height = height
+        self.pixel_format = pixel_format
+        self.offset = offset
+        if stride is None:
+            stride = self.get_row_bytes()
+        elif stride < self.get_row_bytes():
+            raise RawImageError("Stride %d is smaller than a row of %d bytes" % (stride, self.get_row_bytes()))
+        self.stride = stride
+        if maxval is None:
+            maxval = 65535 if pixel_formats[pixel_format][1] != np.uint8 else 255
+        self.maxval = maxval
+
+    def get_row_bytes(self):
+        bpp = pixel_formats[self.pixel_format][0]
+        if bpp == 0:
+            return (self.width + 7) // 8
+        return self.width * bpp
+
+    def get_size(self):
+        """Number of bytes in the file needed for the image"""
+        return self.offset + self.stride * (self.height - 1) + self.get_row_bytes()
+
+    @classmethod
+    def guess(cls, file_size, pixel_format="gray8", offset=0, width=None):
+        """Guess a format for a headerless file, using the given width or the
+        largest power of two width no greater than the square root of the
+        number of pixels.
+        """
+        bpp = max(pixel_formats[pixel_format][0], 1)
+        pixels = max((file_size - offset) // bpp, 1)
+        if width is None:
+            width = 1
+            while width * width * 4 <= pixels:
+                width *= 2
+        height = max(pixels // width, 1)
+        return cls(width, height, pixel_format, offset)
+
+
+def parse_pnm_header(data):
+    """Return the RawImageFormat of a binary PBM (P4), PGM (P5) or PPM (P6)
+    file given the start of the file.
+    """
+    magic = data[0:2]
+    if magic not in ("P4", "P5", "P6"):
+        raise RawImageError("Not a binary PNM file")
+    fields = []
+    pos = 2
+    count = 2 if magic == "P4" else 3
+    while len(fields) < count:
+        # Skip whitespace and comments
+        while pos < len(data) and data[pos] in " \t\r\n#":
+            if data[pos] == "#":
+                while pos < len(data) and data[pos] not in "\r\n":
+                    pos += 1
+            else:
+                pos += 1
+        start = pos
+        while pos < len(data) and data[pos].isdigit():
+            pos += 1
+        if start == pos:
+            raise RawImageError("Bad PNM header")
+        fields.append(int(data[start:pos]))
+    # A single whitespace character separates the header from the pixels
+    pos += 1
+    width, height = fields[0], fields[1]
+    if magic == "P4":
+        return RawImageFormat(width, height, "gray1", pos)
+    maxval = fields[2]
+    if magic == "P5":
+        pixel_format = "gray8" if maxval < 256 else "gray16be"
+    else:
+        pixel_format = "rgb24" if maxval < 256 else "rgb48be"
+    return RawImageFormat(width, height, pixel_format, pos, maxval=maxval)
+
+
+class RawImageSource(object):
+    """Image source for memory mapped pixels, usable by TiledImage
+
+    Pixels are converted to 8 bit RGB, or RGBA for formats with alpha, only
+    for the regions that are requested.
+    """
+    def __init__(self, path, format):
+        self.path = path
+        self.format = format
+        self.width = format.width
+        self.height = format.height
+        self.channels = 4 if format.pixel_format == "rgba32" else 3
+        self.data = np.memmap(path, dtype=np.uint8, mode="r")
+        if self.data.size < format.get_size():
+            raise RawImageError("File has %d bytes but the image needs %d" % (self.data.size, format.get_size()))
+        self.rows = np.lib.stride_tricks.as_strided(self.data[format.offset:], shape=(format.height, format.stride), strides=(format.stride, 1))
+
+    def get_region(self, x, y, w, h):
+        fmt = self.format
+        bpp, dtype, samples = pixel_formats[fmt.pixel_format]
+        w = min(w, self.width - x)
+        rows = self.rows[y:y + h]
+        if bpp == 0:
+            bits = np.unpackbits(rows[:, x // 8:(x + w + 7) // 8], axis=1)
+            start = x % 8
+            # PBM uses 1 for black
+            gray = (1 - bits[:, start:start + w]) * 255
+            values = gray[:, :, np.newaxis]
+        else:
+            raw = np.ascontiguousarray(rows[:, x * bpp:(x + w) * bpp])
+            values = raw.view(dtype).reshape((raw.shape[0], -1, samples))
+            if dtype != np.uint8 or fmt.maxval != 255:
+                values = (values.astype(np.uint32) * 255 // fmt.maxval).astype(np.uint8)
+        region = np.empty((values.shape[0], values.shape[1], self.channels), dtype=np.uint8)
+        if samples == 1:
+            region[:] = values
+        elif fmt.pixel_format == "bgr24":
+            region[:] = values[:, :, ::-1]
+        else:
+            region[:] = values
+        return region
+
+    def crop(self, x, y, w, h):
+        return CroppedSource(self, x, y, w, h)
+
+
+class CroppedSource(object):
+    """Part of another image source"""
+    def __init__(self, source, x, y, w, h):
+        self.source = source
+        self.x = x
+        self.y = y
+        self.width = w
+        self.height = h
+        self.channels = source.channels
+
+    def get_region(self, x, y, w, h):
+        w = min(w, self.width - x)
+        h = min(h, self.height - y)
+        return self.source.get_region(self.x + x, self.y + y, w, h)
+
+    def crop(self, x, y, w, h):
+        return CroppedSource(self.source, self.x + x, self.y + y, w, h)
+
+
+def open_pnm(path):
+    """Return a RawImageSource for a binary PBM, PGM or PPM file"""
+    with open(path, "rb") as fh:
+        header = fh.read(1024)
+    return RawImageSource(path, parse_pnm_header(header))
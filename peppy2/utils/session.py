@@ -0,0 +1,68 @@
+"""Saving the open windows and files between runs
+
+A session lists the windows, the tasks in each window and the files open in
+each task along with their view positions:
+
+    {"version": 1, "windows": [{"active_task": "peppy.framework.text_edit_task",
+        "tasks": [{"id": "peppy.framework.text_edit_task", "active": 0,
+            "editors": [{"path": "/tmp/a.txt", "view": {"top": 10, "pos": 312}}]}]}]}
+
+The file is written as compact JSON and replaced atomically, so a crash while
+exiting leaves the previous session intact.
+"""
+import os
+import json
+
+from peppy2.utils.fileutil import atomic_write
+
+import logging
+log = logging.getLogger(__name__)
+
+
+# Version of the session file format
+session_version = 1
+
+
+def save_session(path, windows):
+    """Save the list of window descriptions
+
+    @param windows: list of dicts, one per window
+    """
+    data = json.dumps({'version': session_version, 'windows': windows}, separators=(',', ':'))
+    try:
+        atomic_write(path, [data])
+    except (IOError, OSError), e:
+        log.error("Failed saving session %s: %s" % (path, e))
+
+
+def load_session(path):
+    """Return the list of window descriptions saved in the file, or an
+    empty list if it's missing, unreadable or from another version.
+    """
+    try:
+        with open(path, "rb") as fh:
+            session = json.load(fh)
+    except (IOError, OSError, ValueError), e:
+        log.debug("Can't load session %s: %s" % (path, e))
+        return []
+    if not isinstance(session, dict) or session.get('version') != session_version:
+        return []
+    windows = session.get('windows')
+    if not isinstance(windows, list):
+        return []
+    return windows
+
+
+def get_existing_editors(task_session):
+    """Return the editor descriptions of the files that still exist and the
+    index of the active one among them, or None if it's gone.
+    """
+    editors = []
+    active = None
+    for i, item in enumerate(task_session.get('editors', [])):
+        path = item.get('path')
+        if path and os.path.exists(path):
+            if i == task_session.get('active'):
+                active = len(editors)
+            editors.append(item)
+    return editors, active
@@ -0,0 +1,190 @@
+"""Hand files to an already running instance of the application
+
+The running application listens on a Unix domain socket in its config
+directory.  A new launch connects to the socket, sends its file list and
+working directory and exits without importing wx or any of the plugins.  If
+nothing is listening, the launch starts the application normally and becomes
+the server for later launches.
+
+Platforms without Unix domain sockets always start a new instance.
+"""
+import os
+import json
+import socket
+import getpass
+import threading
+
+import logging
+log = logging.getLogger(__name__)
+
+
+# Longest path that fits in a sockaddr_un on all platforms
+max_socket_path = 100
+
+
+def is_supported():
+    return hasattr(socket, "AF_UNIX")
+
+
+def get_socket_path(name):
+    """Return the path of the socket of the application with the given name
+
+    The socket lives in the user's config directory, which only the user can
+    access, unless that path is too long for a socket address.
+    """
+    from peppy2.third_party.appdirs import user_config_dir
+    path = os.path.join(user_config_dir(name), "instance.sock")
+    if len(path) > max_socket_path:
+        import tempfile
+        path = os.path.join(tempfile.gettempdir(), "%s-%s.sock" % (name.lower(), getpass.getuser()))
+    return path
+
+
+def get_remote_args(args):
+    """Return the file names from the command line arguments, or None if the
+    arguments include flags, which need a new instance to take effect.
+    """
+    for arg in args:
+        if arg.startswith("-"):
+            return None
+    return list(args)
+
+
+def send_message(path, message, timeout=5.0):
+    """Send a JSON message to the instance listening on the socket
+
+    Returns True if the running instance accepted the message, False if
+    there is no running instance.
+    """
+    if not is_supported() or not os.path.exists(path):
+        return False
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(path)
+        sock.sendall(json.dumps(message) + "\n")
+        reply = sock.recv(16)
+    except socket.error, e:
+        log.debug("No running instance at %s: %s" % (path, e))
+        return False
+    finally:
+        sock.close()
+    return reply.startswith("ok")
+
+
+def send_files(path, files, cwd):
+    """Ask the running instance to load the files, returning True if it
+    accepted them.  An empty list asks it to bring a window to the front.
+    """
+    return send_message(path, {'files': files, 'cwd': cwd})
+
+
+def is_running(path):
+    """Is an instance listening on the socket?"""
+    return send_message(path, {'ping': True}, 1.0)
+
+
+def hand_off(args, name):
+    """Send the files named on the command line to the running instance of
+    the application with the given name
+
+    Relative file names are made absolute so the running instance doesn't
+    depend on the working directory, which is sent too.  Returns True if the
+    running instance took the files and this process should exit.
+    """
+    files = get_remote_args(args)
+    if files is None:
+        return False
+    cwd = os.getcwd()
+    files = [f if "://" in f else os.path.abspath(f) for f in files]
+    return send_files(get_socket_path(name), files, cwd)
+
+
+class InstanceServer(object):
+    """Listen for files sent by later launches of the application
+
+    The callback is called from the server thread with the list of files and
+    the working directory of the launch, so it must pass them on to the GUI
+    thread itself.
+    """
+    def __init__(self, path, callback):
+        self.path = path
+        self.callback = callback
+        self.sock = None
+        self.thread = None
+        self.running = False
+
+    def start(self):
+        """Start listening, returning False if the socket can't be created
+        (e.g. another instance started at the same time).
+        """
+        if not is_supported():
+            return False
+        if os.path.exists(self.path):
+            if is_running(self.path):
+                log.debug("Another instance is already listening on %s" % self.path)
+                return False
+            # Left over from an instance that crashed
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            dirname = os.path.dirname(self.path)
+            if not os.path.exists(dirname):
+                os.makedirs(dirname)
+            sock.bind(self.path)
+            os.chmod(self.path, 0600)
+            sock.listen(5)
+        except (socket.error, OSError), e:
+            log.error("Can't listen on %s: %s" % (self.path, e))
+            sock.close()
+            return False
+        sock.settimeout(0.5)
+        self.sock = sock
+        self.running = True
+        self.thread = threading.Thread(target=self.serve, name="InstanceServer")
+        self.thread.daemon = True
+        self.thread.start()
+        return True
+
+    def serve(self):
+        while self.running:
+            try:
+                conn, addr = self.sock.accept()
+            except socket.timeout:
+                continue
+            except socket.error:
+                break
+            try:
+                self.handle(conn)
+            except (socket.error, ValueError), e:
+                log.error("Bad request on %s: %s" % (self.path, e))
+            finally:
+                conn.close()
+
+    def handle(self, conn):
+        conn.settimeout(5.0)
+        data = ""
+        while not data.endswith("\n"):
+            chunk = conn.recv(4096)
+            if not chunk:
+                break
+            data += chunk
+        message = json.loads(data)
+        conn.sendall("ok\n")
+        if not message.get('ping'):
+            self.callback(message.get('files', []), message.get('cwd', ""))
+
+    def shutdown(self):
+        if self.sock is None:
+            return
+        self.running = False
+        self.thread.join()
+        self.sock.close()
+        self.sock = None
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
@@ -0,0 +1,170 @@
+"""Timing of application startup
+
+When startup tracing is turned on, the application records how long each
+phase of startup takes, how long each plugin takes to start and how long
+each module takes to import.  The report is a JSON document so benchmarks
+can compare startups.
+
+Tracing is off unless start_trace is called, and the helpers in this module
+do nothing when it's off, so they can be left in the startup code.  This
+module must not import anything slow, since it is imported before the rest
+of the application to time its imports.
+"""
+import sys
+import time
+import json
+import thread
+import __builtin__
+from contextlib import contextmanager
+
+
+class ImportTimer(object):
+    """Records the time taken to import each module by wrapping __import__
+
+    Only the first import of a module made in the thread that installed the
+    timer is recorded.  Inclusive time includes the modules imported while
+    importing the module; exclusive time doesn't.
+    """
+    def __init__(self):
+        self.times = {}
+        self.stack = []
+        self.original = None
+        self.thread_id = None
+
+    def install(self):
+        if self.original is None:
+            self.original = __builtin__.__import__
+            self.thread_id = thread.get_ident()
+            __builtin__.__import__ = self.timed_import
+
+    def uninstall(self):
+        if self.original is not None:
+            __builtin__.__import__ = self.original
+            self.original = None
+
+    def timed_import(self, name, globals=None, locals=None, fromlist=None, level=-1):
+        if name in sys.modules or thread.get_ident() != self.thread_id:
+            return self.original(name, globals, locals, fromlist, level)
+        start = time.time()
+        self.stack.append(0.0)
+        try:
+            return self.original(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.time() - start
+            children = self.stack.pop()
+            if self.stack:
+                self.stack[-1] += elapsed
+            record = self.times.setdefault(name, [0.0, 0.0])
+            record[0] += elapsed
+            record[1] += elapsed - children
+
+    def get_report(self, count=None):
+        """Return a list of dicts for the modules, slowest first
+
+        @param count: maximum number of modules, or None for all of them
+        """
+        items = sorted(self.times.items(), key=lambda i: -i[1][0])
+        if count is not None:
+            items = items[:count]
+        return [{'module': name, 'inclusive': t[0], 'exclusive': t[1]} for name, t in items]
+
+
+class StartupTrace(object):
+    """Phases, events and plugin start times of one startup
+
+    Times in the report are in seconds from the creation of the trace.
+    """
+    def __init__(self, time_imports=True):
+        self.start = time.time()
+        self.phases = []
+        self.marks = []
+        self.plugins = []
+        self.imports = ImportTimer()
+        if time_imports:
+            self.imports.install()
+
+    def get_elapsed(self):
+        return time.time() - self.start
+
+    @contextmanager
+    def phase(self, name):
+        start = self.get_elapsed()
+        try:
+            yield
+        finally:
+            self.phases.append({'name': name, 'start': start, 'duration': self.get_elapsed() - start})
+
+    def mark(self, name):
+        """Record the time of an event, e.g. the first window opening"""
+        self.marks.append({'name': name, 'time': self.get_elapsed()})
+
+    def add_plugin(self, plugin_id, duration):
+        self.plugins.append({'id': plugin_id, 'duration': duration})
+
+    def get_report(self):
+        return {
+            'total': self.get_elapsed(),
+            'phases': self.phases,
+            'marks': self.marks,
+            'plugins': self.plugins,
+            'imports': self.imports.get_report(),
+            'argv': sys.argv,
+            'python': sys.version,
+            }
+
+    def to_json(self):
+        return json.dumps(self.get_report(), indent=1)
+
+
+_trace = None
+
+
+def start_trace(time_imports=True):
+    """Start tracing, unless it has already been started"""
+    global _trace
+    if _trace is None:
+        _trace = StartupTrace(time_imports)
+    return _trace
+
+
+def get_trace():
+    """Return the current trace, or None if startup isn't being traced"""
+    return _trace
+
+
+def stop_trace():
+    """Stop tracing and return the finished trace"""
+    global _trace
+    trace = _trace
+    if trace is not None:
+        trace.imports.uninstall()
+    _trace = None
+    return trace
+
+
+@contextmanager
+def traced(name):
+    """Record the enclosed code as a phase of the current trace, if any"""
+    if _trace is None:
+        yield
+    else:
+        with _trace.phase(name):
+            yield
+
+
+def mark(name):
+    if _trace is not None:
+        _trace.mark(name)
+
+
+def get_percentile(values, percent):
+    """Return the percentile of the values, interpolating between the
+    closest ranks
+    """
+    values = sorted(values)
+    if not values:
+        return None
+    pos = (len(values) - 1) * percent / 100.0
+    low = int(pos)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (pos - low)
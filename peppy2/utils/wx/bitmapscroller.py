@@ -67,9 +67,12 @@ Changelog:
 
 import os
 
+import numpy as np
 import wx
 import wx.lib.newevent
 
+from peppy2.utils.imagetiles import ArraySource, LRUCache, TiledImage
+
 try:
     from peppy.debug import *
 except:
@@ -648,12 +651,12 @@ class RubberBand(MouseSelector):
         x1, y1 = self.last_img_coords
         if x0 + dx < 0:
             dx = -x0
-        elif x1 + dx >= self.scroller.img.GetWidth():
-            dx = self.scroller.img.GetWidth() - x1 - 1
+        elif x1 + dx >= self.scroller.source.width:
+            dx = self.scroller.source.width - x1 - 1
         if y0 + dy < 0:
             dy = -y0
-        elif y1 + dy >= self.scroller.img.GetHeight():
-            dy = self.scroller.img.GetHeight() - y1 - 1
+        elif y1 + dy >= self.scroller.source.height:
+            dy = self.scroller.source.height - y1 - 1
         self.start_img_coords = (x0 + dx, y0 + dy)
         self.last_img_coords = (x1 + dx, y1 + dy)
         self.recalc()
@@ -711,6 +714,21 @@ class RubberBand(MouseSelector):
         self.draw()
 
 
+def get_image_source(img):
+    """Return an image source that views the pixels of the wx.Image without
+    copying them.  The image must be kept alive as long as the source.
+    """
+    if img.HasMask() and not img.HasAlpha():
+        img.InitAlpha()
+    w = img.GetWidth()
+    h = img.GetHeight()
+    rgb = np.frombuffer(img.GetDataBuffer(), dtype=np.uint8).reshape((h, w, 3))
+    alpha = None
+    if img.HasAlpha():
+        alpha = np.frombuffer(img.GetAlphaBuffer(), dtype=np.uint8).reshape((h, w))
+    return ArraySource(rgb, alpha)
+
+
 class BitmapScroller(wx.ScrolledWindow):
     dbg_call_seq = 0
     
@@ -723,12 +741,15 @@ class BitmapScroller(wx.ScrolledWindow):
         self.checkerboard_box_size = 8
         self.checkerboard_color = wx.Colour(96, 96, 96)
         self.max_zoom = 16.0
-        self.min_zoom = 0.0625
+        self.min_zoom = 1.0 / 256
+        self.tile_size = 256
 
         # internal storage
         self.orig_img = None
-        self.img = None
-        self.scaled_bmp = None
+        self.orig_source = None
+        self.source = None
+        self.tiles = None
+        self.tile_bitmaps = LRUCache(64 * 1024 * 1024)
         self.width = 0
         self.height = 0
         self.zoom = 1.0
@@ -741,6 +762,8 @@ class BitmapScroller(wx.ScrolledWindow):
         self.default_cursor = wx.CURSOR_ARROW
         self.save_cursor = None
         
+        # All drawing is done by OnPaint using a buffered DC
+        self.SetBackgroundStyle(wx.BG_STYLE_CUSTOM)
         self.Bind(wx.EVT_PAINT, self.OnPaint)
 
         # selectors and related storage
@@ -768,28 +791,28 @@ class BitmapScroller(wx.ScrolledWindow):
         dc.SetBackground(wx.Brush(self.background_color))
         dc.Clear()
 
-    def _checkerboardBackground(self, dc, w, h):
+    def _checkerboardBackground(self, dc, w, h, xoff=0, yoff=0):
         # draw checkerboard for transparent background
         box = self.checkerboard_box_size
+        dc.SetPen(wx.Pen(self.checkerboard_color))
+        dc.SetBrush(wx.Brush(self.checkerboard_color))
         y = 0
         while y < h:
             #dprint("y=%d, y/box=%d" % (y, (y/box)%2))
             x = box * ((y/box)%2)
             while x < w:
-                dc.SetPen(wx.Pen(self.checkerboard_color))
-                dc.SetBrush(wx.Brush(self.checkerboard_color))
-                dc.DrawRectangle(x, y, box, box)
+                dc.DrawRectangle(x + xoff, y + yoff, min(box, w - x), min(box, h - y))
                 #dprint("draw: xywh=%s" % ((x, y, box, box),))
                 x += box*2
             y += box
 
-    def _drawBackground(self, dc, w, h):
-        self._clearBackground(dc, w, h)
+    def _drawBackground(self, dc, w, h, xoff=0, yoff=0):
+        """Draw the background behind transparent parts of the image"""
         if self.use_checkerboard:
-            self._checkerboardBackground(dc, w, h)
+            self._checkerboardBackground(dc, w, h, xoff, yoff)
 
     def inOrigImage(self, x, y):
-        if x>=0 and x<self.orig_img.GetWidth() and y>=0 and y<self.orig_img.GetHeight():
+        if x>=0 and x<self.orig_source.width and y>=0 and y<self.orig_source.height:
             return True
         return False
 
@@ -798,8 +821,18 @@ class BitmapScroller(wx.ScrolledWindow):
 
         Creates and returns a new image if there is a cropping
         specified, otherwise just returns the original image
-        unchanged.
+        unchanged.  Images set with setSource are converted from the
+        source, which may need a lot of memory.
         """
+        if self.orig_img is None:
+            w = self.source.width
+            h = self.source.height
+            region = self.source.get_region(0, 0, w, h)
+            img = wx.EmptyImage(w, h)
+            img.SetData(np.ascontiguousarray(region[:,:,0:3]).tostring())
+            if region.shape[2] == 4:
+                img.SetAlphaData(np.ascontiguousarray(region[:,:,3]).tostring())
+            return img
         if self.crop is not None and isinstance(self.crop, tuple):
             if self.inOrigImage(self.crop[0], self.crop[1]) and self.inOrigImage(self.crop[0] + self.crop[2] - 1, self.crop[1] + self.crop[3] - 1):
                 return self.orig_img.GetSubImage(self.crop)
@@ -807,43 +840,34 @@ class BitmapScroller(wx.ScrolledWindow):
                 print("trying to crop outside of image: %s" % str(self.crop))
         return self.orig_img
 
+    def _setSource(self):
+        """Creates the tiled image of the cropped original image.
+
+        The tiles and the pyramid of reduced images are only rendered when
+        they are first drawn, so this is cheap even for huge images.
+        """
+        self.source = self.orig_source
+        if self.orig_source is not None and self.crop is not None and isinstance(self.crop, tuple):
+            if self.inOrigImage(self.crop[0], self.crop[1]) and self.inOrigImage(self.crop[0] + self.crop[2] - 1, self.crop[1] + self.crop[3] - 1):
+                self.source = self.orig_source.crop(*self.crop)
+            else:
+                print("trying to crop outside of image: %s" % str(self.crop))
+        if self.source is not None:
+            self.tiles = TiledImage(self.source, self.tile_size)
+        else:
+            self.tiles = None
+        self.tile_bitmaps.clear()
+        self._scaleImage()
+
     def _scaleImage(self):
-        """Creates new image at specified zoom factor.
+        """Sets the size of the scrolled area for the current zoom factor.
 
-        Creates a new image that is to be used as the background of
-        the scrolled bitmap.  Currently, actually creates the entire
-        image, which could lead to memory problems if the image is
-        really huge and the zoom factor is large.
+        Only the tiles in the viewport are rendered at the new zoom factor,
+        when they are painted, so memory use doesn't depend on the size of
+        the zoomed image.
         """
-        if self.orig_img is not None:
-            self.img = self._getCroppedImage()
-            w = int(self.img.GetWidth() * self.zoom)
-            h = int(self.img.GetHeight() * self.zoom)
-            dc = wx.MemoryDC()
-            self.scaled_bmp = wx.EmptyBitmap(w, h)
-            dc.SelectObject(self.scaled_bmp)
-            self._drawBackground(dc, w, h)
-            
-            # For very large bitmaps, the memory consumption of the
-            # BitmapFromImage call can cause memory errors.  So, here
-            # it breaks up the source image into chunks and only calls
-            # BitmapFromImage on the chunk.
-            ydest = 0
-            source_step = 256
-            for ysource in range(0, self.img.GetHeight(), source_step):
-                if ysource + source_step > self.img.GetHeight():
-                    hsource = self.img.GetHeight() - ysource
-                else:
-                    hsource = source_step
-                hdest = hsource * self.zoom
-                crop = [0, ysource, self.img.GetWidth(), hsource]
-                #dprint(crop)
-                subimg = self.orig_img.GetSubImage(crop)
-                bmp = wx.BitmapFromImage(subimg.Scale(w, hdest))
-                dc.DrawBitmap(bmp, 0, ydest, True)
-                ydest += hdest
-            self.width = self.scaled_bmp.GetWidth()
-            self.height = self.scaled_bmp.GetHeight()
+        if self.tiles is not None:
+            self.width, self.height = self.tiles.get_display_size(self.zoom)
         else:
             self.width = 10
             self.height = 10
@@ -874,15 +898,31 @@ class BitmapScroller(wx.ScrolledWindow):
             # change the bitmap if specified
             self.bmp = None
             self.orig_img = img
+            self.orig_source = get_image_source(img)
         else:
-            self.bmp = self.orig_img = None
+            self.bmp = self.orig_img = self.orig_source = None
 
         if zoom is not None:
             self.zoom = zoom
 
         self.crop = crop
         self.endActiveSelector()
-        self._scaleImage()
+        self._setSource()
+
+    def setSource(self, source, zoom=None):
+        """Set the control to display an image source.
+
+        Similar to setImage, but takes any image source usable by
+        TiledImage, e.g. a memory mapped RawImageSource, so the image
+        doesn't have to fit in memory.
+        """
+        self.bmp = self.orig_img = None
+        self.orig_source = source
+        if zoom is not None:
+            self.zoom = zoom
+        self.crop = None
+        self.endActiveSelector()
+        self._setSource()
 
     def setBitmap(self, bmp=None, zoom=None):
         """Set the control to display a new bitmap.
@@ -911,7 +951,7 @@ class BitmapScroller(wx.ScrolledWindow):
             crop = (x, y, crop[2], crop[3])
         self.crop = crop
         self.endActiveSelector()
-        self._scaleImage()
+        self._setSource()
 
     def copyToClipboard(self):
         """Copies current image to clipboard.
@@ -942,7 +982,10 @@ class BitmapScroller(wx.ScrolledWindow):
         ext = ext.lower()
         if ext in handlers:
             try:
-                status = self.scaled_bmp.SaveFile(filename, handlers[ext])
+                img = self._getCroppedImage()
+                w = int(img.GetWidth() * self.zoom)
+                h = int(img.GetHeight() * self.zoom)
+                status = img.Scale(w, h).SaveFile(filename, handlers[ext])
             except:
                 status = False
             return status
@@ -965,9 +1008,9 @@ class BitmapScroller(wx.ScrolledWindow):
         """Return image coordinates clipped to boundary of image."""
         
         if x<0: x=0
-        elif x>=self.img.GetWidth(): x=self.img.GetWidth()-1
+        elif x>=self.source.width: x=self.source.width-1
         if y<0: y=0
-        elif y>=self.img.GetHeight(): y=self.img.GetHeight()-1
+        elif y>=self.source.height: y=self.source.height-1
         return (x, y)
 
     def getImageCoords(self, x, y, fixbounds = True):
@@ -990,7 +1033,7 @@ class BitmapScroller(wx.ScrolledWindow):
 
         Return True if the world coordinates lie on the image.
         """
-        if self.img is None or x<0 or y<0 or x>=self.width or y>=self.height:
+        if self.source is None or x<0 or y<0 or x>=self.width or y>=self.height:
             return False
         return True
 
@@ -1107,7 +1150,7 @@ class BitmapScroller(wx.ScrolledWindow):
         its event combination, it becomes the active selector and
         further mouse events are directed to its handler.
         """
-        if self.img:
+        if self.source is not None:
             inside = self.isEventInClientArea(ev)
             
             try:
@@ -1134,13 +1177,43 @@ class BitmapScroller(wx.ScrolledWindow):
                 raise
         ev.Skip()
 
+    def _getTileBitmap(self, tx, ty):
+        key = (self.zoom, tx, ty)
+        bmp = self.tile_bitmaps.get(key)
+        if bmp is None:
+            tile = self.tiles.get_display_tile(self.zoom, tx, ty)
+            h, w = tile.shape[0:2]
+            if tile.shape[2] == 4:
+                bmp = wx.BitmapFromBufferRGBA(w, h, tile.tostring())
+            else:
+                bmp = wx.BitmapFromBuffer(w, h, tile.tostring())
+            self.tile_bitmaps.put(key, bmp, tile.nbytes)
+        return bmp
+
+    def _drawTiles(self, dc, x, y, w, h):
+        """Draw the tiles that are visible in the client area
+
+        x, y is the position of the client area in scrolled window
+        coordinates, and drawing is done in client coordinates.
+        """
+        t = self.tile_size
+        for tx, ty in self.tiles.get_visible_tiles(self.zoom, x, y, w, h):
+            bmp = self._getTileBitmap(tx, ty)
+            xdest = tx * t - x
+            ydest = ty * t - y
+            if self.source.channels == 4:
+                self._drawBackground(dc, bmp.GetWidth(), bmp.GetHeight(), xdest, ydest)
+            dc.DrawBitmap(bmp, xdest, ydest, True)
+
     def OnPaint(self, evt):
         self.dbg_call_seq += 1
         #print("In OnPaint %d" % self.dbg_call_seq)
-        if self.scaled_bmp is not None:
-            dc=wx.BufferedPaintDC(self, self.scaled_bmp, wx.BUFFER_VIRTUAL_AREA)
-            # Note that the drawing actually happens when the dc goes
-            # out of scope and is destroyed.
+        dc = wx.BufferedPaintDC(self)
+        w, h = self.GetClientSizeTuple()
+        self._clearBackground(dc, w, h)
+        if self.tiles is not None:
+            x, y = self.CalcUnscrolledPosition(0, 0)
+            self._drawTiles(dc, x, y, w, h)
             self.OnPaintHook(evt, dc)
             
             # FIXME: This check for MSW is because it gets multiple onpaint
@@ -1153,11 +1226,10 @@ class BitmapScroller(wx.ScrolledWindow):
         evt.Skip()
 
     def OnPaintHook(self, evt, dc):
-        """Hook to draw any additional items onto the saved bitmap.
+        """Hook to draw any additional items over the image.
 
-        Note that any changes made to the dc will be reflected in the
-        saved bitmap, so subsequent times calling this function will
-        continue to add new data to the image.
+        The dc is in client coordinates and is redrawn from the cached tiles
+        on every paint event.
         """
         pass
 
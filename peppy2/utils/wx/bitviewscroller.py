@@ -19,6 +19,9 @@ import numpy as np
 import wx
 import wx.lib.newevent
 
+from peppy2.utils.bitpyramid import BitPyramid, BitPyramidJob, get_reduced_rows
+from peppy2.utils.jobs import get_global_job_manager
+
 class BitviewScroller(wx.ScrolledWindow):
     dbg_call_seq = 0
     
@@ -28,17 +31,36 @@ class BitviewScroller(wx.ScrolledWindow):
         # Settings
         self.background_color = wx.Colour(160, 160, 160)
         self.max_zoom = 16
-        self.min_zoom = 1
+        # Zoom factors below 1 are powers of two where each pixel shows the
+        # average of 1/zoom rows
+        self.min_zoom = 1.0 / 65536
         self.bytes_per_row = 1
+        
+        # Largest height of the scroll area in pixels; taller images map the
+        # scroll position onto the rows proportionally
+        self.max_virtual_height = 1 << 20
+        
+        # Data smaller than this is reduced directly rather than waiting for
+        # the pyramid to be built on a job thread
+        self.max_direct_bytes = 4 * 1024 * 1024
+        
+        self.minimap_width = 12
+        self.minimap_color = wx.Colour(255, 0, 0)
 
         # internal storage
         self.bytes = None
         self.img = None
         self.scaled_bmp = None
+        self.scaled_bmp_key = None
+        self.data_version = 0
+        self.pyramid = None
+        self.pyramid_job = None
+        self.pending_ranges = []
         self.width = 0
         self.height = 0
         self.zoom = 3
         self.crop = None
+        self.minimap_drag = False
         
         # hacks
         self.just_scrolled = False
@@ -47,6 +69,9 @@ class BitviewScroller(wx.ScrolledWindow):
         self.default_cursor = wx.CURSOR_ARROW
         self.save_cursor = None
         
+        # The whole window is redrawn when scrolling because the minimap
+        # doesn't move and the scroll position may be scaled
+        self.EnableScrolling(False, False)
         self.Bind(wx.EVT_PAINT, self.OnPaint)
 
         # selectors and related storage
@@ -57,16 +82,22 @@ class BitviewScroller(wx.ScrolledWindow):
         self.Bind(wx.EVT_MOUSE_EVENTS, self.OnMouseEvent)
 
     def zoomIn(self, zoom=1):
-        self.zoom += zoom
-        if self.zoom > self.max_zoom:
-            self.zoom = self.max_zoom
+        row = self.get_first_data_row()
+        if self.zoom < 1:
+            self.zoom = min(self.zoom * 2, 1)
+        else:
+            self.zoom = min(self.zoom + zoom, self.max_zoom)
         self.set_scale()
+        self.scroll_to_data_row(row)
         
     def zoomOut(self, zoom=1):
-        self.zoom -= zoom
-        if self.zoom < self.min_zoom:
-            self.zoom = self.min_zoom
+        row = self.get_first_data_row()
+        if self.zoom <= 1:
+            self.zoom = max(self.zoom / 2.0, self.min_zoom)
+        else:
+            self.zoom = max(self.zoom - zoom, 1)
         self.set_scale()
+        self.scroll_to_data_row(row)
 
     def _clearBackground(self, dc, w, h):
         dc.SetBackground(wx.Brush(self.background_color))
@@ -74,87 +105,257 @@ class BitviewScroller(wx.ScrolledWindow):
 
     def _drawBackground(self, dc, w, h):
         self._clearBackground(dc, w, h)
+    
+    def get_scale(self):
+        """Return the number of data rows per display row and the number of
+        pixels per display row
+        """
+        if self.zoom < 1:
+            return int(round(1.0 / self.zoom)), 1
+        return 1, int(self.zoom)
+    
+    def get_num_data_rows(self):
+        if self.bytes is None:
+            return 0
+        return (self.bytes.size + self.bytes_per_row - 1) / self.bytes_per_row
+    
+    def get_scroll_ratio(self):
+        """Number of image pixels per pixel of scroll position"""
+        w, h = self.GetClientSizeTuple()
+        virtual_range = min(self.height, self.max_virtual_height) - h
+        image_range = self.height - h
+        if virtual_range <= 0 or image_range <= virtual_range:
+            return 1.0
+        return float(image_range) / virtual_range
+    
+    def get_first_display_row(self):
+        factor, pixels = self.get_scale()
+        y = self.GetViewStart()[1] * self.GetScrollPixelsPerUnit()[1]
+        return int(y * self.get_scroll_ratio()) / pixels
+    
+    def get_first_data_row(self):
+        factor, pixels = self.get_scale()
+        return self.get_first_display_row() * factor
+    
+    def scroll_to_data_row(self, row):
+        factor, pixels = self.get_scale()
+        ppu = self.GetScrollPixelsPerUnit()[1]
+        if ppu > 0:
+            y = int((row / factor) * pixels / self.get_scroll_ratio())
+            self.Scroll(-1, y / ppu)
+    
+    def get_gray_rows(self, start_row, num_rows):
+        """Return the gray levels of the display rows, or None if they aren't
+        available yet.
+        """
+        factor, pixels = self.get_scale()
+        if factor == 1:
+            start = start_row * self.bytes_per_row
+            bytes = np.zeros((num_rows * self.bytes_per_row), dtype=np.uint8)
+            chunk = self.bytes[start:start + bytes.size]
+            bytes[0:chunk.size] = chunk
+            bits = np.unpackbits(bytes)
+            bits = bits.reshape((-1, 8 * self.bytes_per_row))
+            return 255 - bits * 255
+        if self.pyramid is not None:
+            return self.pyramid.get_rows(self.bytes, factor, start_row, num_rows)
+        if factor * num_rows * self.bytes_per_row <= self.max_direct_bytes:
+            return get_reduced_rows(self.bytes, self.bytes_per_row, factor, start_row, num_rows)
+        return None
 
     def get_image(self, start_row, num_rows):
-        print "Getting image: start=%d, num=%d" % (start_row, num_rows)
-        start = start_row * self.bytes_per_row
-        end = start + (num_rows * self.bytes_per_row)
-        if end > self.bytes.size:
-            end = self.bytes.size
-            bytes = np.zeros((num_rows * self.bytes_per_row), dtype=np.uint8)
-            bytes[0:end - start] = self.bytes[start_row * self.bytes_per_row:end]
-        else:
-            bytes = self.bytes[start_row * self.bytes_per_row:end]
-        bits = np.unpackbits(bytes)
-        bits = bits.reshape((-1, 8 * self.bytes_per_row))
-        bits[bits==0]=255
-        bits[bits==1]=0
+        gray = self.get_gray_rows(start_row, num_rows)
+        if gray is None:
+            return None
+        factor, pixels = self.get_scale()
         width = 8 * self.bytes_per_row
-        array = np.zeros((num_rows, width, 3), dtype=np.uint8)
-        array[:,:,0] = bits
-        array[:,:,1] = bits
-        array[:,:,2] = bits
+        array = np.empty((num_rows, width, 3), dtype=np.uint8)
+        array[:] = gray[:,:,np.newaxis]
         image = wx.EmptyImage(width, num_rows)
         image.SetData(array.tostring())
-        image.Rescale(width * self.zoom, num_rows * self.zoom)
+        if pixels > 1:
+            image.Rescale(width * pixels, num_rows * pixels)
         bmp = wx.BitmapFromImage(image)
         return bmp
 
     def prepare_image(self):
-        """Creates new image at specified zoom factor.
+        """Creates the image of the visible rows at the current zoom factor.
 
-        Creates a new image that is to be used as the background of
-        the scrolled bitmap.  Currently, actually creates the entire
-        image, which could lead to memory problems if the image is
-        really huge and the zoom factor is large.
+        Only the rows in the viewport are rendered, and the image is reused
+        until the scroll position, zoom, window size or data changes.
         """
         if self.bytes is not None:
-            rows = (self.bytes.size + self.bytes_per_row - 1) / self.bytes_per_row
-            self.width = int(8 * self.bytes_per_row * self.zoom)
-            self.height = int(rows * self.zoom)
-            
             w, h = self.GetClientSizeTuple()
-            dc = wx.MemoryDC()
-            self.scaled_bmp = wx.EmptyBitmap(self.width, h)
+            if w <= 0 or h <= 0:
+                return
+            factor, pixels = self.get_scale()
+            y = self.get_first_display_row()
+            key = (y, self.zoom, w, h, self.data_version, self.pyramid is not None)
+            if key == self.scaled_bmp_key:
+                return
             
-            x, y = self.GetViewStart()
-            print "x, y, w, h: ", x, y, w, h
+            dc = wx.MemoryDC()
+            self.scaled_bmp = wx.EmptyBitmap(w, h)
             dc.SelectObject(self.scaled_bmp)
             dc.SetBackground(wx.Brush(self.background_color))
             dc.Clear()
             
-            h2 = (h / self.bytes_per_row) * self.bytes_per_row
-            bmp = self.get_image(y, h2 / self.zoom + 1)
-            dc.DrawBitmap(bmp, 0, 0, True)
+            bmp = self.get_image(y, h / pixels + 1)
+            if bmp is None:
+                dc.DrawText("...", 2, 2)
+            else:
+                dc.DrawBitmap(bmp, 0, 0, True)
+            self.draw_minimap(dc, w, h)
+            dc.SelectObject(wx.NullBitmap)
+            self.scaled_bmp_key = key
+    
+    def get_minimap_grays(self, h):
+        """Return the gray level of each row of pixels of the minimap"""
+        levels = self.pyramid.levels
+        index = len(levels) - 1
+        while index > 0 and levels[index].shape[0] < h:
+            index -= 1
+        level = levels[index]
+        # Only the rows covering the data, not the padding of the last row
+        count = max((self.get_num_data_rows() + (self.pyramid.base_factor << index) - 1) / (self.pyramid.base_factor << index), 1)
+        grays = level[:count].mean(axis=1)
+        return grays[(np.arange(h) * count) / h].astype(np.uint8)
+    
+    def draw_minimap(self, dc, w, h):
+        """Draw the thumbnail of the whole data along the right edge, with a
+        rectangle showing the visible part.
+        """
+        rows = self.get_num_data_rows()
+        factor, pixels = self.get_scale()
+        if self.height <= h or rows == 0:
+            return
+        x = w - self.minimap_width
+        if self.pyramid is not None:
+            array = np.empty((h, self.minimap_width, 3), dtype=np.uint8)
+            array[:] = self.get_minimap_grays(h)[:,np.newaxis,np.newaxis]
+            dc.DrawBitmap(wx.BitmapFromBuffer(self.minimap_width, h, array.tostring()), x, 0)
+        top = self.get_first_data_row() * h / rows
+        height = max((h / pixels) * factor * h / rows, 2)
+        dc.SetPen(wx.Pen(self.minimap_color))
+        dc.SetBrush(wx.TRANSPARENT_BRUSH)
+        dc.DrawRectangle(x, top, self.minimap_width, height)
+    
+    def is_minimap_visible(self):
+        w, h = self.GetClientSizeTuple()
+        return self.bytes is not None and self.height > h
+    
+    def process_minimap_event(self, ev):
+        """Scroll to the part of the data under the mouse when clicking or
+        dragging in the minimap.
+        
+        Returns True if the event was used by the minimap.
+        """
+        w, h = self.GetClientSizeTuple()
+        if ev.LeftDown() and ev.GetX() >= w - self.minimap_width and self.is_minimap_visible():
+            self.minimap_drag = True
+            self.CaptureMouse()
+        elif self.minimap_drag and ev.LeftUp():
+            self.minimap_drag = False
+            if self.HasCapture():
+                self.ReleaseMouse()
+            return True
+        if self.minimap_drag and (ev.LeftDown() or ev.Dragging()):
+            factor, pixels = self.get_scale()
+            y = min(max(ev.GetY(), 0), h)
+            row = y * self.get_num_data_rows() / h
+            # Center the viewport on the clicked row
+            row -= (h / pixels) * factor / 2
+            self.scroll_to_data_row(max(row, 0))
+            self.Refresh()
+            return True
+        return False
 
     def set_scale(self):
-        """Creates new image at specified zoom factor.
+        """Sets the size of the scroll area for the current zoom factor.
 
-        Creates a new image that is to be used as the background of
-        the scrolled bitmap.  Currently, actually creates the entire
-        image, which could lead to memory problems if the image is
-        really huge and the zoom factor is large.
+        The scroll area is limited to max_virtual_height so that scroll
+        positions don't overflow for huge data; the rows are then mapped
+        proportionally to the scroll position.
         """
         if self.bytes is not None:
-            rows = (self.bytes.size + self.bytes_per_row - 1) / self.bytes_per_row
-            self.width = int(8 * self.bytes_per_row * self.zoom)
-            self.height = int(rows * self.zoom)
+            factor, pixels = self.get_scale()
+            rows = (self.get_num_data_rows() + factor - 1) / factor
+            self.width = 8 * self.bytes_per_row * pixels
+            self.height = rows * pixels
         else:
             self.width = 10
             self.height = 10
-        print "set_scale: ", self.width, self.height
-        self.SetVirtualSize((self.width, self.height))
-        rate = int(self.zoom)
-        if rate < 1:
+        virtual_height = min(self.height, self.max_virtual_height)
+        self.SetVirtualSize((self.width, virtual_height))
+        if virtual_height < self.height:
             rate = 1
+        else:
+            rate = self.get_scale()[1]
         self.SetScrollRate(rate, rate)
         if self.selector:
             self.selector.recalc()
+        self.scaled_bmp_key = None
         self.Refresh()
     
-    def set_data(self, byte_source):
-        self.bytes = byte_source
+    def set_data(self, byte_source, cache_file=None):
+        """Show the data, building the pyramid of reduced images on a job
+        thread for large data.
+        
+        @param cache_file: if not None, the pyramid is loaded from or saved
+        to this file.  Only use this if the data is the same as the file on
+        disk.
+        """
+        if byte_source is not self.bytes or self.pyramid is None and self.pyramid_job is None:
+            # The pane is shared by all the editors, so any other array needs
+            # its own pyramid even if it's the same size
+            self.cancel_pyramid_job()
+            self.bytes = byte_source
+            self.pyramid = None
+            self.start_pyramid_job(cache_file)
+        self.data_version += 1
         self.set_scale()
+    
+    def cancel_pyramid_job(self):
+        if self.pyramid_job is not None:
+            self.pyramid_job.cancel()
+            self.pyramid_job = None
+        self.pending_ranges = []
+    
+    def start_pyramid_job(self, cache_file=None):
+        if self.bytes.size <= self.max_direct_bytes:
+            self.pyramid_job = None
+            self.pyramid = BitPyramid(self.bytes, self.bytes_per_row)
+            return
+        self.pyramid_job = BitPyramidJob(self.bytes, self.bytes_per_row, self.on_pyramid_finished, cache_file)
+        manager = get_global_job_manager()
+        if manager is None:
+            self.pyramid_job._start(None)
+            self.pyramid_job.success_callback()
+        else:
+            manager.add_job(self.pyramid_job)
+    
+    def on_pyramid_finished(self, job):
+        if job is not self.pyramid_job:
+            # Superseded by a later job
+            return
+        self.pyramid_job = None
+        self.pyramid = job.pyramid
+        # Apply the changes made while the job was running
+        for start, end in self.pending_ranges:
+            self.pyramid.update(self.bytes, start, end)
+        self.pending_ranges = []
+        self.scaled_bmp_key = None
+        self.Refresh()
+    
+    def update_ranges(self, ranges):
+        """Redraw after the bytes in ranges have changed in place"""
+        if self.pyramid_job is not None:
+            self.pending_ranges.extend(ranges)
+        elif self.pyramid is not None:
+            for start, end in ranges:
+                self.pyramid.update(self.bytes, start, end)
+        self.data_version += 1
+        self.Refresh()
 
     def copyToClipboard(self):
         """Copies current image to clipboard.
@@ -320,6 +521,8 @@ class BitviewScroller(wx.ScrolledWindow):
         its event combination, it becomes the active selector and
         further mouse events are directed to its handler.
         """
+        if self.bytes is not None and self.process_minimap_event(ev):
+            return
         if self.img:
             inside = self.isEventInClientArea(ev)
             
@@ -348,8 +551,6 @@ class BitviewScroller(wx.ScrolledWindow):
         ev.Skip()
 
     def OnPaint(self, evt):
-        self.dbg_call_seq += 1
-        print("In OnPaint %d" % self.dbg_call_seq)
         self.prepare_image()
         if self.scaled_bmp is not None:
             
@@ -7,9 +7,12 @@ import wx.stc
 
 from cStringIO import StringIO
 
+import numpy as np
+
 from stcinterface import *
 from peppy2.utils.textutil import *
 from peppy2.utils.clipboard import *
+from peppy2.utils.foldutil import FoldStructure, offset_fold_changes
 
 import logging
 log = logging.getLogger(__name__)
@@ -684,79 +687,70 @@ class PeppyBaseSTC(wx.stc.StyledTextCtrl, STCInterface):
 
     # --- line indentation stuff
     
+    def getFoldStructure(self, start=0, end=None):
+        """Read the fold levels of the lines from start up to but not
+        including end into a L{FoldStructure}, by default of all lines
+        """
+        if end is None:
+            end = self.GetLineCount()
+        level = self.GetFoldLevel
+        levels = np.fromiter((level(i) for i in xrange(start, end)), dtype=np.int32, count=end - start)
+        return FoldStructure(levels)
+    
+    def applyFoldChanges(self, runs, changes):
+        """Apply the results of a L{FoldStructure} computation
+        
+        @param runs: list of (first, last, show) line ranges
+        @param changes: list of (header line, expanded) tuples
+        """
+        for line, expanded in changes:
+            self.SetFoldExpanded(line, expanded)
+        for first, last, show in runs:
+            if show:
+                self.ShowLines(first, last)
+            else:
+                self.HideLines(first, last)
+    
     def FoldAll(self):
         """Fold or unfold all items.
         
-        Code borrowed from the wxPython demo
+        Same behavior as the wxPython demo, but the fold hierarchy is computed
+        from all fold levels at once and lines are shown or hidden in ranges
+        rather than line by line.
         """
-        lineCount = self.GetLineCount()
-        expanding = True
+        fold = self.getFoldStructure()
+        if len(fold.headers) == 0:
+            return
 
         # find out if we are folding or unfolding
-        for lineNum in range(lineCount):
-            if self.GetFoldLevel(lineNum) & wx.stc.STC_FOLDLEVELHEADERFLAG:
-                expanding = not self.GetFoldExpanded(lineNum)
-                break
-
-        lineNum = 0
-
-        while lineNum < lineCount:
-            level = self.GetFoldLevel(lineNum)
-            if level & wx.stc.STC_FOLDLEVELHEADERFLAG and \
-               (level & wx.stc.STC_FOLDLEVELNUMBERMASK) == wx.stc.STC_FOLDLEVELBASE:
-
-                if expanding:
-                    self.SetFoldExpanded(lineNum, True)
-                    lineNum = self.Expand(lineNum, True)
-                    lineNum = lineNum - 1
-                else:
-                    lastChild = self.GetLastChild(lineNum, -1)
-                    self.SetFoldExpanded(lineNum, False)
-
-                    if lastChild > lineNum:
-                        self.HideLines(lineNum+1, lastChild)
-
-            lineNum = lineNum + 1
+        expanding = not self.GetFoldExpanded(int(fold.headers[0]))
+        if expanding:
+            runs, changes = fold.expand_all(self.GetFoldExpanded)
+        else:
+            runs, changes = fold.collapse_all()
+        self.applyFoldChanges(runs, changes)
 
     def Expand(self, line, doExpand, force=False, visLevels=0, level=-1):
         """Expand all folds.
         
-        Code borrowed from the wxPython demo.
+        Same behavior as the wxPython demo, computed using a
+        L{FoldStructure}.  The level parameter is ignored; the fold level of
+        each line is always used.
+        
+        Only the fold levels of the fold are read, plus the lines after it
+        that end the nested folds.
+        
+        Returns the line after the last child of the fold.
         """
-        lastChild = self.GetLastChild(line, level)
-        line = line + 1
-
-        while line <= lastChild:
-            if force:
-                if visLevels > 0:
-                    self.ShowLines(line, line)
-                else:
-                    self.HideLines(line, line)
-            else:
-                if doExpand:
-                    self.ShowLines(line, line)
-
-            if level == -1:
-                level = self.GetFoldLevel(line)
-
-            if level & wx.stc.STC_FOLDLEVELHEADERFLAG:
-                if force:
-                    if visLevels > 1:
-                        self.SetFoldExpanded(line, True)
-                    else:
-                        self.SetFoldExpanded(line, False)
-
-                    line = self.Expand(line, doExpand, force, visLevels-1)
-
-                else:
-                    if doExpand and self.GetFoldExpanded(line):
-                        line = self.Expand(line, True, force, visLevels-1)
-                    else:
-                        line = self.Expand(line, False, force, visLevels-1)
-            else:
-                line = line + 1
-
-        return line
+        last = self.GetLastChild(line, -1)
+        # The nested folds end at most two lines after the fold, because
+        # only one trailing blank line is given back to the parent
+        end = min(last + 3, self.GetLineCount())
+        fold = self.getFoldStructure(line, end)
+        is_expanded = lambda child: self.GetFoldExpanded(child + line)
+        runs, changes, next_line = fold.expand(0, doExpand, force, visLevels, is_expanded)
+        self.applyFoldChanges(*offset_fold_changes(runs, changes, line))
+        return next_line + line
 
     def GetFoldColumn(self, linenum):
         return self.GetFoldLevel(linenum)&wx.stc.STC_FOLDLEVELNUMBERMASK - wx.stc.STC_FOLDLEVELBASE
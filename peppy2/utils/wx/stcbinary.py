@@ -1,9 +1,59 @@
 # peppy Copyright (c) 2006-2010 Rob McMullen
 # Licenced under the GPLv2; see http://peppy.flipturn.org for more info
 
+import os
+
 import numpy as np
 
 from stcinterface import STCInterface, STCBinaryMixin
+from peppy2.utils.fileutil import atomic_write, patch_in_place, iter_array_chunks
+
+
+class DirtyPages(object):
+    """Record of the fixed-size pages of a byte store that have changed.
+
+    Only page numbers are stored, so tracking is proportional to the number of
+    modified pages and not the size of the buffer.  If an edit inserts or
+    deletes bytes, page offsets after the edit are no longer meaningful and
+    the tracker only reports that the length has changed.
+    """
+    def __init__(self, page_size):
+        self.page_size = page_size
+        self.clear()
+    
+    def clear(self):
+        self.pages = set()
+        self.length_changed = False
+    
+    def is_clean(self):
+        return not self.pages and not self.length_changed
+    
+    def mark(self, start, end, new_length):
+        """Record the replacement of bytes start:end with new_length bytes
+        """
+        if end - start != new_length:
+            self.length_changed = True
+        if new_length > 0:
+            first = start // self.page_size
+            last = (start + new_length - 1) // self.page_size
+            self.pages.update(xrange(first, last + 1))
+    
+    def get_runs(self, size):
+        """Return a list of (start, end) byte ranges covering contiguous runs
+        of modified pages, clipped to the given buffer size.
+        """
+        runs = []
+        for page in sorted(self.pages):
+            start = page * self.page_size
+            if start >= size:
+                break
+            end = min(start + self.page_size, size)
+            if runs and runs[-1][1] == start:
+                runs[-1] = (runs[-1][0], end)
+            else:
+                runs.append((start, end))
+        return runs
+
 
 class BinarySTC(STCInterface, STCBinaryMixin):
     """
@@ -15,8 +65,44 @@ class BinarySTC(STCInterface, STCBinaryMixin):
     STC<http://www.yellowbrain.com/stc/index.html>} for more info on
     the rest of the STC methods.
     """
+    # Granularity of change tracking, also the unit of in-place saves
+    page_size = 64 * 1024
+    
     def __init__(self):
         self.data = None
+        self.source_path = None
+        self.autosave_filename = None
+        self.dirty_trackers = []
+        self.save_pages = self.add_dirty_tracker()
+        self.modified_callbacks = []
+    
+    def add_dirty_tracker(self, tracker=None):
+        """Add an object that will be updated with every change to the data.
+        
+        The tracker must provide a C{mark(start, end, new_length)} method.  If
+        no tracker is specified, a new L{DirtyPages} instance is created.
+        """
+        if tracker is None:
+            tracker = DirtyPages(self.page_size)
+        self.dirty_trackers.append(tracker)
+        return tracker
+    
+    def remove_dirty_tracker(self, tracker):
+        self.dirty_trackers.remove(tracker)
+    
+    def addModifyCallback(self, func):
+        """Add a function to be called after every change to the data.
+        
+        Views sharing the store use this to stay in sync.  The function is
+        called as C{func(start, old_length, new_length)} where the bytes
+        starting at C{start} and C{old_length} bytes long have been replaced
+        by C{new_length} bytes.
+        """
+        self.modified_callbacks.append(func)
+    
+    def removeModifyCallback(self, func):
+        if func in self.modified_callbacks:
+            self.modified_callbacks.remove(func)
         
     def GetReadOnly(self):
         """Is the instance read-only (non-editable) or editable?"""
@@ -63,7 +149,7 @@ class BinarySTC(STCInterface, STCBinaryMixin):
         pass
 
     def SetSavePoint(self):
-        pass
+        self.save_pages.clear()
 
     def GetText(self):
         return ''
@@ -76,7 +162,7 @@ class BinarySTC(STCInterface, STCBinaryMixin):
     GetTextLength = GetLength
 
     def GetModify(self):
-        return False
+        return not self.save_pages.is_clean()
 
     def CreateDocument(self):
         return "notarealdoc"
@@ -157,7 +243,7 @@ class BinarySTC(STCInterface, STCBinaryMixin):
 
     def getAutosaveTemporaryFilename(self, buffer):
         """Hook to allow STC to specify autosave filename"""
-        pass
+        return self.autosave_filename
 
     def getBackupTemporaryFilename(self, buffer):
         """Hook to allow STC to override backup filename"""
@@ -287,8 +373,63 @@ class BinarySTC(STCInterface, STCBinaryMixin):
         @param bytes: new bytes to replace existing data
         """
         bytes = np.fromstring(bytes, dtype=np.uint8)
-        self.data[start:end] = bytes
+        if end - start == bytes.size:
+            self.data[start:end] = bytes
+        else:
+            self.data = np.concatenate((self.data[:start], bytes, self.data[end:]))
+        for tracker in self.dirty_trackers:
+            tracker.mark(start, end, bytes.size)
+        for func in self.modified_callbacks:
+            func(start, end - start, bytes.size)
 
     def SetBinary(self, data):
         self.data = np.fromstring(data, dtype=np.uint8)
+        self.source_path = None
+        self.SetSavePoint()
         self.EmptyUndoBuffer()
+    
+    def LoadFile(self, path):
+        """Use the contents of the file as the data.
+        
+        The file is memory mapped copy-on-write, so opening even a very large
+        file is fast and modified pages never touch the file until it is
+        explicitly saved.
+        """
+        if os.path.getsize(path) > 0:
+            self.data = np.memmap(path, dtype=np.uint8, mode='c')
+        else:
+            # mmap can't handle zero length files
+            self.data = np.zeros(0, dtype=np.uint8)
+        self.source_path = path
+        self.SetSavePoint()
+        self.EmptyUndoBuffer()
+    
+    def CanPatchInPlace(self, path):
+        """Can the data be saved to path by rewriting only modified pages?
+        
+        This is only possible if the length of the data hasn't changed and
+        the file on disk is the one the data was originally loaded from.
+        """
+        if self.source_path is None or self.save_pages.length_changed:
+            return False
+        try:
+            return (os.path.samefile(path, self.source_path) and
+                    os.path.getsize(path) == self.GetLength())
+        except OSError:
+            return False
+    
+    def SaveFile(self, path):
+        """Save the data to path.
+        
+        If possible, only the modified pages are written back to the original
+        file.  Otherwise the whole buffer is streamed to a temporary file that
+        replaces the original file only once it has been completely written.
+        Note that the file is remapped after a full rewrite, so any references
+        to the old L{data} array should be refreshed.
+        """
+        if self.CanPatchInPlace(path):
+            patch_in_place(path, self.data, self.save_pages.get_runs(self.GetLength()))
+            self.SetSavePoint()
+        else:
+            atomic_write(path, iter_array_chunks(self.data))
+            self.LoadFile(path)
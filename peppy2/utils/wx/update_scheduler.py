@@ -0,0 +1,91 @@
+"""Coalesced display updates for byte stores
+
+Views of a byte store register here rather than with the store itself.  Each
+change to the store is merged into a list of dirty ranges, and the views are
+notified once per frame with the combined ranges no matter how many changes
+arrived in the meantime.
+"""
+import functools
+
+import wx
+
+from peppy2.utils.ranges import ChangeAccumulator
+
+import logging
+log = logging.getLogger(__name__)
+
+
+class UpdateScheduler(object):
+    # Delay in milliseconds before the views are notified; about one frame
+    frame_delay = 16
+    
+    def __init__(self):
+        # id(store) -> (store, list of callbacks, modify callback on the store)
+        self.listeners = {}
+        
+        # id(store) -> ChangeAccumulator
+        self.pending = {}
+        self.timer = None
+    
+    def add_listener(self, store, callback):
+        """Call callback(ranges, length_changed) after changes to the store
+        
+        The ranges are a sorted list of (start, end) byte ranges, and
+        length_changed is True if the ranges extend to the end of the data
+        because bytes have been inserted or deleted.
+        """
+        key = id(store)
+        if key not in self.listeners:
+            on_modified = functools.partial(self.on_modified, key)
+            store.addModifyCallback(on_modified)
+            self.listeners[key] = (store, [], on_modified)
+        callbacks = self.listeners[key][1]
+        if callback not in callbacks:
+            callbacks.append(callback)
+    
+    def remove_listener(self, store, callback):
+        key = id(store)
+        if key not in self.listeners:
+            return
+        store, callbacks, on_modified = self.listeners[key]
+        if callback in callbacks:
+            callbacks.remove(callback)
+        if not callbacks:
+            store.removeModifyCallback(on_modified)
+            del self.listeners[key]
+            self.pending.pop(key, None)
+    
+    def on_modified(self, key, start, old_length, new_length):
+        changes = self.pending.get(key)
+        if changes is None:
+            changes = ChangeAccumulator()
+            self.pending[key] = changes
+        store = self.listeners[key][0]
+        changes.add(start, old_length, new_length, store.GetLength())
+        if self.timer is None:
+            self.timer = wx.CallLater(self.frame_delay, self.flush)
+    
+    def flush(self):
+        """Notify the views of all the pending changes
+        """
+        if self.timer is not None:
+            self.timer.Stop()
+            self.timer = None
+        pending, self.pending = self.pending, {}
+        for key, changes in pending.iteritems():
+            if key not in self.listeners or changes.is_empty():
+                continue
+            log.debug("flush: %s length_changed=%s" % (changes.ranges, changes.length_changed))
+            callbacks = self.listeners[key][1]
+            for callback in list(callbacks):
+                # Earlier callbacks may have removed later ones
+                if callback in callbacks:
+                    callback(changes.ranges, changes.length_changed)
+
+
+GlobalUpdateScheduler = None
+def get_update_scheduler():
+    global GlobalUpdateScheduler
+    if GlobalUpdateScheduler is None:
+        GlobalUpdateScheduler = UpdateScheduler()
+    return GlobalUpdateScheduler
@@ -4,7 +4,7 @@
 import logging
  
 # Local imports.
-from peppy2.framework.application import run
+from peppy2.utils.single_instance import hand_off
 
 
 # A list of the directories that contain the application's eggs (any directory
@@ -12,15 +12,32 @@ from peppy2.framework.application import run
 # working directory).
 EGG_PATH = ['eggs']
 
+# The name of the application, which also names the socket that later
+# launches use to reach a running instance
+APPLICATION_NAME = 'Peppy2'
+
 
 def main(argv):
     """ Run the application.
     """
+    # If the application is already running, it loads the files instead and
+    # this launch doesn't need to import wx or any plugins
+    if hand_off(argv[1:], APPLICATION_NAME):
+        return
+    
+    # Start tracing before the application is imported to include the time
+    # taken to import wx
+    if "--trace-startup" in argv:
+        from peppy2.utils.startup_trace import start_trace
+        start_trace()
+    
+    from peppy2.framework.application import run
+    
     logging.basicConfig(level=logging.WARNING)
     logger = logging.getLogger()
     logger.setLevel(logging.DEBUG)
 
-    run(egg_path=EGG_PATH)
+    run(egg_path=EGG_PATH, application_name=APPLICATION_NAME)
 
     logging.shutdown()
 
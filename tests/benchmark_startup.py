@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+"""Startup benchmark
+
+Starts the application repeatedly with --trace-startup --exit-after-startup
+and prints percentiles of the wall clock time of each run and of each phase
+in the startup trace reports.  Any extra arguments are passed to run.py,
+e.g. the name of a file to load:
+
+    python benchmark_startup.py -n 20 samples/UTF-8-demo.txt
+
+Without a display, the runs are wrapped in xvfb-run if it's available.  The
+summary can be saved as JSON with --output to compare against later runs.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from distutils.spawn import find_executable
+
+top = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path[0:0] = [top]
+
+from peppy2.utils.startup_trace import get_percentile
+
+
+percents = [50, 90, 99, 100]
+
+
+def run_once(command):
+    start = time.time()
+    proc = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, cwd=top)
+    output = proc.communicate()[0]
+    wall = time.time() - start
+    report = None
+    for line in output.splitlines():
+        if line.startswith("startup trace: "):
+            with open(line[len("startup trace: "):].strip()) as fh:
+                report = json.load(fh)
+    if proc.returncode != 0 or report is None:
+        print(output)
+        raise RuntimeError("Startup failed with exit code %s" % proc.returncode)
+    return wall, report
+
+
+def summarize(runs):
+    """Return a dict of percentiles of the wall time, the trace total and
+    the duration of each phase
+    """
+    samples = {'wall': [r[0] for r in runs], 'total': [r[1]['total'] for r in runs]}
+    for wall, report in runs:
+        for phase in report['phases']:
+            samples.setdefault("phase:" + phase['name'], []).append(phase['duration'])
+        for m in report['marks']:
+            samples.setdefault("mark:" + m['name'], []).append(m['time'])
+        for plugin in report['plugins']:
+            samples.setdefault("plugin:" + plugin['id'], []).append(plugin['duration'])
+    summary = {}
+    for name, values in samples.items():
+        summary[name] = dict(("p%d" % p, get_percentile(values, p)) for p in percents)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure application startup time")
+    parser.add_argument("-n", "--count", type=int, default=10, help="Number of startups")
+    parser.add_argument("-o", "--output", help="Save the summary as JSON")
+    parser.add_argument("--no-xvfb", dest="xvfb", action="store_false", default=True, help="Don't use xvfb-run even if there is no display")
+    options, extra_args = parser.parse_known_args()
+
+    command = [sys.executable, os.path.join(top, "run.py"), "--trace-startup", "--exit-after-startup", "--new-instance"] + extra_args
+    if options.xvfb and not os.environ.get("DISPLAY") and sys.platform.startswith("linux"):
+        xvfb = find_executable("xvfb-run")
+        if xvfb:
+            command[0:0] = [xvfb, "-a"]
+
+    runs = []
+    for i in range(options.count):
+        runs.append(run_once(command))
+        print("run %d: %.3fs" % (i + 1, runs[-1][0]))
+
+    summary = summarize(runs)
+    print("%-50s %s" % ("", " ".join(["%8s" % ("p%d" % p) for p in percents])))
+    for name in sorted(summary.keys()):
+        print("%-50s %s" % (name, " ".join(["%8.3f" % summary[name]["p%d" % p] for p in percents])))
+    if options.output:
+        with open(options.output, "w") as fh:
+            json.dump(summary, fh, indent=1)
+
+
+if __name__ == "__main__":
+    main()
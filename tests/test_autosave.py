@@ -0,0 +1,92 @@
+import os
+import tempfile
+import shutil
+
+from nose.tools import *
+
+import numpy as np
+
+from peppy2.utils.wx.stcbinary import BinarySTC
+from peppy2.utils.autosave import AutosaveService, JournalTracker
+
+
+class TestJournalTracker(object):
+    def test_insert_after_change(self):
+        tracker = JournalTracker(4)
+        tracker.mark(9, 10, 1)
+        assert_equal(tracker.ranges, [(8, 12)])
+        tracker.mark(2, 2, 3)
+        assert_equal(tracker.edits, [(2, 0, 3)])
+        assert_equal(tracker.ranges, [(0, 8), (11, 15)])
+
+
+class TestAutosave(object):
+    def setup(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "test.bin")
+        self.original = np.arange(100000, dtype=np.uint32).view(np.uint8)
+        with open(self.path, "wb") as fh:
+            fh.write(self.original.tostring())
+        self.service = AutosaveService(os.path.join(self.dir, "journals"))
+        self.stc = BinarySTC()
+        self.stc.LoadFile(self.path)
+        self.service.register(self.stc, self.path)
+
+    def teardown(self):
+        self.stc = None
+        shutil.rmtree(self.dir)
+
+    def recover(self):
+        stc = BinarySTC()
+        stc.LoadFile(self.path)
+        assert_true(self.service.is_recoverable(self.path))
+        self.service.recover(stc, self.path)
+        return stc.data.tostring()
+
+    def test_no_changes(self):
+        self.service.snapshot()
+        assert_false(self.service.is_recoverable(self.path))
+
+    def test_snapshots(self):
+        self.stc.SetBytes(1000, 1002, "ab")
+        self.service.snapshot()
+        self.stc.SetBytes(200000, 200000, "inserted")
+        self.stc.SetBytes(50, 60, "")
+        self.stc.SetBytes(399990, 399991, "z")
+        self.service.snapshot()
+        self.stc.SetBytes(0, 1, "q")
+        self.service.snapshot()
+        assert_equal(self.recover(), self.stc.data.tostring())
+        assert_equal(self.stc.getAutosaveTemporaryFilename(None), self.service.get_journal_path(self.path))
+
+    def test_incomplete_snapshot(self):
+        self.stc.SetBytes(1000, 1002, "ab")
+        self.service.snapshot()
+        expected = self.stc.data.tostring()
+        self.stc.SetBytes(5, 6, "x")
+        self.service.snapshot()
+        journal = self.service.get_journal_path(self.path)
+        with open(journal, "r+b") as fh:
+            fh.truncate(os.path.getsize(journal) - 10)
+        assert_equal(self.recover(), expected)
+
+    def test_saved(self):
+        self.stc.SetBytes(1000, 1002, "ab")
+        self.service.snapshot()
+        self.stc.SaveFile(self.path)
+        self.service.saved(self.stc, self.path)
+        assert_false(os.path.exists(self.service.get_journal_path(self.path)))
+
+    def test_file_changed(self):
+        self.stc.SetBytes(1000, 1002, "ab")
+        self.service.snapshot()
+        with open(self.path, "ab") as fh:
+            fh.write("more")
+        assert_false(self.service.is_recoverable(self.path))
+
+    def test_file_changed_before_snapshot(self):
+        with open(self.path, "ab") as fh:
+            fh.write("more")
+        self.stc.SetBytes(1000, 1002, "ab")
+        self.service.snapshot()
+        assert_false(self.service.is_recoverable(self.path))
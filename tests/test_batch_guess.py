@@ -0,0 +1,52 @@
+import os
+import tempfile
+import shutil
+
+from nose.tools import *
+
+from peppy2.utils.batch_guess import *
+
+
+def recognize(guess):
+    if guess.bytes.startswith("#!"):
+        guess.metadata.mime = "text/x-script"
+    else:
+        guess.metadata.mime = "text/plain"
+
+
+class TestBatchGuess(object):
+    def setup(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.uris = []
+        for i in range(10):
+            path = os.path.join(self.tempdir, "file%d" % i)
+            with open(path, "wb") as fh:
+                fh.write("#!script" if i % 2 else "text")
+            self.uris.append(path)
+
+    def teardown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_order(self):
+        uris = self.uris + [os.path.join(self.tempdir, "missing")]
+        results = guess_files(uris, recognize)
+        assert_equal([r[0] for r in results], uris)
+        assert_equal([r[1].metadata.mime for r in results[:4]], ["text/plain", "text/x-script", "text/plain", "text/x-script"])
+        assert_equal(results[-1][1], None)
+        assert_true(results[-1][2])
+
+    def test_cached_mime(self):
+        cached = lambda uri: "image/png" if uri == self.uris[0] else None
+        results = guess_files(self.uris[0:2], recognize, cached)
+        assert_equal([r[1].metadata.mime for r in results], ["image/png", "text/x-script"])
+
+    def test_job(self):
+        finished = []
+        known = {self.uris[3]: "known guess"}
+        job = GuessFilesJob(self.uris, recognize, finished.append, known=known)
+        job._start(None)
+        job.success_callback()
+        assert_equal(finished, [job])
+        assert_equal([r[0] for r in job.results], self.uris)
+        assert_equal(job.results[3], (self.uris[3], "known guess", None))
+        assert_equal(job.results[4][1].metadata.mime, "text/plain")
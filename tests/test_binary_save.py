@@ -0,0 +1,95 @@
+import os
+import tempfile
+import shutil
+
+from nose.tools import *
+
+import numpy as np
+
+from peppy2.utils.wx.stcbinary import BinarySTC, DirtyPages
+from peppy2.utils.fileutil import atomic_write
+
+
+class TestDirtyPages(object):
+    def setup(self):
+        self.pages = DirtyPages(16)
+
+    def test_runs(self):
+        self.pages.mark(3, 4, 1)
+        self.pages.mark(20, 40, 20)
+        self.pages.mark(100, 101, 1)
+        assert_equal(self.pages.get_runs(200), [(0, 48), (96, 112)])
+        assert_false(self.pages.length_changed)
+
+    def test_clip(self):
+        self.pages.mark(30, 31, 1)
+        assert_equal(self.pages.get_runs(20), [(16, 20)])
+
+    def test_length_change(self):
+        self.pages.mark(3, 4, 2)
+        assert_true(self.pages.length_changed)
+        self.pages.clear()
+        assert_true(self.pages.is_clean())
+
+
+class TestBinarySave(object):
+    def setup(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "test.bin")
+        self.original = np.arange(300000, dtype=np.uint32).view(np.uint8)
+        with open(self.path, "wb") as fh:
+            fh.write(self.original.tostring())
+        self.stc = BinarySTC()
+        self.stc.LoadFile(self.path)
+
+    def teardown(self):
+        self.stc = None
+        shutil.rmtree(self.dir)
+
+    def get_file(self):
+        with open(self.path, "rb") as fh:
+            return fh.read()
+
+    def test_load(self):
+        assert_equal(self.stc.GetLength(), self.original.size)
+        assert_false(self.stc.GetModify())
+
+    def test_patch_in_place(self):
+        self.stc.SetBytes(100000, 100001, "\xff")
+        assert_true(self.stc.GetModify())
+        assert_equal(self.stc.save_pages.get_runs(self.stc.GetLength()), [(65536, 131072)])
+        assert_true(self.stc.CanPatchInPlace(self.path))
+        inode = os.stat(self.path).st_ino
+        self.stc.SaveFile(self.path)
+        assert_false(self.stc.GetModify())
+        assert_equal(os.stat(self.path).st_ino, inode)
+        expected = self.original.copy()
+        expected[100000] = 0xff
+        assert_equal(self.get_file(), expected.tostring())
+
+    def test_insert(self):
+        self.stc.SetBytes(10, 10, "abc")
+        assert_false(self.stc.CanPatchInPlace(self.path))
+        self.stc.SaveFile(self.path)
+        expected = self.original.tostring()
+        expected = expected[:10] + "abc" + expected[10:]
+        assert_equal(self.get_file(), expected)
+        assert_equal(self.stc.GetLength(), len(expected))
+        assert_false(self.stc.GetModify())
+
+    def test_save_as(self):
+        other = os.path.join(self.dir, "other.bin")
+        self.stc.SetBytes(0, 2, "zz")
+        assert_false(self.stc.CanPatchInPlace(other))
+        self.stc.SaveFile(other)
+        with open(other, "rb") as fh:
+            assert_equal(fh.read(), "zz" + self.original[2:].tostring())
+        assert_equal(self.get_file(), self.original.tostring())
+
+    def test_atomic_write_failure(self):
+        def chunks():
+            yield "partial"
+            raise RuntimeError("write failed")
+        assert_raises(RuntimeError, atomic_write, self.path, chunks())
+        assert_equal(self.get_file(), self.original.tostring())
+        assert_equal(os.listdir(self.dir), ["test.bin"])
@@ -0,0 +1,72 @@
+from nose.tools import *
+
+import numpy as np
+
+from peppy2.utils.bindiff import *
+
+
+class TestDiff(object):
+    def setup(self):
+        rnd = np.random.RandomState(2)
+        self.a = rnd.randint(0, 256, 200000).astype(np.uint8)
+        self.rnd = rnd
+
+    def check(self, a, b):
+        opcodes = diff(a, b)
+        a_pos = b_pos = 0
+        rebuilt = []
+        for tag, a1, a2, b1, b2 in opcodes:
+            assert_equal((a1, b1), (a_pos, b_pos))
+            if tag == 'equal':
+                assert_true(np.all(a[a1:a2] == b[b1:b2]))
+            rebuilt.append(b[b1:b2] if tag != 'equal' else a[a1:a2])
+            a_pos, b_pos = a2, b2
+        assert_equal((a_pos, b_pos), (a.size, b.size))
+        assert_true(np.all(np.concatenate(rebuilt) == b))
+        return opcodes
+
+    def num_changed(self, opcodes):
+        return sum(max(a2 - a1, b2 - b1) for tag, a1, a2, b1, b2 in opcodes if tag != 'equal')
+
+    def test_same_length(self):
+        b = self.a.copy()
+        b[1000:1010] ^= 0xff
+        b[150000] ^= 1
+        opcodes = self.check(self.a, b)
+        assert_equal(DiffResult(opcodes).get_ranges(0), [(1000, 1010), (150000, 150001)])
+        assert_equal(self.check(self.a, self.a.copy()), [('equal', 0, self.a.size, 0, self.a.size)])
+
+    def test_insert_delete(self):
+        b = np.concatenate((self.a[:5000], self.rnd.randint(0, 256, 300).astype(np.uint8), self.a[5000:120000], self.a[121000:]))
+        b[180000] ^= 0xff
+        opcodes = self.check(self.a, b)
+        assert_true(self.num_changed(opcodes) < 2000)
+        opcodes = self.check(b, self.a)
+        assert_true(self.num_changed(opcodes) < 2000)
+
+    def test_navigation(self):
+        b = np.concatenate((self.a[:100], self.a[200:50000], self.a[50000:50010] ^ 1, self.a[50010:]))
+        result = DiffResult(self.check(self.a, b))
+        assert_equal(len(result), 2)
+        assert_equal(result.next_difference(0, 0), 0)
+        assert_equal(result.next_difference(0, 100), 1)
+        assert_equal(result.next_difference(0, 50000), None)
+        assert_equal(result.prev_difference(0, 50000), 0)
+        assert_equal(result.prev_difference(0, 100), None)
+        assert_equal(result.get_ranges(1), [(49900, 49910)])
+
+    def test_no_anchors(self):
+        # Small inputs whose differing middle has no anchors
+        a = self.rnd.randint(0, 256, 600).astype(np.uint8)
+        b = np.concatenate((a[:100], self.rnd.randint(0, 256, 50).astype(np.uint8), a[300:]))
+        self.check(a, b)
+        self.check(b, a)
+        assert_equal(find_anchors(a[:20]).size, 0)
+
+    def test_low_entropy(self):
+        a = np.zeros(5000, dtype=np.uint8)
+        b = np.zeros(4000, dtype=np.uint8)
+        b[2000] = 1
+        self.check(a, b)
+        a[::7] = 0xff
+        self.check(a, np.concatenate((a[:1000], a[1500:])))
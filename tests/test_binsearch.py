@@ -0,0 +1,70 @@
+import re
+
+from nose.tools import *
+
+import numpy as np
+
+from peppy2.utils.binsearch import *
+
+
+class TestPatterns(object):
+    def setup(self):
+        rnd = np.random.RandomState(1)
+        self.data = rnd.randint(0, 256, 100000).astype(np.uint8)
+        self.data[99990:99994] = [0xde, 0xad, 0xbe, 0xef]
+        self.data[5000:5004] = [0xde, 0xad, 0xbe, 0xef]
+        self.text = self.data.tostring()
+
+    def brute_force(self, regex):
+        return [m.start() for m in re.finditer("(?=%s)" % regex, self.text, re.DOTALL)]
+
+    def check(self, pattern, regex, size=1000):
+        expected = self.brute_force(regex)
+        hits = [h for pos, hits in iter_hits(self.data, pattern, size=size) for h in hits.tolist()]
+        assert_equal(hits, expected)
+        assert_equal(find_all(self.data, pattern).tolist(), expected)
+
+    def test_literal(self):
+        pattern = get_pattern("de ad be ef")
+        assert_true(isinstance(pattern, LiteralPattern))
+        self.check(pattern, re.escape("\xde\xad\xbe\xef"), 4999)
+
+    def test_short_literal(self):
+        self.data[300:310] = 0x41
+        self.text = self.data.tostring()
+        pattern = get_pattern("41 41")
+        assert_true(pattern.filter is not None)
+        self.check(pattern, "AA", 305)
+        self.check(get_pattern("41"), "A", 999)
+        self.check(LiteralPattern("AAAAAAAAA"), "A{9}", 303)
+
+    def test_wildcards(self):
+        pattern = get_pattern("d? ?? b?")
+        assert_true(isinstance(pattern, MaskedPattern))
+        assert_equal(str(pattern), "d? ?? b?")
+        self.check(pattern, "[\xd0-\xdf].[\xb0-\xbf]", 1001)
+        self.check(get_pattern("?? 3?"), ".[\x30-\x3f]", 999)
+
+    def test_text(self):
+        self.data[70000:70010] = np.fromstring("peppy2 abc", dtype=np.uint8)
+        self.data[80000:80006] = np.fromstring("a\0B\0c\0", dtype=np.uint8)
+        self.text = self.data.tostring()
+        self.check(get_pattern("abc", "ascii"), "abc")
+        self.check(get_pattern("ABC", "ascii", True), "(?i)abc")
+        self.check(get_pattern("aBc", "utf-16", True), "(?i)a\0b\0c\0")
+        self.check(get_pattern("pep+y[0-9]", "regex"), "pep+y[0-9]")
+
+    def test_errors(self):
+        assert_raises(SearchError, get_pattern, "abc")
+        assert_raises(SearchError, get_pattern, "zz")
+        assert_raises(SearchError, get_pattern, "(", "regex")
+        assert_raises(SearchError, get_pattern, "", "ascii")
+        assert_raises(SearchError, get_pattern, u"\u20ac", "ascii")
+        assert_raises(SearchError, get_pattern, "\xe9", "utf-16")
+
+    def test_unicode(self):
+        self.data[60000:60003] = np.fromstring(u"\u20ac".encode("utf-8"), dtype=np.uint8)
+        self.data[61000:61002] = np.fromstring(u"\xe9".encode("latin-1") + "x", dtype=np.uint8)
+        self.text = self.data.tostring()
+        self.check(get_pattern(u"\u20ac", "regex"), "\xe2\x82\xac")
+        self.check(get_pattern(u"\xe9x", "ascii"), "\xe9x")
@@ -0,0 +1,88 @@
+import os
+import tempfile
+import shutil
+
+from nose.tools import *
+
+import numpy as np
+
+from peppy2.utils.bitpyramid import *
+
+
+class TestBitPyramid(object):
+    def setup(self):
+        rnd = np.random.RandomState(7)
+        self.data = rnd.randint(0, 256, 10000).astype(np.uint8)
+        self.data[:1000] = 0
+        self.data[1000:2000] = 0xff
+        self.tempdir = tempfile.mkdtemp()
+
+    def teardown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_downsample(self):
+        levels = downsample_bits(self.data, 2, 4)
+        assert_equal(levels.shape, (1250, 16))
+        assert_true(np.all(levels[:125] == 255))
+        assert_true(np.all(levels[125:250] == 0))
+        bits = np.unpackbits(self.data[2000:2008]).reshape((4, 16))
+        expected = 255 - (bits.sum(axis=0) * 255 + 2) // 4
+        assert_true(np.all(levels[250] == expected))
+
+    def test_levels(self):
+        pyramid = BitPyramid(self.data, 1, max_bytes=8 * 1000)
+        assert_equal(pyramid.base_factor, 16)
+        assert_equal([level.shape[0] for level in pyramid.levels], [625, 313, 157, 79, 40, 20, 10, 5, 3, 2, 1])
+        assert_equal(pyramid.get_level_index(8), None)
+        assert_equal(pyramid.get_level_index(64), 2)
+        rows = pyramid.get_rows(self.data, 64, 150, 10)
+        assert_true(np.all(rows[:6] == pyramid.levels[2][150:156]))
+        assert_true(np.all(rows[7:] == 255))
+        rows = pyramid.get_rows(self.data, 4, 100, 3)
+        assert_true(np.all(rows == downsample_bits(self.data, 1, 4)[100:103]))
+
+    def test_update(self):
+        pyramid = BitPyramid(self.data, 1, max_bytes=8 * 1000)
+        self.data[9990:9995] = 0xaa
+        self.data[10:20] = 0x55
+        pyramid.update(self.data, 9990, 9995)
+        pyramid.update(self.data, 10, 20)
+        expected = BitPyramid(self.data, 1, max_bytes=8 * 1000)
+        for l1, l2 in zip(pyramid.levels, expected.levels):
+            assert_true(np.all(l1 == l2))
+
+    def test_cache(self):
+        path = os.path.join(self.tempdir, "data.bin")
+        with open(path, "wb") as fh:
+            fh.write(self.data.tostring())
+        cache_file = get_cache_file(os.path.join(self.tempdir, "cache"), path, 1)
+        job = BitPyramidJob(self.data, 1, lambda j: None, cache_file)
+        job._start(None)
+        assert_true(os.path.exists(cache_file))
+        loaded = BitPyramid.load(cache_file, self.data.size, 1)
+        assert_equal(loaded.base_factor, job.pyramid.base_factor)
+        for l1, l2 in zip(loaded.levels, job.pyramid.levels):
+            assert_true(np.all(l1 == l2))
+        assert_equal(BitPyramid.load(cache_file, self.data.size, 2), None)
+        assert_equal(BitPyramid.load(cache_file + "x", self.data.size, 1), None)
+
+    def test_cancel(self):
+        finished = []
+        job = BitPyramidJob(self.data, 1, finished.append)
+        job.cancel()
+        job._start(None)
+        job.success_callback()
+        assert_equal(job.pyramid, None)
+        assert_equal(finished, [])
+
+    def test_prebuild(self):
+        path = os.path.join(self.tempdir, "data.bin")
+        with open(path, "wb") as fh:
+            fh.write(self.data.tostring())
+        cache_dir = os.path.join(self.tempdir, "cache")
+        cache_file = prebuild_cache(cache_dir, path)
+        assert_equal(cache_file, get_cache_file(cache_dir, path, 1))
+        loaded = BitPyramid.load(cache_file, self.data.size, 1)
+        for l1, l2 in zip(loaded.levels, BitPyramid(self.data, 1).levels):
+            assert_true(np.all(l1 == l2))
+        assert_equal(prebuild_cache(cache_dir, path + "x"), None)
@@ -0,0 +1,78 @@
+import hashlib
+import zlib
+
+from nose.tools import *
+
+import numpy as np
+
+from peppy2.utils.wx.stcbinary import BinarySTC
+from peppy2.utils.blockhash import *
+
+
+class TestBlockHash(object):
+    def setup(self):
+        rnd = np.random.RandomState(3)
+        self.stc = BinarySTC()
+        self.stc.SetBinary(rnd.randint(0, 256, 100000).astype(np.uint8).tostring())
+        self.index = BlockHashIndex(self.stc, 1024, 16)
+
+    def check(self, start=0, end=None):
+        text = self.stc.data.tostring()[start:end]
+        assert_equal(self.index.crc32(start, end), zlib.crc32(text) & 0xffffffff)
+        for name in digest_algorithms:
+            assert_equal(self.index.hexdigest(name, start, end), hashlib.new(name, text).hexdigest())
+
+    def test_combine(self):
+        a = "peppy2 " * 100
+        b = "checksum" * 37
+        assert_equal(crc32_combine(crc32(a), crc32(b), len(b)), crc32(a + b))
+
+    def test_ranges(self):
+        self.check()
+        self.check(0, 5000)
+        self.check(1000, 3072)
+        self.check(1023, 99999)
+        self.check(2048, 4096)
+
+    def test_edits(self):
+        self.index.update(digest_algorithms)
+        assert_true(self.index.is_current(digest_algorithms))
+        self.stc.SetBytes(50000, 50001, "x")
+        assert_false(self.index.is_current())
+        assert_equal(len(self.index.checkpoints["md5"]), 3)
+        self.check()
+        self.stc.SetBytes(3000, 3000, "inserted")
+        self.check()
+        self.check(100, 60000)
+        self.stc.SetBytes(99000, 99900, "")
+        self.check()
+
+    def test_checkpoint_interval(self):
+        for interval in [1, 5, 200]:
+            self.index = BlockHashIndex(self.stc, 1024, interval)
+            self.index.update(digest_algorithms)
+            assert_equal(len(self.index.checkpoints["sha1"]), 97 // interval)
+            self.check()
+            self.check(0, 7000)
+            self.stc.SetBytes(20000, 20002, "ab")
+            self.check()
+
+    def test_edit_during_update(self):
+        update = self.index.prepare_update(["md5"])
+        self.stc.SetBytes(10, 12, "ab")
+        update.run()
+        self.index.install_update(update)
+        assert_false(self.index.valid[0])
+        assert_true(self.index.valid[1])
+        assert_equal(len(self.index.checkpoints["md5"]), 0)
+        self.check()
+
+    def test_range_digest_job(self):
+        finished = []
+        job = RangeDigestJob(self.stc.data, 1000, 70001, digest_algorithms, finished.append, 4096)
+        job._start(None)
+        job.success_callback()
+        assert_equal(finished, [job])
+        text = self.stc.data.tostring()[1000:70001]
+        for name in digest_algorithms:
+            assert_equal(job.digests[name], hashlib.new(name, text).hexdigest())
@@ -0,0 +1,96 @@
+import os
+import time
+import tempfile
+import shutil
+import threading
+
+from nose.tools import *
+
+from peppy2.utils.dir_listing import *
+
+
+def recognize(guess):
+    guess.metadata.mime = "text/x-python" if guess.metadata.uri.endswith(".py") else "text/plain"
+
+
+class TestDirListing(object):
+    def setup(self):
+        self.tempdir = tempfile.mkdtemp()
+        for name in ["b.py", "A.txt", ".hidden", "c.py"]:
+            with open(os.path.join(self.tempdir, name), "w") as fh:
+                fh.write(name)
+        os.mkdir(os.path.join(self.tempdir, "sub"))
+        with open(os.path.join(self.tempdir, "sub", "d.txt"), "w") as fh:
+            fh.write("d")
+        self.results = []
+        self.done = threading.Event()
+        self.mimes = threading.Event()
+        self.lister = None
+
+    def teardown(self):
+        if self.lister is not None:
+            self.lister.stop()
+        shutil.rmtree(self.tempdir)
+
+    def callback(self, request_id, path, entries, done, error):
+        self.results.append((request_id, path, entries, done, error))
+        if done:
+            self.done.set()
+
+    def test_entries(self):
+        batches = list(iter_entries(self.tempdir, batch_size=2))
+        assert_equal([len(b) for b in batches], [2, 2])
+        entries = sort_entries([e for b in batches for e in b])
+        assert_equal([e.name for e in entries], ["sub", "A.txt", "b.py", "c.py"])
+        assert_equal([e.name for e in filter_entries(entries, ["*.py"])], ["sub", "b.py", "c.py"])
+        assert_raises(OSError, list, iter_entries(os.path.join(self.tempdir, "missing")))
+
+    def test_cache(self):
+        cache = ListingCache(max_dirs=1)
+        mtime = get_mtime(self.tempdir)
+        cache.put(self.tempdir, mtime, ["listing"])
+        assert_equal(cache.get(self.tempdir), ["listing"])
+        assert_equal(cache.peek(self.tempdir), ["listing"])
+        # Changing the directory invalidates the listing
+        os.utime(self.tempdir, (mtime + 10, mtime + 10))
+        assert_equal(cache.get(self.tempdir), None)
+        sub = os.path.join(self.tempdir, "sub")
+        cache.put(self.tempdir, get_mtime(self.tempdir), ["listing"])
+        cache.put(sub, get_mtime(sub), ["sub listing"])
+        assert_false(self.tempdir in cache)
+        assert_true(sub in cache)
+
+    def test_lister(self):
+        cache = ListingCache()
+        self.lister = DirectoryLister(self.callback, lambda path: self.mimes.set(), recognize, cache)
+        request_id = self.lister.list_directory(self.tempdir, ["*.py"])
+        assert_true(self.done.wait(5.0))
+        assert_true(self.mimes.wait(5.0))
+        assert_true(all(r[0] == request_id and r[4] is None for r in self.results))
+        names = sorted(e.name for r in self.results[:-1] for e in r[2])
+        assert_equal(names, ["b.py", "c.py", "sub"])
+        # The final call has the complete sorted listing
+        assert_equal([e.name for e in self.results[-1][2]], ["sub", "b.py", "c.py"])
+        entries = cache.get(self.tempdir)
+        assert_equal([e.name for e in entries], ["sub", "A.txt", "b.py", "c.py"])
+        assert_equal([e.mime for e in entries[2:]], ["text/x-python", "text/x-python"])
+        # Subdirectories are read ahead into the cache
+        for i in range(50):
+            if os.path.join(self.tempdir, "sub") in cache:
+                break
+            time.sleep(0.1)
+        assert_equal([e.name for e in cache.get(os.path.join(self.tempdir, "sub"))], ["d.txt"])
+
+    def test_lister_error(self):
+        self.lister = DirectoryLister(self.callback)
+        self.lister.list_directory(os.path.join(self.tempdir, "missing", "file"))
+        assert_true(self.done.wait(5.0))
+        assert_true(self.results[-1][4])
+
+    def test_lister_file(self):
+        # A file is shown in the listing of its directory
+        self.lister = DirectoryLister(self.callback)
+        self.lister.list_directory(os.path.join(self.tempdir, "sub", "d.txt"))
+        assert_true(self.done.wait(5.0))
+        assert_equal(self.results[-1][1], os.path.join(self.tempdir, "sub"))
+        assert_equal([e.name for e in self.results[-1][2]], ["d.txt"])
@@ -0,0 +1,48 @@
+import os
+
+from nose.tools import *
+
+from peppy2.framework.document import DocumentRegistry
+from peppy2.utils.wx.stcbinary import BinarySTC
+
+
+class TestDocumentRegistry(object):
+    def setup(self):
+        self.registry = DocumentRegistry()
+
+    def test_shared(self):
+        path = "samples/sample.bin"
+        doc1 = self.registry.attach(path, "view1")
+        doc2 = self.registry.attach(os.path.abspath(path), "view2")
+        assert_true(doc1 is doc2)
+        assert_true(self.registry.find("samples/../samples/sample.bin") is doc1)
+        assert_false(self.registry.detach(doc1, "view1"))
+        assert_true(self.registry.detach(doc1, "view2"))
+        assert_true(self.registry.find(path) is None)
+
+    def test_rename(self):
+        doc = self.registry.attach("samples/sample.bin", "view1")
+        assert_true(self.registry.rename("samples/sample.bin", "samples/renamed.bin") is doc)
+        assert_equal(doc.path, "samples/renamed.bin")
+        assert_true(self.registry.find("samples/sample.bin") is None)
+        assert_true(self.registry.find("samples/renamed.bin") is doc)
+        assert_true(self.registry.rename("samples/sample.bin", "samples/other.bin") is None)
+        assert_true(self.registry.detach(doc, "view1"))
+        assert_true(self.registry.find("samples/renamed.bin") is None)
+
+
+class TestModifyCallbacks(object):
+    def test_fan_out(self):
+        stc = BinarySTC()
+        stc.SetBinary("0123456789")
+        changes = []
+        view1 = lambda *args: changes.append(("view1",) + args)
+        view2 = lambda *args: changes.append(("view2",) + args)
+        stc.addModifyCallback(view1)
+        stc.addModifyCallback(view2)
+        stc.SetBytes(2, 4, "abc")
+        assert_equal(changes, [("view1", 2, 2, 3), ("view2", 2, 2, 3)])
+        stc.removeModifyCallback(view1)
+        stc.SetBytes(0, 1, "z")
+        assert_equal(changes[-1], ("view2", 0, 1, 1))
+        assert_equal(stc.GetBytes(0, 11), "z1abc456789")
@@ -0,0 +1,43 @@
+from nose.tools import *
+
+import numpy as np
+
+from peppy2.utils.entropy import *
+
+
+class TestOverview(object):
+    def setup(self):
+        rnd = np.random.RandomState(4)
+        self.data = np.zeros(10000, dtype=np.uint8)
+        self.data[2000:5000] = rnd.randint(0, 256, 3000)
+        self.data[5000:8000] = np.fromstring("peppy2 hex editor\n" * 167, dtype=np.uint8)[:3000]
+
+    def test_histograms(self):
+        hist = block_histograms(self.data, 1000)
+        assert_equal(hist.shape, (10, 256))
+        for i in range(10):
+            expected = np.bincount(self.data[i * 1000:(i + 1) * 1000], minlength=256)
+            assert_true(np.all(hist[i] == expected))
+
+    def test_levels(self):
+        pyramid = OverviewPyramid(self.data, 1000)
+        assert_equal([h.shape[0] for h in pyramid.histograms], [10, 5, 3, 2, 1])
+        top = pyramid.get_level(4)
+        assert_almost_equal(top.entropy[0], entropy(np.bincount(self.data, minlength=256)[np.newaxis, :])[0])
+        level = pyramid.get_level(0)
+        assert_equal(level.entropy[0], 0.0)
+        assert_true(level.entropy[3] > 7.5)
+        assert_equal(level.zero[0], 1.0)
+        assert_equal(level.ascii[6], 1.0)
+        assert_equal(len(pyramid.get_level_for(4)), 5)
+
+    def test_update(self):
+        pyramid = OverviewPyramid(self.data, 1000)
+        self.data[9500:9600] = 0xff
+        self.data[100:200] = 0x41
+        pyramid.update(self.data, 9500, 9600)
+        pyramid.update(self.data, 100, 200)
+        expected = OverviewPyramid(self.data, 1000)
+        for h1, h2 in zip(pyramid.histograms, expected.histograms):
+            assert_true(np.all(h1 == h2))
+        assert_true(all(h.dtype == np.int64 for h in pyramid.histograms[1:]))
@@ -0,0 +1,140 @@
+import random
+
+from nose.tools import *
+
+import numpy as np
+
+from peppy2.utils.foldutil import *
+
+
+class FakeSTC(object):
+    """Line-by-line implementation of the Scintilla calls used by the
+    original wxPython demo folding code
+    """
+    def __init__(self, levels):
+        self.levels = list(levels)
+        self.visible = [True] * len(levels)
+        self.expanded = dict((i, True) for i, l in enumerate(levels) if l & FOLDLEVELHEADERFLAG)
+
+    def GetLevel(self, line):
+        if line < len(self.levels):
+            return self.levels[line]
+        return FOLDLEVELBASE
+
+    def GetLastChild(self, parent):
+        level = self.levels[parent] & FOLDLEVELNUMBERMASK
+        last = parent
+        while last < len(self.levels) - 1:
+            l = self.levels[last + 1]
+            if not (l & FOLDLEVELWHITEFLAG or level < (l & FOLDLEVELNUMBERMASK)):
+                break
+            last += 1
+        if last > parent:
+            if level > (self.GetLevel(last + 1) & FOLDLEVELNUMBERMASK):
+                if self.levels[last] & FOLDLEVELWHITEFLAG:
+                    last -= 1
+        return last
+
+    def Expand(self, line, doExpand, force=False, visLevels=0):
+        lastChild = self.GetLastChild(line)
+        line = line + 1
+        while line <= lastChild:
+            if force:
+                self.visible[line] = visLevels > 0
+            elif doExpand:
+                self.visible[line] = True
+            if self.levels[line] & FOLDLEVELHEADERFLAG:
+                if force:
+                    self.expanded[line] = visLevels > 1
+                    line = self.Expand(line, doExpand, force, visLevels - 1)
+                else:
+                    line = self.Expand(line, doExpand and self.expanded[line], force, visLevels - 1)
+            else:
+                line = line + 1
+        return line
+
+    def apply(self, runs, changes):
+        for first, last, show in runs:
+            for i in range(first, last + 1):
+                self.visible[i] = show
+        for line, state in changes:
+            self.expanded[line] = state
+
+
+def make_levels(count, seed):
+    rnd = random.Random(seed)
+    depth = 0
+    levels = []
+    for i in range(count):
+        if rnd.random() < 0.15:
+            levels.append(FOLDLEVELBASE + depth | FOLDLEVELWHITEFLAG)
+            continue
+        depth = max(0, min(depth + rnd.choice([-2, -1, 0, 0, 1]), 6))
+        levels.append(FOLDLEVELBASE + depth)
+    # Set header flags on lines followed by a deeper line
+    for i in range(count - 1):
+        if not levels[i] & FOLDLEVELWHITEFLAG:
+            nxt = [l for l in levels[i + 1:] if not l & FOLDLEVELWHITEFLAG]
+            if nxt and (nxt[0] & FOLDLEVELNUMBERMASK) > (levels[i] & FOLDLEVELNUMBERMASK):
+                levels[i] |= FOLDLEVELHEADERFLAG
+    return levels
+
+
+class TestFoldStructure(object):
+    def test_visibility_runs(self):
+        vis = np.array([-1, 1, 1, 0, 0, -1, 0, 1], dtype=np.int8)
+        assert_equal(visibility_runs(vis), [(1, 2, True), (3, 4, False), (6, 6, False), (7, 7, True)])
+
+    def test_last_children(self):
+        for seed in range(5):
+            levels = make_levels(300, seed)
+            stc = FakeSTC(levels)
+            fold = FoldStructure(levels)
+            for line in range(len(levels)):
+                assert_equal(fold.get_last_child(line), stc.GetLastChild(line))
+
+    def test_expand(self):
+        for seed in range(5):
+            levels = make_levels(300, seed)
+            fold = FoldStructure(levels)
+            for line in fold.headers[:20]:
+                line = int(line)
+                for args in [(True,), (False,), (True, True, 2), (False, True, 1)]:
+                    expected = FakeSTC(levels)
+                    expected.expanded[line + 1] = False
+                    stc = FakeSTC(levels)
+                    stc.expanded[line + 1] = False
+                    next_line = expected.Expand(line, *args)
+                    runs, changes, result = fold.expand(line, *args, is_expanded=stc.expanded.get)
+                    stc.apply(runs, changes)
+                    assert_equal(result, next_line)
+                    assert_equal(stc.visible, expected.visible)
+                    assert_equal(stc.expanded, expected.expanded)
+
+    def test_collapse_expand_all(self):
+        levels = make_levels(500, 10)
+        fold = FoldStructure(levels)
+        stc = FakeSTC(levels)
+        stc.apply(*fold.collapse_all())
+        for line in fold.get_top_level_headers():
+            assert_false(stc.expanded[line])
+            last = stc.GetLastChild(line)
+            assert_false(any(stc.visible[line + 1:last + 1]))
+        stc.apply(*fold.expand_all(stc.expanded.get))
+        assert_true(all(stc.visible))
+
+    def test_expand_partial(self):
+        # Expanding with only the levels of the fold gives the same results
+        levels = make_levels(400, 3)
+        fold = FoldStructure(levels)
+        stc = FakeSTC(levels)
+        for line in fold.headers[:40]:
+            line = int(line)
+            end = min(stc.GetLastChild(line) + 3, len(levels))
+            partial = FoldStructure(levels[line:end])
+            for args in [(True,), (False,), (True, True, 2), (False, True, 1)]:
+                runs, changes, result = fold.expand(line, *args, is_expanded=stc.expanded.get)
+                is_expanded = lambda child: stc.expanded.get(child + line)
+                runs2, changes2, result2 = partial.expand(0, *args, is_expanded=is_expanded)
+                assert_equal(offset_fold_changes(runs2, changes2, line), (runs, changes))
+                assert_equal(result2 + line, result)
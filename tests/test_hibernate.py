@@ -0,0 +1,36 @@
+from nose.tools import *
+
+from peppy2.framework.editor import FrameworkEditor
+
+
+class ClearingEditor(FrameworkEditor):
+    """Editor whose control reports a change when its data is cleared, like
+    the text editor's STC
+    """
+    def __init__(self, **traits):
+        FrameworkEditor.__init__(self, **traits)
+        self.data = "some text"
+
+    def get_memory_size(self):
+        return len(self.data)
+
+    def release_data(self):
+        self.data = ""
+        self.dirty = True
+
+    def reload_data(self):
+        self.data = "some text"
+        self.dirty = False
+
+
+class TestHibernate(object):
+    def test_not_dirty(self):
+        editor = ClearingEditor(path="/tmp/file.txt")
+        assert_true(editor.can_hibernate())
+        editor.hibernate()
+        assert_true(editor.hibernated)
+        assert_false(editor.dirty)
+        assert_false(editor.can_hibernate())
+        editor.restore()
+        assert_false(editor.hibernated)
+        assert_equal(editor.data, "some text")
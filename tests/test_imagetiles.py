@@ -0,0 +1,59 @@
+from nose.tools import *
+
+import numpy as np
+
+from peppy2.utils.imagetiles import *
+
+
+class TestLRUCache(object):
+    def test_evict(self):
+        cache = LRUCache(10)
+        cache.put("a", 1, 4)
+        cache.put("b", 2, 4)
+        assert_equal(cache.get("a"), 1)
+        cache.put("c", 3, 4)
+        assert_equal(cache.get("b"), None)
+        assert_equal(cache.get("a"), 1)
+        assert_equal(cache.size, 8)
+
+
+class TestTiledImage(object):
+    def setup(self):
+        rnd = np.random.RandomState(11)
+        self.rgb = rnd.randint(0, 256, (301, 517, 3)).astype(np.uint8)
+        self.source = ArraySource(self.rgb)
+
+    def test_downsample(self):
+        small = area_downsample(self.rgb)
+        assert_equal(small.shape, (151, 259, 3))
+        expected = (self.rgb[0:2, 0:2].astype(np.int32).sum(axis=(0, 1)) + 2) // 4
+        assert_true(np.all(small[0, 0] == expected))
+        assert_true(np.all(small[150, 258] == self.rgb[300, 516]))
+
+    def test_levels(self):
+        tiled = TiledImage(self.source, tile_size=64)
+        assert_equal(tiled.get_level_size(2), (130, 76))
+        level1 = area_downsample(self.rgb)
+        level2 = area_downsample(level1)
+        region = tiled.get_level_region(2, 10, 20, 100, 100)
+        assert_equal(region.shape, (56, 100, 3))
+        assert_true(np.all(region == level2[20:76, 10:110]))
+
+    def test_display(self):
+        tiled = TiledImage(self.source, tile_size=64)
+        tile = tiled.get_display_tile(2.0, 1, 2)
+        assert_true(np.all(tile[0:2, 0:2] == self.rgb[64, 32]))
+        assert_true(np.all(tile[::2, ::2] == self.rgb[64:96, 32:64]))
+        tile = tiled.get_display_tile(0.25, 2, 1)
+        assert_equal(tile.shape, (11, 1, 3))
+        level2 = area_downsample(area_downsample(self.rgb))
+        assert_true(np.all(tile[:, 0] == level2[64:75, 128]))
+        assert_equal(tiled.get_display_tile(0.25, 3, 0), None)
+        assert_equal(tiled.get_visible_tiles(1.0, 100, 0, 100, 50), [(1, 0), (2, 0), (3, 0)])
+
+    def test_alpha(self):
+        alpha = np.arange(301 * 517, dtype=np.uint32).reshape((301, 517)).astype(np.uint8)
+        source = ArraySource(self.rgb, alpha).crop(5, 6, 100, 50)
+        region = source.get_region(1, 2, 3, 4)
+        assert_equal(region.shape, (4, 3, 4))
+        assert_true(np.all(region[:,:,3] == alpha[8:12, 6:9]))
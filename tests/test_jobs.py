@@ -0,0 +1,46 @@
+import time
+import threading
+
+from nose.tools import *
+
+from peppy2.utils.jobs import *
+
+
+class BlockingJob(ThreadJob):
+    def __init__(self, event):
+        ThreadJob.__init__(self)
+        self.event = event
+
+    def _start(self, dispatcher):
+        self.event.wait(5)
+
+
+class QuickJob(ThreadJob):
+    queue_name = "quick"
+
+    def __init__(self):
+        ThreadJob.__init__(self)
+        self.done = threading.Event()
+
+    def _start(self, dispatcher):
+        self.done.set()
+
+
+class TestQueues(object):
+    def setup(self):
+        self.manager = JobManager(None)
+
+    def teardown(self):
+        self.manager.shutdown()
+
+    def test_separate_dispatchers(self):
+        release = threading.Event()
+        self.manager.add_job(BlockingJob(release))
+        quick = QuickJob()
+        self.manager.add_job(quick)
+        # The quick job runs while the long job is still blocking its queue
+        assert_true(quick.done.wait(5))
+        release.set()
+        assert_equal(sorted(d.queue_name for d in self.manager.dispatchers), ["default", "quick"])
+        self.manager.add_job(QuickJob())
+        assert_equal(len(self.manager.dispatchers), 2)
@@ -0,0 +1,43 @@
+from nose.tools import *
+
+from peppy2.utils.mru import *
+
+
+class TestMRUList(object):
+    def setup(self):
+        self.mru = MRUList(3)
+        for uri in ["a", "b", "c"]:
+            self.mru.add(uri)
+
+    def test_order(self):
+        assert_equal(list(self.mru), ["c", "b", "a"])
+        self.mru.add("a")
+        assert_equal(list(self.mru), ["a", "c", "b"])
+
+    def test_trim(self):
+        self.mru.add("d")
+        assert_equal(list(self.mru), ["d", "c", "b"])
+        assert_false("a" in self.mru)
+
+    def test_metadata(self):
+        self.mru.add("b", mime="text/plain")
+        self.mru.add("b", task_id="text")
+        assert_equal(self.mru.get("b"), {'mime': "text/plain", 'task_id': "text"})
+        assert_true(self.mru.update("c", view_position={'top': 3}))
+        assert_equal(list(self.mru), ["b", "c", "a"])
+        assert_false(self.mru.update("x", mime="text/plain"))
+        assert_equal(self.mru.get("x"), None)
+
+    def test_lines(self):
+        self.mru.add("b", mime="text/plain", size=10)
+        lines = self.mru.to_lines()
+        assert_equal(lines[1:], ["c", "a"])
+        copy = MRUList(3)
+        copy.from_lines(lines)
+        assert_equal(list(copy), ["b", "c", "a"])
+        assert_equal(copy.get("b"), {'mime': "text/plain", 'size': 10})
+        assert_equal(copy.get("a"), {})
+
+    def test_old_format(self):
+        self.mru.from_lines(["/tmp/x\n", "\n", "/tmp/y\n", "{bad json\n", "/tmp/x\n", "/tmp/z\n", "/tmp/w\n"])
+        assert_equal(list(self.mru), ["/tmp/x", "/tmp/y", "/tmp/z"])
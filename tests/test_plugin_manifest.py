@@ -0,0 +1,91 @@
+import os
+import tempfile
+import shutil
+
+from nose.tools import *
+
+from envisage.api import Plugin, contributes_to
+from traits.api import List
+
+from peppy2.framework.plugin_manifest import *
+
+
+class SamplePlugin(Plugin):
+    id = 'peppy2.tasks.sample'
+    name = 'Sample Plugin'
+
+    recognizer = List(["text"], contributes_to='peppy2.file_recognizer')
+
+    @contributes_to('peppy2.sample_tasks')
+    def get_tasks(self):
+        return ["task"]
+
+
+class StartingPlugin(Plugin):
+    id = 'peppy2.tasks.starting'
+
+    def start(self):
+        pass
+
+
+class EntryPoint(object):
+    def __init__(self, name, text):
+        self.name = name
+        self.text = text
+        self.dist = None
+
+    def __str__(self):
+        return self.text
+
+
+class TestPluginManifest(object):
+    def setup(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.egg_dir = os.path.join(self.tempdir, "eggs")
+        os.mkdir(self.egg_dir)
+        self.filename = os.path.join(self.tempdir, "config", "manifest.json")
+
+    def teardown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_key(self):
+        key = get_manifest_key([self.egg_dir], ['peppy2.tasks'])
+        assert_equal(key, get_manifest_key([self.egg_dir], ['peppy2.tasks']))
+        assert_not_equal(key, get_manifest_key([self.egg_dir], []))
+        with open(os.path.join(self.egg_dir, "new.egg"), "wb") as fh:
+            fh.write("egg")
+        assert_not_equal(key, get_manifest_key([self.egg_dir], ['peppy2.tasks']))
+
+    def test_included(self):
+        assert_true(is_included('peppy2.tasks.sample', ['peppy2.tasks']))
+        assert_false(is_included('other.sample', ['peppy2.tasks']))
+        assert_true(is_included('other.sample', []))
+
+    def test_plugin_info(self):
+        info = get_plugin_info(EntryPoint('sample', 'sample = test_plugin_manifest:SamplePlugin'), SamplePlugin)
+        assert_equal(info['id'], 'peppy2.tasks.sample')
+        assert_equal(info['plugin_name'], 'Sample Plugin')
+        assert_equal(info['contributes_to'], ['peppy2.file_recognizer', 'peppy2.sample_tasks'])
+        assert_false(info['eager'])
+        info = get_plugin_info(EntryPoint('starting', 'starting = test_plugin_manifest:StartingPlugin'), StartingPlugin)
+        assert_true(info['eager'])
+
+    def test_save_load(self):
+        info = get_plugin_info(EntryPoint('sample', 'sample = test_plugin_manifest:SamplePlugin'), SamplePlugin)
+        manifest = {'version': manifest_version, 'key': 'abc', 'locations': [], 'plugins': [info]}
+        save_manifest(self.filename, manifest)
+        assert_equal(load_manifest(self.filename, 'abc'), manifest)
+        assert_equal(load_manifest(self.filename, 'def'), None)
+        assert_equal(load_manifest(os.path.join(self.tempdir, "missing.json"), 'abc'), None)
+
+    def test_lazy_plugin(self):
+        info = get_plugin_info(EntryPoint('sample', 'sample = test_plugin_manifest:SamplePlugin'), SamplePlugin)
+        manifest = {'version': manifest_version, 'key': 'abc', 'locations': [], 'plugins': [info]}
+        plugin = create_plugins(manifest)[0]
+        assert_equal(plugin.id, 'peppy2.tasks.sample')
+        assert_equal(plugin.get_extensions('peppy2.other'), [])
+        assert_equal(plugin.plugin, None)
+        assert_equal(plugin.get_extensions('peppy2.file_recognizer'), ["text"])
+        assert_true(isinstance(plugin.plugin, SamplePlugin))
+        assert_equal(plugin.get_extensions('peppy2.sample_tasks'), ["task"])
+
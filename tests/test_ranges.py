@@ -0,0 +1,29 @@
+from nose.tools import *
+
+from peppy2.utils.ranges import add_range, shift_ranges, ChangeAccumulator
+
+
+class TestRanges(object):
+    def test_add(self):
+        ranges = add_range([], 10, 20)
+        ranges = add_range(ranges, 30, 40)
+        assert_equal(ranges, [(10, 20), (30, 40)])
+        assert_equal(add_range(ranges, 20, 30), [(10, 40)])
+        assert_equal(add_range(ranges, 0, 5), [(0, 5), (10, 20), (30, 40)])
+        assert_equal(add_range(ranges, 15, 35), [(10, 40)])
+
+    def test_shift(self):
+        ranges = [(0, 10), (20, 30), (40, 50)]
+        assert_equal(shift_ranges(ranges, 15, 15, 5), [(0, 10), (25, 35), (45, 55)])
+        assert_equal(shift_ranges(ranges, 25, 45, 0), [(0, 10), (20, 30)])
+
+    def test_accumulate(self):
+        changes = ChangeAccumulator()
+        changes.add(100, 2, 2, 1000)
+        changes.add(10, 1, 1, 1000)
+        assert_equal(changes.ranges, [(10, 11), (100, 102)])
+        assert_false(changes.length_changed)
+        changes.add(500, 0, 4, 1004)
+        changes.add(50, 10, 0, 994)
+        assert_equal(changes.ranges, [(10, 11), (50, 994)])
+        assert_true(changes.length_changed)
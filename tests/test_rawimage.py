@@ -0,0 +1,67 @@
+import os
+import tempfile
+import shutil
+
+from nose.tools import *
+
+import numpy as np
+
+from peppy2.utils.rawimage import *
+from peppy2.utils.imagetiles import TiledImage
+
+
+class TestRawImage(object):
+    def setup(self):
+        self.tempdir = tempfile.mkdtemp()
+        rnd = np.random.RandomState(3)
+        self.rgb = rnd.randint(0, 256, (37, 53, 3)).astype(np.uint8)
+
+    def teardown(self):
+        shutil.rmtree(self.tempdir)
+
+    def write(self, name, data):
+        path = os.path.join(self.tempdir, name)
+        with open(path, "wb") as fh:
+            fh.write(data)
+        return path
+
+    def test_header(self):
+        fmt = parse_pnm_header("P5\n# comment\n640 480\n65535\n\x00\x01")
+        assert_equal((fmt.width, fmt.height, fmt.pixel_format, fmt.offset, fmt.maxval), (640, 480, "gray16be", 27, 65535))
+        fmt = parse_pnm_header("P4 9 2\n\xff")
+        assert_equal((fmt.pixel_format, fmt.offset, fmt.stride), ("gray1", 7, 2))
+        assert_raises(RawImageError, parse_pnm_header, "P3\n1 1\n255\n")
+
+    def test_ppm(self):
+        path = self.write("test.ppm", "P6\n53 37\n255\n" + self.rgb.tostring())
+        source = open_pnm(path)
+        assert_equal((source.width, source.height, source.channels), (53, 37, 3))
+        assert_true(np.all(source.get_region(10, 5, 20, 7) == self.rgb[5:12, 10:30]))
+        assert_true(np.all(source.crop(10, 5, 20, 7).get_region(2, 3, 100, 100) == self.rgb[8:12, 12:30]))
+        tiled = TiledImage(source, tile_size=16)
+        assert_equal(tiled.get_display_tile(0.5, 0, 0).shape, (16, 16, 3))
+
+    def test_pbm(self):
+        bits = np.array([[1, 0, 1, 1, 0, 0, 0, 0, 1, 1], [0] * 10], dtype=np.uint8)
+        path = self.write("test.pbm", "P4\n10 2\n" + np.packbits(bits, axis=1).tostring())
+        source = open_pnm(path)
+        region = source.get_region(1, 0, 9, 2)
+        assert_true(np.all(region[:, :, 0] == (1 - bits[:, 1:]) * 255))
+
+    def test_raw(self):
+        # Rows padded to 64 bytes, starting after a 100 byte header
+        width = 20
+        data = np.zeros((10, 64), dtype=np.uint8)
+        pixels = np.arange(10 * width, dtype=np.uint16).reshape((10, width))
+        data[:, 0:width * 2] = pixels.astype("<u2").view(np.uint8).reshape((10, -1))
+        path = self.write("test.raw", "\xff" * 100 + data.tostring())
+        fmt = RawImageFormat(width, 10, "gray16le", 100, 64, maxval=255)
+        source = RawImageSource(path, fmt)
+        region = source.get_region(5, 2, 30, 3)
+        assert_equal(region.shape, (3, 15, 3))
+        assert_true(np.all(region[:, :, 1] == pixels[2:5, 5:20]))
+        assert_raises(RawImageError, RawImageSource, path, RawImageFormat(width, 20, "gray16le", 100, 64))
+
+    def test_guess(self):
+        fmt = RawImageFormat.guess(3 * 1000 * 1000, "rgb24")
+        assert_equal((fmt.width, fmt.height), (512, 1953))
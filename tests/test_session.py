@@ -0,0 +1,46 @@
+import os
+import tempfile
+import shutil
+
+from nose.tools import *
+
+from peppy2.utils.session import *
+
+
+class TestSession(object):
+    def setup(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, "session.json")
+        self.files = []
+        for name in ["a.txt", "b.txt"]:
+            filename = os.path.join(self.tempdir, name)
+            with open(filename, "w") as fh:
+                fh.write(name)
+            self.files.append(filename)
+
+    def teardown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_save(self):
+        windows = [{'active_task': "text", 'tasks': [{'id': "text", 'active': 1, 'editors': [{'path': self.files[0], 'view': {'top': 3, 'pos': 40}}]}]}]
+        save_session(self.path, windows)
+        assert_equal(load_session(self.path), windows)
+
+    def test_bad_file(self):
+        assert_equal(load_session(self.path), [])
+        with open(self.path, "w") as fh:
+            fh.write("{not json")
+        assert_equal(load_session(self.path), [])
+        with open(self.path, "w") as fh:
+            fh.write('{"version": 999, "windows": [{}]}')
+        assert_equal(load_session(self.path), [])
+
+    def test_existing_editors(self):
+        missing = os.path.join(self.tempdir, "missing.txt")
+        task = {'id': "text", 'active': 2, 'editors': [{'path': self.files[0]}, {'path': missing}, {'path': self.files[1]}]}
+        editors, active = get_existing_editors(task)
+        assert_equal([e['path'] for e in editors], self.files)
+        assert_equal(active, 1)
+        task['active'] = 1
+        editors, active = get_existing_editors(task)
+        assert_equal(active, None)
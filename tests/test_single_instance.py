@@ -0,0 +1,71 @@
+import os
+import time
+import tempfile
+import shutil
+import threading
+
+from nose.tools import *
+
+from peppy2.utils.single_instance import *
+
+
+class TestInstanceServer(object):
+    def setup(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, "instance.sock")
+        self.received = []
+        self.event = threading.Event()
+        self.server = InstanceServer(self.path, self.callback)
+
+    def teardown(self):
+        self.server.shutdown()
+        shutil.rmtree(self.tempdir)
+
+    def callback(self, files, cwd):
+        self.received.append((files, cwd))
+        self.event.set()
+
+    def test_no_server(self):
+        assert_false(send_files(self.path, ["a"], "/tmp"))
+        assert_false(is_running(self.path))
+
+    def test_send(self):
+        assert_true(self.server.start())
+        assert_true(is_running(self.path))
+        assert_true(send_files(self.path, ["/tmp/a", "b"], "/home"))
+        self.event.wait(5.0)
+        assert_equal(self.received, [([u"/tmp/a", u"b"], u"/home")])
+
+    def test_second_server(self):
+        assert_true(self.server.start())
+        other = InstanceServer(self.path, self.callback)
+        assert_false(other.start())
+
+    def test_stale_socket(self):
+        with open(self.path, "wb") as fh:
+            fh.write("")
+        assert_true(self.server.start())
+        assert_true(is_running(self.path))
+
+    def test_shutdown(self):
+        assert_true(self.server.start())
+        self.server.shutdown()
+        assert_false(os.path.exists(self.path))
+        assert_false(send_files(self.path, ["a"], "/tmp"))
+
+    def test_remote_args(self):
+        assert_equal(get_remote_args(["a", "b"]), ["a", "b"])
+        assert_equal(get_remote_args([]), [])
+        assert_equal(get_remote_args(["a", "--no-eggs"]), None)
+
+    def test_long_socket_path(self):
+        import getpass
+        import peppy2.utils.single_instance as single_instance
+        saved = single_instance.max_socket_path
+        single_instance.max_socket_path = 0
+        try:
+            path = get_socket_path("Peppy2")
+        finally:
+            single_instance.max_socket_path = saved
+        assert_equal(os.path.dirname(path), tempfile.gettempdir())
+        assert_equal(os.path.basename(path), "peppy2-%s.sock" % getpass.getuser())
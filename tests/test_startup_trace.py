@@ -0,0 +1,53 @@
+import sys
+import json
+import time
+
+from nose.tools import *
+
+from peppy2.utils.startup_trace import *
+
+
+class TestStartupTrace(object):
+    def teardown(self):
+        stop_trace()
+
+    def test_phases(self):
+        trace = StartupTrace(False)
+        with trace.phase("first"):
+            time.sleep(0.01)
+        trace.mark("done")
+        trace.add_plugin("plugin.id", 0.5)
+        report = json.loads(trace.to_json())
+        assert_equal([p['name'] for p in report['phases']], ["first"])
+        assert_true(report['phases'][0]['duration'] >= 0.01)
+        assert_equal(report['marks'][0]['name'], "done")
+        assert_equal(report['plugins'], [{'id': "plugin.id", 'duration': 0.5}])
+
+    def test_imports(self):
+        sys.modules.pop('peppy2.utils.sortutil', None)
+        trace = start_trace()
+        import peppy2.utils.sortutil
+        stop_trace()
+        modules = [i['module'] for i in trace.imports.get_report()]
+        assert_true('peppy2.utils.sortutil' in modules)
+        assert_false(__import__ is trace.imports.timed_import)
+        for name in modules:
+            assert_true(trace.imports.times[name][0] >= trace.imports.times[name][1])
+
+    def test_inactive(self):
+        assert_equal(get_trace(), None)
+        with traced("nothing"):
+            mark("nothing")
+        trace = start_trace(False)
+        assert_true(start_trace() is trace)
+        with traced("something"):
+            pass
+        assert_equal(trace.phases[0]['name'], "something")
+
+    def test_percentile(self):
+        values = [5, 1, 4, 2, 3]
+        assert_equal(get_percentile(values, 0), 1)
+        assert_equal(get_percentile(values, 50), 3)
+        assert_equal(get_percentile(values, 100), 5)
+        assert_almost_equal(get_percentile(values, 90), 4.6)
+        assert_equal(get_percentile([], 50), None)